@@ -0,0 +1,545 @@
+import heapq
+import time
+from typing import Dict, List, Optional
+
+import simulation
+from simulation import (DIRECTIONS, NO_CELL, NO_DOT,
+                        OPEN_DIRECTIONS, UNREACHABLE, Direction,
+                        JunctionField, Maze, Simulation)
+
+
+NEIGHBOR_COUNT = 8  # Сколько ближайших точек помнить для каждой точки
+NEIGHBOR_SEARCH = 400  # Сколько клеток просматривать в их поиске
+DISTANCE_SEARCH = 800  # Предел поиска расстояния между двумя точками
+IMPROVE_TIME = 0.02  # Предел времени на 2-opt и Or-opt, секунд
+OR_OPT_LENGTH = 3  # Самый длинный переносимый кусок маршрута
+# Призрак ближе этого влияет на путь; None - радиус преследования
+# simulation.CHASE_DISTANCE в момент хода (его меняет и runner --set)
+DANGER_RADIUS = None
+GHOST_COST = 4  # Цена клетки рядом с призраком за каждый шаг близости
+LOOKAHEAD = 6  # Сколько следующих целей сравнивать при опасности
+
+
+class RoutePlan:
+    # Маршрут по точкам: узел 0 - клетка игрока, дальше точки и большие
+    # точки, последним - выход. Полной таблицы расстояний нет: заранее
+    # считаются только ближайшие соседи каждой точки (поиск в ширину с
+    # ограничением), остальные пары ищутся по требованию и запоминаются.
+    # 2-opt и Or-opt перебирают ходы только среди соседей, а пары, до
+    # которых поиск не дотянулся, пропускают. Так план строится быстро и
+    # на картах с тысячами точек.
+
+    def __init__(self, maze: Maze, start: int, targets: List[int],
+                 exit_cell: Optional[int]):
+        self.maze = maze
+        self.cells = [start] + targets
+        self.exit_node = None
+        if exit_cell is not None:
+            self.exit_node = len(self.cells)
+            self.cells.append(exit_cell)
+        self.node_at = {}
+        i = 0
+        while i < len(self.cells):
+            self.node_at[self.cells[i]] = i
+            i += 1
+        self.known = []
+        i = 0
+        while i < len(self.cells):
+            self.known.append({})
+            i += 1
+        self.stamp = [0] * (maze.width * maze.height)
+        self.generation = 0
+        self.tour = []
+
+    def _learn(self, a: int, b: int, distance: int):
+        self.known[a][b] = distance
+        self.known[b][a] = distance
+
+    def distance(self, a: int, b: int) -> Optional[int]:
+        # Неизвестное расстояние ищется поиском от a и запоминается; для
+        # далеких пар None - такой ход просто не рассматривается
+        distance = self.known[a].get(b)
+        if distance is None:
+            found = self._search(a, DISTANCE_SEARCH, 1,
+                                 lambda node: node == b)
+            if not found:
+                return None
+            distance = found[0][1]
+            self._learn(a, b, distance)
+        return distance
+
+    def _search(self, source: int, limit: int, wanted: int,
+                accept) -> List[tuple]:
+        # Поиск в ширину от узла: первые wanted узлов, для которых
+        # accept(node) истинно, не дальше limit просмотренных клеток.
+        # Идет по клеткам, а не по графу развилок: точки лежат почти в
+        # каждой клетке коридоров, так что граф поиск не сокращает
+        self.generation += 1
+        generation = self.generation
+        stamp = self.stamp
+        neighbors = self.maze.neighbors
+        node_at = self.node_at
+        start = self.cells[source]
+        stamp[start] = generation
+        queue = [start]
+        depth = [0]
+        found = []
+        head = 0
+        while head < len(queue) and head < limit:
+            cell = queue[head]
+            distance = depth[head]
+            head += 1
+            node = node_at.get(cell)
+            if node is not None and node != source and accept(node):
+                found.append((node, distance))
+                if len(found) >= wanted:
+                    break
+            base = cell * 4
+            d = 0
+            while d < 4:
+                neighbor = neighbors[base + d]
+                d += 1
+                if neighbor != NO_CELL and stamp[neighbor] != generation:
+                    stamp[neighbor] = generation
+                    queue.append(neighbor)
+                    depth.append(distance + 1)
+        return found
+
+    def build(self):
+        count = len(self.cells)
+        every = (lambda node: True)
+        i = 0
+        while i < count:
+            found = self._search(i, NEIGHBOR_SEARCH, NEIGHBOR_COUNT, every)
+            j = 0
+            while j < len(found):
+                self._learn(i, found[j][0], found[j][1])
+                j += 1
+            i += 1
+
+        # Ближайший сосед: от игрока к ближайшей еще не взятой точке
+        used = [False] * count
+        used[0] = True
+        if self.exit_node is not None:
+            used[self.exit_node] = True
+        tour = [0]
+        current = 0
+        remaining = count - 1 - (self.exit_node is not None)
+
+        def free(node):
+            return not used[node]
+
+        while remaining > 0:
+            found = self._search(current, len(self.stamp), 1, free)
+            if not found:
+                break  # Остальные точки недостижимы
+            node, distance = found[0]
+            self._learn(current, node, distance)
+            used[node] = True
+            tour.append(node)
+            current = node
+            remaining -= 1
+
+        if self.exit_node is not None:
+            exit_node = self.exit_node
+            found = self._search(current, len(self.stamp), 1,
+                                 lambda node: node == exit_node)
+            if found:
+                self._learn(current, exit_node, found[0][1])
+                tour.append(exit_node)
+        self.tour = tour
+        self.improve(time.perf_counter() + IMPROVE_TIME)
+
+    def length(self) -> int:
+        total = 0
+        i = 0
+        while i < len(self.tour) - 1:
+            total += self.known[self.tour[i]][self.tour[i + 1]]
+            i += 1
+        return total
+
+    def improve(self, deadline: float):
+        # Чередуем проходы 2-opt и Or-opt, пока они что-то улучшают
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = self._two_opt(deadline)
+            improved = self._or_opt(deadline) or improved
+
+    def _two_opt(self, deadline: float) -> bool:
+        # Разворот куска tour[i+1..j]: ребра (a,b),(c,d) -> (a,c),(b,d).
+        # Первый узел (игрок) и выход в конце остаются на местах
+        tour = self.tour
+        known = self.known
+        last = len(tour) - 1 if self.exit_node is not None else len(tour)
+        position = {}
+        k = 0
+        while k < len(tour):
+            position[tour[k]] = k
+            k += 1
+
+        improved = False
+        i = 0
+        while i < len(tour) - 2:
+            if time.perf_counter() > deadline:
+                return improved
+            a = tour[i]
+            b = tour[i + 1]
+            ab = known[a][b]
+            candidates = list(known[a].items())
+            k = 0
+            while k < len(candidates):
+                c, ac = candidates[k]
+                k += 1
+                j = position.get(c)
+                if j is None or j <= i + 1 or j >= last or ac >= ab:
+                    continue
+                if j + 1 < len(tour):
+                    d = tour[j + 1]
+                    bd = self.distance(b, d)
+                    if bd is None:
+                        continue
+                    gain = ab + known[c][d] - ac - bd
+                else:
+                    # Свободный конец маршрута без выхода
+                    gain = ab - ac
+                if gain > 0:
+                    tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+                    m = i + 1
+                    while m <= j:
+                        position[tour[m]] = m
+                        m += 1
+                    improved = True
+                    b = tour[i + 1]
+                    ab = known[a][b]
+            i += 1
+        return improved
+
+    def _or_opt(self, deadline: float) -> bool:
+        # Перенос куска из 1..OR_OPT_LENGTH узлов между двумя соседями
+        # одного из его концов
+        tour = self.tour
+        known = self.known
+        improved = False
+        i = 1
+        while i < len(tour) - 1:
+            if time.perf_counter() > deadline:
+                return improved
+            moved = False
+            length = 1
+            while length <= OR_OPT_LENGTH and not moved:
+                end = i + length - 1
+                if end >= len(tour) - 1 or tour[end] == self.exit_node:
+                    break
+                moved = self._move_segment(tour, known, i, end)
+                length += 1
+            improved = improved or moved
+            i += 1
+        return improved
+
+    def _move_segment(self, tour: list, known: list, i: int,
+                      end: int) -> bool:
+        before = tour[i - 1]
+        after = tour[end + 1]
+        first = tour[i]
+        last = tour[end]
+        # Выигрыш от удаления куска не больше, чем если бы before и after
+        # стояли рядом; точное расстояние ищем, только когда оно нужно
+        removed = known[before][first] + known[last][after] - 1
+        closed = None
+
+        # Вставка между p и q = tour[j], tour[j+1], где p - сосед first
+        candidates = list(known[first].items())
+        k = 0
+        while k < len(candidates):
+            p, p_first = candidates[k]
+            k += 1
+            if p == before or p_first >= removed:
+                continue
+            if closed is None:
+                closed = self.distance(before, after)
+                if closed is None:
+                    return False
+                removed += 1 - closed
+                if p_first >= removed:
+                    continue
+            j = tour.index(p)
+            if i - 1 <= j <= end or j + 1 >= len(tour):
+                continue
+            q = tour[j + 1]
+            last_q = self.distance(last, q)
+            if last_q is None:
+                continue
+            added = p_first + last_q - known[p][q]
+            if added < removed:
+                segment = tour[i:end + 1]
+                del tour[i:end + 1]
+                j = tour.index(p)
+                tour[j + 1:j + 1] = segment
+                return True
+        return False
+
+
+class Autopilot:
+    # Бот-игрок для дымовых тестов и демо-режима. Вызывается как
+    # политика runner: autopilot(sim, rng) -> Direction или None.
+    # Маршрут строится один раз на партию; рядом с призраками путь
+    # до цели ищется с доплатой за близость к ним, а цель выбирается
+    # из нескольких следующих по маршруту
+
+    def __init__(self):
+        self.sim = None
+        self.plan = None
+        self.route = []
+        self.route_index = 0
+        self.exit_cell = None
+        self.field = None  # Расстояния до текущей цели по графу развилок
+        self.plan_seconds = 0.0
+
+    def __call__(self, sim: Simulation, rng=None) -> Optional[Direction]:
+        if sim.player is None:
+            return None
+        if sim is not self.sim:
+            self.replan(sim)
+        if sim.move_timer > 0:
+            return None
+
+        maze = sim.maze
+        start = maze.index(sim.player.x, sim.player.y)
+        self._skip_reached(sim, start)
+        if self.route_index >= len(self.route):
+            return None
+
+        ghosts = self._nearby_ghosts(sim, start)
+        if not ghosts:
+            step = _first_step(self.field, start,
+                               self.route[self.route_index])
+        else:
+            step = self._evade(sim, start, ghosts)
+        if step is None:
+            return None
+        return DIRECTIONS[step]
+
+    def replan(self, sim: Simulation):
+        started = time.perf_counter()
+        self.sim = sim
+        maze = sim.maze
+        store = sim.collectibles
+        targets = []
+        y = 0
+        while y < store.height and y < maze.height:
+            x = 0
+            while x < store.width and x < maze.width:
+                if store.get(x, y) != NO_DOT and maze.walkable[
+                        maze.index(x, y)]:
+                    targets.append(maze.index(x, y))
+                x += 1
+            y += 1
+        start = maze.index(sim.player.x, sim.player.y)
+        self.field = JunctionField(maze)
+        self.exit_cell = _nearest_exit(self.field, sim.exits, start)
+        self.plan = RoutePlan(maze, start, targets, self.exit_cell)
+        self.plan.build()
+        self.route = []
+        i = 1
+        while i < len(self.plan.tour):
+            self.route.append(self.plan.cells[self.plan.tour[i]])
+            i += 1
+        self.route_index = 0
+        self.plan_seconds = time.perf_counter() - started
+
+    def _skip_reached(self, sim: Simulation, start: int):
+        # Точки, собранные по пути к другим целям, из маршрута выпадают
+        maze = sim.maze
+        store = sim.collectibles
+        route = self.route
+        while self.route_index < len(route):
+            cell = route[self.route_index]
+            x = cell % maze.width
+            y = cell // maze.width
+            if cell == start or (store.get(x, y) == NO_DOT and
+                                 (x, y) not in sim.exits):
+                self.route_index += 1
+            else:
+                break
+
+    def _nearby_ghosts(self, sim: Simulation, start: int) -> List[int]:
+        maze = sim.maze
+        radius = _danger_radius()
+        cells = []
+        i = 0
+        while i < len(sim.enemies):
+            enemy = sim.enemies[i]
+            i += 1
+            if (abs(enemy.x - sim.player.x) + abs(enemy.y - sim.player.y)
+                    <= radius):
+                cells.append(maze.index(enemy.x, enemy.y))
+        return cells
+
+    def _evade(self, sim: Simulation, start: int,
+               ghosts: List[int]) -> Optional[int]:
+        # Цена клеток вокруг призраков и поиск пути к лучшей из ближайших
+        # целей; выбранная цель переставляется в начало оставшегося
+        # маршрута (пошаговая перестройка плана)
+        maze = sim.maze
+        penalty = _ghost_penalty(maze, ghosts)
+        best = None
+        best_cost = None
+        best_index = None
+        i = self.route_index
+        while i < len(self.route) and i < self.route_index + LOOKAHEAD:
+            if i > self.route_index and self.route[i] == self.exit_cell:
+                break  # Выход остается последним, пока есть точки
+            found = _cheapest_step(maze, start, self.route[i], penalty,
+                                   ghosts)
+            if found is not None and (best_cost is None or
+                                      found[1] < best_cost):
+                best = found[0]
+                best_cost = found[1]
+                best_index = i
+            i += 1
+        if best_index is not None and best_index != self.route_index:
+            cell = self.route.pop(best_index)
+            self.route.insert(self.route_index, cell)
+        if best is not None:
+            return best
+        return _safest_step(maze, start, penalty, ghosts)
+
+
+def _nearest_exit(field: JunctionField, exits: List[tuple],
+                  start: int) -> Optional[int]:
+    # Один поиск по графу развилок от игрока вместо обхода всех клеток
+    # от каждого выхода
+    maze = field.maze
+    field.update(start % maze.width, start // maze.width)
+    best = None
+    best_distance = None
+    i = 0
+    while i < len(exits):
+        x, y = exits[i]
+        i += 1
+        if not maze.walkable[maze.index(x, y)]:
+            continue
+        distance = field.cell_distance(maze.index(x, y))
+        if distance != UNREACHABLE and (best_distance is None or
+                                        distance < best_distance):
+            best = maze.index(x, y)
+            best_distance = distance
+    return best
+
+
+def _distances_from(maze: Maze, source: int,
+                    radius: Optional[int] = None) -> Dict[int, int]:
+    neighbors = maze.neighbors
+    distances = {source: 0}
+    queue = [source]
+    head = 0
+    while head < len(queue):
+        cell = queue[head]
+        head += 1
+        distance = distances[cell] + 1
+        if radius is not None and distance > radius:
+            continue
+        base = cell * 4
+        d = 0
+        while d < 4:
+            neighbor = neighbors[base + d]
+            d += 1
+            if neighbor != NO_CELL and neighbor not in distances:
+                distances[neighbor] = distance
+                queue.append(neighbor)
+    return distances
+
+
+def _first_step(field: JunctionField, start: int,
+                goal: int) -> Optional[int]:
+    # Первое направление к цели: соседняя клетка, ближайшая к ней по
+    # графу развилок (поиск от цели идет лениво и запоминается для нее).
+    # При равенстве - первое по порядку, как в поиске в ширину от игрока
+    if start == goal:
+        return None
+    maze = field.maze
+    field.update(goal % maze.width, goal // maze.width)
+    options = OPEN_DIRECTIONS[maze.open_dirs[start]]
+    best = None
+    best_distance = None
+    i = 0
+    while i < len(options):
+        distance = field.cell_distance(
+            maze.neighbors[start * 4 + options[i]])
+        if distance != UNREACHABLE and (best_distance is None or
+                                        distance < best_distance):
+            best = options[i]
+            best_distance = distance
+        i += 1
+    return best
+
+
+def _danger_radius() -> int:
+    if DANGER_RADIUS is None:
+        return simulation.CHASE_DISTANCE
+    return DANGER_RADIUS
+
+
+def _ghost_penalty(maze: Maze, ghosts: List[int]) -> Dict[int, int]:
+    radius = _danger_radius()
+    penalty = {}
+    i = 0
+    while i < len(ghosts):
+        distances = _distances_from(maze, ghosts[i], radius)
+        cells = list(distances)
+        j = 0
+        while j < len(cells):
+            cost = GHOST_COST * (radius + 1 - distances[cells[j]])
+            penalty[cells[j]] = penalty.get(cells[j], 0) + cost
+            j += 1
+        i += 1
+    return penalty
+
+
+def _cheapest_step(maze: Maze, start: int, goal: int,
+                   penalty: Dict[int, int],
+                   ghosts: List[int]) -> Optional[tuple]:
+    # Дейкстра с ценой клетки 1 + штраф за призраков; (направление, цена).
+    # В клетку призрака не заходим: столкновение при ходе игрока - проигрыш.
+    # Штраф у каждой клетки свой, поэтому поиск идет по клеткам; он
+    # нужен только рядом с призраками
+    neighbors = maze.neighbors
+    best = {start: 0}
+    first = {start: -1}
+    heap = [(0, start)]
+    while heap:
+        cost, cell = heapq.heappop(heap)
+        if cell == goal:
+            return first[cell], cost
+        if cost > best[cell]:
+            continue
+        base = cell * 4
+        d = 0
+        while d < 4:
+            neighbor = neighbors[base + d]
+            if neighbor != NO_CELL and neighbor not in ghosts:
+                new_cost = cost + 1 + penalty.get(neighbor, 0)
+                if neighbor not in best or new_cost < best[neighbor]:
+                    best[neighbor] = new_cost
+                    first[neighbor] = d if cell == start else first[cell]
+                    heapq.heappush(heap, (new_cost, neighbor))
+            d += 1
+    return None
+
+
+def _safest_step(maze: Maze, start: int, penalty: Dict[int, int],
+                 ghosts: List[int]) -> Optional[int]:
+    # Все цели за призраками: уходим в свободную соседнюю клетку с
+    # наименьшим штрафом. Стоять на месте игрок не умеет - без нового
+    # направления он продолжит идти в прежнем
+    best = None
+    best_penalty = None
+    d = 0
+    while d < 4:
+        neighbor = maze.neighbors[start * 4 + d]
+        if (neighbor != NO_CELL and neighbor not in ghosts and
+                (best is None or penalty.get(neighbor, 0) < best_penalty)):
+            best = d
+            best_penalty = penalty.get(neighbor, 0)
+        d += 1
+    return best
@@ -0,0 +1,403 @@
+from typing import List, Optional
+
+import numpy as np
+
+# Настройки (MOVE_DELAY, ENEMY_MOVE_PERIOD, CHASE_DISTANCE) читаются из
+# модуля в момент использования: runner --set меняет их после импорта
+import simulation
+from simulation import (BIG_DOT_CELL, BIG_DOT_SCORE, CORRIDOR_EXITS,
+                        DOT_CELL, DOT_SCORE, FIELD_CACHE_CELLS, NO_NODE,
+                        UNREACHABLE,
+                        DIRECTION_DX, DIRECTION_DY, DIRECTION_INDEX,
+                        Direction, DistanceField, Simulation, TileType)
+
+
+# Направления в том же порядке, в котором их перебирает Enemy
+DX = np.array(DIRECTION_DX, dtype=np.int32)
+DY = np.array(DIRECTION_DY, dtype=np.int32)
+DIRECTION_BITS = np.array([1, 2, 4, 8], dtype=np.uint8)
+# Направление дальше по коридору: (маска клетки, направление входа)
+FORWARD = np.array(CORRIDOR_EXITS, dtype=np.int8).reshape(16, 4)
+NO_DIRECTION = -1
+
+# Константы splitmix64 для счетчикового генератора случайных чисел
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_TICK_KEY = 0xD1B54A32D192ED03
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_ENEMY_KEY = np.uint64(0xABC98388FB8FAC03)
+
+
+def direction_index(direction: Optional[Direction]) -> int:
+    if direction is None:
+        return NO_DIRECTION
+    return DIRECTION_INDEX[direction]
+
+
+def _splitmix64(z: np.ndarray) -> np.ndarray:
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+class BatchSimulation:
+    # N независимых партий на одной карте, все состояние - массивы NumPy
+    # с ведущей размерностью партии. Правила повторяют Simulation и Enemy.
+    #
+    # Случайность: у каждой партии свой поток, заданный ее seed. Число для
+    # (партия, тик, призрак, номер броска) вычисляется хешем splitmix64,
+    # поэтому результат партии не зависит от размера пачки и соседей.
+
+    def __init__(self, n: int, level: Optional[List[str]] = None,
+                 seeds=None):
+        template = Simulation(level)
+        self.n = n
+        self.map_width = template.map_width
+        self.map_height = template.map_height
+        self.tick_count = 0
+
+        if seeds is None:
+            seeds = np.arange(n)
+        self.seeds = np.asarray(seeds, dtype=np.uint64).reshape(n)
+        self._seed_keys = _splitmix64(self.seeds * _GOLDEN)
+
+        # Статическая карта: стены и выходы одинаковы во всех партиях,
+        # поэтому пачка - это представление без копирования
+        rows = len(template.game_map)
+        cols = 0
+        y = 0
+        while y < rows:
+            cols = max(cols, len(template.game_map[y]))
+            y += 1
+        # Короткие строки и все за границами карты считаем стеной
+        walls = np.ones((rows, cols), dtype=bool)
+        exits = np.zeros((rows, cols), dtype=bool)
+        dots = np.zeros((rows, cols), dtype=bool)
+        big_dots = np.zeros((rows, cols), dtype=bool)
+        y = 0
+        while y < rows:
+            row = template.game_map[y]
+            walls[y, :len(row)] = (np.array(row) == TileType.WALL.value)
+            y += 1
+        walls[self.map_height:, :] = True
+        walls[:, self.map_width:] = True
+        self._set_cells(exits, template.exits)
+        self._set_cells(dots, template.collectibles.positions(DOT_CELL))
+        self._set_cells(big_dots,
+                        template.collectibles.positions(BIG_DOT_CELL))
+
+        self.walls = np.broadcast_to(walls, (n, rows, cols))
+        self.exits = exits
+        self.dots = np.repeat(dots[None], n, axis=0)
+        self.big_dots = np.repeat(big_dots[None], n, axis=0)
+        self.dots_left = np.full(n, template.dots_left, dtype=np.int32)
+
+        # Игрок
+        self.player_x = np.full(n, template.player.x, dtype=np.int32)
+        self.player_y = np.full(n, template.player.y, dtype=np.int32)
+        self.player_direction = np.full(
+            n, direction_index(template.player.direction), dtype=np.int8)
+        self.move_timer = np.zeros(n, dtype=np.int32)
+        self.pending_direction = np.full(n, NO_DIRECTION, dtype=np.int8)
+        self.last_direction = np.full(n, NO_DIRECTION, dtype=np.int8)
+
+        # Счет и исход
+        self.score = np.zeros(n, dtype=np.int32)
+        self.moves_count = np.zeros(n, dtype=np.int32)
+        self.game_won = np.zeros(n, dtype=bool)
+        self.game_lost = np.zeros(n, dtype=bool)
+        self.screen_flash = np.zeros(n, dtype=np.int32)
+        self.victory_animation = np.zeros(n, dtype=np.int32)
+
+        # Призраки: массивы формы (N, число призраков)
+        count = len(template.enemies)
+        ex = np.zeros(count, dtype=np.int32)
+        ey = np.zeros(count, dtype=np.int32)
+        colors = np.zeros(count, dtype=np.int8)
+        i = 0
+        while i < count:
+            enemy = template.enemies[i]
+            ex[i] = enemy.x
+            ey[i] = enemy.y
+            colors[i] = enemy.color
+            i += 1
+        self.enemy_x = np.repeat(ex[None], n, axis=0)
+        self.enemy_y = np.repeat(ey[None], n, axis=0)
+        self.enemy_color = colors
+        self.enemy_direction = np.full(
+            (n, count), direction_index(Direction.RIGHT), dtype=np.int8)
+        self.enemy_timer = np.zeros((n, count), dtype=np.int32)
+        self.enemy_chase_mode = np.zeros((n, count), dtype=bool)
+        self.enemy_stuck_timer = np.zeros((n, count), dtype=np.int32)
+
+        # Маски открытых направлений из скомпилированной карты
+        self.open_dirs = np.frombuffer(
+            template.maze.open_dirs, dtype=np.uint8).reshape(
+                self.map_height, self.map_width).copy()
+        # Клетки коридоров графа развилок: там призраки не решают
+        self.corridor = (np.frombuffer(
+            template.maze.junctions.edge, dtype=np.int32).reshape(
+                self.map_height, self.map_width) != NO_NODE)
+
+        self._batch_index = np.arange(n)
+        self._enemy_index = np.arange(count, dtype=np.uint64)
+        self._index_cells(template)
+
+    def _index_cells(self, template: Simulation):
+        # Номера проходимых клеток: строки расстояний хранятся только по
+        # ним. Строка - поле BFS от клетки игрока; строится, когда в
+        # партии с игроком в этой клетке кто-то преследует, и
+        # запоминается (не больше FIELD_CACHE_CELLS клеток на все строки)
+        maze = template.maze
+        walkable = np.frombuffer(maze.walkable, dtype=np.uint8).reshape(
+            maze.height, maze.width).astype(bool)
+        cells_y, cells_x = np.nonzero(walkable)
+        self.cell_index = np.full(walkable.shape, -1, dtype=np.int32)
+        self.cell_index[cells_y, cells_x] = np.arange(cells_y.size)
+        self._cells_x = cells_x
+        self._cells_y = cells_y
+        self._flat_cells = cells_y * maze.width + cells_x
+        self._field = DistanceField(maze)
+        self._distance_rows = {}
+
+    def _distance_row(self, cell: int) -> np.ndarray:
+        row = self._distance_rows.get(cell)
+        if row is not None:
+            return row
+        field = self._field
+        field.update(int(self._cells_x[cell]), int(self._cells_y[cell]))
+        field.cache.clear()  # Строки хранятся здесь, списки не нужны
+        row = np.asarray(field.distances, dtype=np.int32)[self._flat_cells]
+        if len(self._distance_rows) * row.size >= FIELD_CACHE_CELLS:
+            # Самая старая строка (словарь хранит порядок вставки)
+            del self._distance_rows[next(iter(self._distance_rows))]
+        self._distance_rows[cell] = row
+        return row
+
+    def _distances(self, player_cells: np.ndarray) -> np.ndarray:
+        # Строки расстояний для набора партий: (партии, клетки)
+        cells = np.unique(player_cells)
+        rows = []
+        i = 0
+        while i < cells.size:
+            rows.append(self._distance_row(int(cells[i])))
+            i += 1
+        return np.stack(rows)[np.searchsorted(cells, player_cells)]
+
+    @staticmethod
+    def _set_cells(mask: np.ndarray, cells: list):
+        i = 0
+        while i < len(cells):
+            x, y = cells[i]
+            mask[y, x] = True
+            i += 1
+
+    @property
+    def done(self) -> np.ndarray:
+        return self.game_won | self.game_lost
+
+    def step(self, actions=None) -> dict:
+        self.apply_input(actions)
+        self.update_enemies()
+        self.update_timers()
+        return self.get_state()
+
+    def get_state(self) -> dict:
+        return {
+            'tick': self.tick_count,
+            'score': self.score,
+            'moves_count': self.moves_count,
+            'dots_left': self.dots_left,
+            'player_x': self.player_x,
+            'player_y': self.player_y,
+            'game_won': self.game_won,
+            'game_lost': self.game_lost,
+            'done': self.done,
+        }
+
+    def random(self, draw: int) -> np.ndarray:
+        # Равномерные числа [0, 1) формы (N, число призраков) для текущего
+        # тика; draw различает броски внутри одного хода призрака
+        key = np.uint64((self.tick_count * _TICK_KEY +
+                         draw * int(_GOLDEN)) & _MASK64)
+        z = (self._seed_keys[:, None] + self._enemy_index[None, :] *
+             _ENEMY_KEY + key)
+        z = _splitmix64(z)
+        return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+    def _can_move(self, x, y, direction) -> np.ndarray:
+        # Проверка по маске открытых направлений сразу для массива позиций
+        safe = np.where(direction < 0, 0, direction)
+        open_cell = (self.open_dirs[y, x] >> safe.astype(np.uint8)) & 1
+        return open_cell.astype(bool) & (direction >= 0)
+
+    def apply_input(self, actions=None):
+        if actions is not None:
+            actions = np.asarray(actions, dtype=np.int8)
+            self.pending_direction = np.where(
+                actions >= 0, actions, self.pending_direction).astype(np.int8)
+
+        ready = (self.move_timer <= 0) & (self.pending_direction >= 0)
+        by_pending = ready & self._can_move(
+            self.player_x, self.player_y, self.pending_direction)
+        by_last = ready & ~by_pending & self._can_move(
+            self.player_x, self.player_y, self.last_direction)
+
+        movers = by_pending | by_last
+        self.move_timer[movers] = simulation.MOVE_DELAY
+        self.last_direction[by_pending] = self.pending_direction[by_pending]
+        move_direction = np.where(by_pending, self.pending_direction,
+                                  self.last_direction)
+
+        # Закончившиеся партии не двигаются, но таймеры ввода идут
+        active = np.flatnonzero(movers & ~self.done)
+        if active.size == 0:
+            return
+        direction = move_direction[active]
+        self.player_x[active] += DX[direction]
+        self.player_y[active] += DY[direction]
+        self.player_direction[active] = direction
+        self.moves_count[active] += 1
+
+        x = self.player_x[active]
+        y = self.player_y[active]
+
+        # Сбор точек
+        hit = self.dots[active, y, x]
+        self.dots[active, y, x] = False
+        self.score[active] += hit * DOT_SCORE
+
+        hit_big = self.big_dots[active, y, x]
+        self.big_dots[active, y, x] = False
+        self.score[active] += hit_big * BIG_DOT_SCORE
+        self.screen_flash[active[hit_big]] = 10
+        self.dots_left[active] -= hit.astype(np.int32) + hit_big
+
+        # Выход активен только когда все точки собраны
+        won = active[(self.dots_left[active] == 0) & self.exits[y, x]]
+        self.game_won[won] = True
+        self.victory_animation[won] = 120
+
+        # Столкновение с призраками
+        caught = np.any((self.enemy_x[active] == x[:, None]) &
+                        (self.enemy_y[active] == y[:, None]), axis=1)
+        self.game_lost[active[caught]] = True
+
+    def update_enemies(self):
+        if self.enemy_x.shape[1] == 0:
+            return
+
+        running = ~self.done
+        self.enemy_timer[running] += 1
+
+        px = self.player_x[:, None]
+        py = self.player_y[:, None]
+        distance = np.abs(self.enemy_x - px) + np.abs(self.enemy_y - py)
+        self.enemy_chase_mode = np.where(
+            running[:, None], distance <= simulation.CHASE_DISTANCE,
+            self.enemy_chase_mode)
+
+        acting = (running[:, None] &
+                  (self.enemy_timer % simulation.ENEMY_MOVE_PERIOD == 0))
+        if not acting.any():
+            return
+
+        x = self.enemy_x
+        y = self.enemy_y
+        old_x = x.copy()
+        old_y = y.copy()
+
+        # Проходимость всех четырех направлений: (N, призраки, 4)
+        valid = self._valid_moves()
+
+        # В коридоре призрак идет дальше, решают только стоящие в узлах
+        forward = np.where(
+            self.corridor[y, x],
+            FORWARD[self.open_dirs[y, x], self.enemy_direction],
+            NO_DIRECTION)
+        following = acting & (forward >= 0)
+        deciding = acting & ~following
+        chasing = deciding & self.enemy_chase_mode
+        wandering = deciding & ~self.enemy_chase_mode
+
+        # Преследование: кратчайший путь по лабиринту, а если игрок
+        # недостижим - жадно по манхэттенскому расстоянию
+        new_x = x[..., None] + DX
+        new_y = y[..., None] + DY
+        after = (np.abs(new_x - px[..., None]) +
+                 np.abs(new_y - py[..., None]))
+        # Поля расстояний нужны только партиям, где кто-то преследует
+        games = np.flatnonzero(chasing.any(axis=1))
+        if games.size:
+            player_cell = self.cell_index[self.player_y[games],
+                                          self.player_x[games]]
+            rows = self._distances(player_cell)
+            pick = np.arange(games.size)
+            ghost_cell = self.cell_index[y[games], x[games]]
+            reachable = rows[pick[:, None], ghost_cell] != UNREACHABLE
+            neighbor_cell = self.cell_index[
+                np.clip(new_y[games], 0, self.map_height - 1),
+                np.clip(new_x[games], 0, self.map_width - 1)]
+            by_path = rows[pick[:, None, None], neighbor_cell]
+            after[games] = np.where(reachable[..., None], by_path,
+                                    after[games])
+        after = np.where(valid, after, np.iinfo(np.int32).max)
+        best = np.argmin(after, axis=-1).astype(np.int8)
+        chase_moves = chasing & valid.any(axis=-1)
+
+        # Блуждание: 70% продолжить прямо, иначе случайное направление
+        straight = self._take(valid, self.enemy_direction)
+        keep = straight & (self.random(0) < 0.7)
+        count = valid.sum(axis=-1)
+        pick = (self.random(1) * np.maximum(count, 1)).astype(np.int32)
+        chosen = np.argmax(np.cumsum(valid, axis=-1) > pick[..., None],
+                           axis=-1).astype(np.int8)
+        wander_keep = wandering & keep
+        wander_turn = wandering & ~keep & (count > 0)
+
+        direction = np.where(chase_moves, best, self.enemy_direction)
+        direction = np.where(wander_turn, chosen, direction)
+        direction = np.where(following, forward, direction)
+        moving = following | chase_moves | wander_keep | wander_turn
+        self.enemy_x = np.where(moving, x + DX[direction], x)
+        self.enemy_y = np.where(moving, y + DY[direction], y)
+        self.enemy_direction = direction.astype(np.int8)
+
+        # Проверка на застревание
+        stayed = (acting & (self.enemy_x == old_x) &
+                  (self.enemy_y == old_y))
+        self.enemy_stuck_timer = np.where(
+            stayed, self.enemy_stuck_timer + 1,
+            np.where(acting, 0, self.enemy_stuck_timer))
+        forced = stayed & (self.enemy_stuck_timer > 2)
+        if forced.any():
+            self._force_move(forced)
+
+    def _valid_moves(self) -> np.ndarray:
+        # Открытые направления каждого призрака: (N, призраки, 4)
+        mask = self.open_dirs[self.enemy_y, self.enemy_x]
+        return (mask[..., None] & DIRECTION_BITS) != 0
+
+    @staticmethod
+    def _take(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+        return np.take_along_axis(
+            values, index.astype(np.intp)[..., None], axis=-1)[..., 0]
+
+    def _force_move(self, forced: np.ndarray):
+        # Первое проходимое направление по порядку UP, DOWN, LEFT, RIGHT
+        valid = self._valid_moves()
+        first = np.argmax(valid, axis=-1).astype(np.int8)
+        moving = forced & valid.any(axis=-1)
+        self.enemy_x = np.where(moving, self.enemy_x + DX[first],
+                                self.enemy_x)
+        self.enemy_y = np.where(moving, self.enemy_y + DY[first],
+                                self.enemy_y)
+        self.enemy_direction = np.where(moving, first, self.enemy_direction)
+        self.enemy_stuck_timer[forced] = 0
+
+    def update_timers(self):
+        self.move_timer[self.move_timer > 0] -= 1
+        self.screen_flash[self.screen_flash > 0] -= 1
+        self.victory_animation[self.victory_animation > 0] -= 1
+        self.tick_count += 1
@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+from typing import Callable, Dict, List
+
+# Без окна: отрисовка идет в память через фиктивный видеодрайвер SDL
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame  # noqa: E402
+
+import mapfile  # noqa: E402
+from levels import generate_maze  # noqa: E402
+from mcts import search  # noqa: E402
+from pacman import Game  # noqa: E402
+from runner import run_episode, wander_policy  # noqa: E402
+from simulation import DOT_CELL, DotStore, Simulation  # noqa: E402
+
+
+DEFAULT_SIZES = ('classic', '51', '201')
+GHOST_COUNTS = (4, 100, 10000)
+DOT_COUNTS = (100, 10000, 250000)
+SEARCH_ROLLOUTS = 200
+GAME_SEEDS = 20
+DEFAULT_REPEAT = 5
+MIN_SAMPLE_TIME = 0.05  # Одна серия вызовов длится не меньше этого
+DEFAULT_THRESHOLD = 0.2  # Замедление больше 20% считается регрессией
+CHECK_FRAMES = 300  # Кадров в сверке грязных прямоугольников
+
+
+def measure(func: Callable, repeat: int = DEFAULT_REPEAT) -> Dict:
+    # Число вызовов в серии подбирается, чтобы серия шла не меньше
+    # MIN_SAMPLE_TIME; в результат идут лучшая и медианная серии
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < MIN_SAMPLE_TIME:
+        number *= 2
+    samples = sorted(timer.repeat(repeat, number))
+    return {
+        'seconds': samples[0] / number,
+        'median': samples[len(samples) // 2] / number,
+        'number': number,
+    }
+
+
+def _level(size: str):
+    if size == 'classic':
+        return None
+    return generate_maze(int(size), int(size), seed=1)
+
+
+def bench_render(sizes: List[str], repeat: int, results: Dict):
+    parts = ('_render_map', '_render_dots', '_render_enemies',
+             '_render_player', '_render_ui')
+    i = 0
+    while i < len(sizes):
+        game = Game(level=_level(sizes[i]), seed=1)
+        game._update_camera()
+        game.render()
+        j = 0
+        while j < len(parts):
+            results[f"render.{parts[j]}[map={sizes[i]}]"] = measure(
+                getattr(game, parts[j]), repeat)
+            j += 1
+        results[f"render.render[map={sizes[i]}]"] = measure(
+            game.render, repeat)
+
+        dirty = Game(dirty_rendering=True, level=_level(sizes[i]), seed=1)
+        dirty.render()
+        results[f"render.render_dirty[map={sizes[i]}]"] = measure(
+            dirty.render, repeat)
+        i += 1
+
+
+def check_dirty(size: str, frames: int = CHECK_FRAMES) -> int:
+    # Сколько кадров грязных прямоугольников разошлись с полной
+    # перерисовкой. На больших картах камера едет за игроком, и спрайты
+    # у края окна частично уходят за экран
+    full = Game(level=_level(size), seed=6)
+    dirty = Game(dirty_rendering=True, level=_level(size), seed=6)
+    # Обе игры рисуют в одно окно, полной перерисовке нужен свой экран
+    full.screen = pygame.Surface(full.screen.get_size())
+    full.autopilot = (lambda sim, rng=random.Random(6):
+                      wander_policy(sim, rng))
+    dirty.autopilot = (lambda sim, rng=random.Random(6):
+                       wander_policy(sim, rng))
+
+    mismatches = 0
+    frame = 0
+    while frame < frames:
+        games = (full, dirty)
+        i = 0
+        while i < len(games):
+            if frame % 3 == 0:
+                games[i].tick()
+            games[i].render_alpha = (frame % 3 + 1) / 3.0
+            games[i].render()
+            i += 1
+        if (pygame.image.tostring(full.screen, 'RGB') !=
+                pygame.image.tostring(dirty.screen, 'RGB')):
+            mismatches += 1
+        frame += 1
+    return mismatches
+
+
+def bench_enemies(repeat: int, results: Dict):
+    # Игрок стоит на месте: столкновения проверяются только при его ходе,
+    # поэтому партия не заканчивается посреди замера
+    i = 0
+    while i < len(GHOST_COUNTS):
+        ghosts = GHOST_COUNTS[i]
+        size = 25
+        while size * size < ghosts * 4:
+            size = size * 2 + 1
+        sim = Simulation(generate_maze(size, size, seed=2, ghosts=ghosts),
+                         seed=2)
+        results[f"sim.update_enemies[ghosts={len(sim.enemies)}]"] = measure(
+            sim.update_enemies, repeat)
+        i += 1
+
+
+def bench_dots(repeat: int, results: Dict):
+    # Сбор точки под игроком: точка возвращается перед каждым вызовом,
+    # остальные точки хранилища только занимают память
+    i = 0
+    while i < len(DOT_COUNTS):
+        sim = Simulation(seed=3)
+        side = 1
+        while side * side < DOT_COUNTS[i]:
+            side += 1
+        store = DotStore(side, side)
+        index = 0
+        while index < DOT_COUNTS[i]:
+            store.add(index % side, index // side, DOT_CELL)
+            index += 1
+        sim.collectibles = store
+        sim.player.x = side // 2
+        sim.player.y = side // 2
+
+        def collect(sim=sim, store=store):
+            store.add(sim.player.x, sim.player.y, DOT_CELL)
+            sim._check_dots()
+
+        results[f"sim.check_dots[dots={DOT_COUNTS[i]}]"] = measure(
+            collect, repeat)
+        i += 1
+
+
+def bench_game(repeat: int, results: Dict):
+    # Целые партии бота из runner на классической карте
+    ticks = [0]
+
+    def play():
+        total = 0
+        index = 0
+        while index < GAME_SEEDS:
+            total += run_episode(f"bench:{index}")['ticks']
+            index += 1
+        ticks[0] = total
+
+    result = measure(play, repeat)
+    result['ticks'] = ticks[0]
+    result['ticks_per_second'] = ticks[0] / result['seconds']
+    results[f"sim.game[episodes={GAME_SEEDS}]"] = result
+
+
+def bench_search(sizes: List[str], repeat: int, results: Dict):
+    # Копия состояния и прогоны MCTS из начала партии
+    i = 0
+    while i < len(sizes):
+        sim = Simulation(_level(sizes[i]), seed=4)
+        rng = random.Random(4)
+        results[f"sim.clone[map={sizes[i]}]"] = measure(
+            lambda sim=sim, rng=rng: sim.clone(rng), repeat)
+        i += 1
+
+    sim = Simulation(seed=4)
+    rng = random.Random(4)
+    result = measure(lambda: search(sim, SEARCH_ROLLOUTS, rng), repeat)
+    result['rollouts_per_second'] = SEARCH_ROLLOUTS / result['seconds']
+    results[f"mcts.search[rollouts={SEARCH_ROLLOUTS}]"] = result
+
+
+def bench_load(sizes: List[str], repeat: int, results: Dict):
+    # Загрузка уровня: разбор строк против скомпилированной карты из
+    # кэша (временная папка, первая компиляция в замер не входит)
+    with tempfile.TemporaryDirectory(prefix='pacman-maps-') as cache_dir:
+        i = 0
+        while i < len(sizes):
+            level = _level(sizes[i])
+            results[f"load.parse[map={sizes[i]}]"] = measure(
+                lambda level=level: Simulation(level, seed=5), repeat)
+            mapfile.cached(level, cache_dir=cache_dir)
+
+            def load(level=level):
+                mapfile.cached(level, cache_dir=cache_dir).simulation(5)
+
+            results[f"load.compiled[map={sizes[i]}]"] = measure(load,
+                                                                repeat)
+            i += 1
+
+
+def run_suite(sizes: List[str], repeat: int = DEFAULT_REPEAT,
+              groups: tuple = ('render', 'enemies', 'dots', 'game',
+                               'search', 'load')) -> Dict:
+    results = {}
+    checks = {}
+    if 'render' in groups:
+        bench_render(sizes, repeat, results)
+        i = 0
+        while i < len(sizes):
+            checks[f"render.dirty_matches_full[map={sizes[i]}]"] = (
+                check_dirty(sizes[i]) == 0)
+            i += 1
+    if 'enemies' in groups:
+        bench_enemies(repeat, results)
+    if 'dots' in groups:
+        bench_dots(repeat, results)
+    if 'game' in groups:
+        bench_game(repeat, results)
+    if 'search' in groups:
+        bench_search(sizes, repeat, results)
+    if 'load' in groups:
+        bench_load(sizes, repeat, results)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+        'checks': checks,
+    }
+
+
+def compare(current: Dict, baseline: Dict,
+            threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    # Сравнение по лучшему времени; новые и пропавшие замеры пропускаются
+    rows = []
+    names = sorted(current['results'])
+    i = 0
+    while i < len(names):
+        name = names[i]
+        i += 1
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['seconds']
+        new = current['results'][name]['seconds']
+        ratio = new / old if old else 1.0
+        rows.append({
+            'name': name,
+            'baseline': old,
+            'current': new,
+            'ratio': ratio,
+            'regression': ratio > 1.0 + threshold,
+        })
+    return rows
+
+
+def _format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.1f} us"
+    if seconds < 1.0:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds:9.3f} s "
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Замеры горячих участков симуляции и отрисовки")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help="размеры карт: classic или сторона лабиринта")
+    parser.add_argument('--only',
+                        default='render,enemies,dots,game,search,load',
+                        help="группы замеров через запятую")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--output', help="записать результаты в JSON")
+    parser.add_argument('--baseline', help="JSON прошлого прогона")
+    parser.add_argument('--threshold', type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help="допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes.split(','), args.repeat,
+                       tuple(args.only.split(',')))
+    pygame.quit()
+
+    names = sorted(report['results'])
+    i = 0
+    while i < len(names):
+        result = report['results'][names[i]]
+        rate = ""
+        if 'rollouts_per_second' in result:
+            rate = f"  {result['rollouts_per_second']:.0f} прогонов/с"
+        elif 'ticks_per_second' in result:
+            rate = f"  {result['ticks_per_second']:.0f} тиков/с"
+        print(f"{names[i]:45} {_format_time(result['seconds'])}{rate}")
+        i += 1
+
+    failed = 0
+    names = sorted(report['checks'])
+    i = 0
+    while i < len(names):
+        passed = report['checks'][names[i]]
+        print(f"{names[i]:45} {'ok' if passed else 'РАСХОЖДЕНИЕ'}")
+        failed += not passed
+        i += 1
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        rows = compare(report, baseline, args.threshold)
+        regressions = 0
+        print()
+        i = 0
+        while i < len(rows):
+            row = rows[i]
+            mark = "РЕГРЕССИЯ" if row['regression'] else ""
+            print(f"{row['name']:45} {_format_time(row['baseline'])} -> "
+                  f"{_format_time(row['current'])}  x{row['ratio']:.2f} "
+                  f"{mark}")
+            regressions += row['regression']
+            i += 1
+        if regressions:
+            print(f"Регрессий: {regressions}")
+            sys.exit(1)
+
+    if failed:
+        print(f"Проверок не прошло: {failed}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
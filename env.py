@@ -0,0 +1,145 @@
+from typing import List, Optional
+
+import numpy as np
+
+from simulation import (BIG_DOT_CELL, DIRECTIONS, DOT_CELL, Simulation,
+                        TileType)
+
+
+# Каналы наблюдения: сетка карты по слоям, 1 - объект в клетке
+WALLS = 0
+DOTS = 1
+BIG_DOTS = 2
+EXITS = 3
+PLAYER = 4
+GHOSTS = 5
+CHASE = 6  # Призраки, которые сейчас преследуют игрока
+CHANNELS = 7
+
+# Действия: 0 - без нового направления, 1..4 - DIRECTIONS
+NO_ACTION = 0
+ACTIONS = (None,) + DIRECTIONS
+
+DEFAULT_MAX_TICKS = 20000
+
+
+class PacmanEnv:
+    # Среда для обучения агентов в духе Gym: reset(seed) -> наблюдение,
+    # step(action) -> (наблюдение, награда, done, info).
+    # Наблюдение - один и тот же заранее выделенный массив (CHANNELS, H, W),
+    # который переписывается на месте каждый шаг; если его нужно
+    # сохранить, копию делает вызывающий.
+
+    def __init__(self, level: Optional[List[str]] = None,
+                 max_ticks: int = DEFAULT_MAX_TICKS, frame_skip: int = 1):
+        self.level = level
+        self.max_ticks = max_ticks
+        self.frame_skip = frame_skip
+        self.sim = None
+        self.observation = None
+        self._flags = None
+        self.n_actions = len(ACTIONS)
+        self.player_cell = None
+        self.ghost_cells = []
+
+    def reset(self, seed=None) -> np.ndarray:
+        sim = Simulation(self.level, seed)
+        self.sim = sim
+        store = sim.collectibles
+        shape = (CHANNELS, store.height, store.width)
+        if self.observation is None or self.observation.shape != shape:
+            self.observation = np.zeros(shape, dtype=np.uint8)
+            # Логическое представление тех же байтов для сравнений с out=
+            self._flags = self.observation.view(np.bool_)
+        observation = self.observation
+        observation.fill(0)
+
+        # Неизменные слои: стены (включая клетки за концом короткой
+        # строки) и выходы
+        observation[WALLS].fill(1)
+        y = 0
+        while y < len(sim.game_map):
+            row = sim.game_map[y]
+            x = 0
+            while x < min(len(row), sim.map_width):
+                if row[x] != TileType.WALL.value:
+                    observation[WALLS, y, x] = 0
+                x += 1
+            y += 1
+        i = 0
+        while i < len(sim.exits):
+            observation[EXITS, sim.exits[i][1], sim.exits[i][0]] = 1
+            i += 1
+
+        # Точки целиком один раз, дальше они меняются только под игроком
+        cells = np.frombuffer(store.cells, dtype=np.uint8).reshape(
+            store.height, store.width)
+        np.equal(cells, DOT_CELL, out=self._flags[DOTS])
+        np.equal(cells, BIG_DOT_CELL, out=self._flags[BIG_DOTS])
+
+        self.player_cell = None
+        self.ghost_cells = []
+        self._update_entities()
+        return observation
+
+    def step(self, action: int):
+        sim = self.sim
+        direction = ACTIONS[action]
+        score = sim.score
+        store = sim.collectibles
+        repeat = self.frame_skip
+        while repeat > 0 and not sim.done:
+            dots_left = store.total
+            sim.apply_input(direction)
+            sim.update_enemies()
+            sim.update_timers()
+            # Точку можно собрать только в клетке игрока
+            if store.total != dots_left:
+                self.observation[DOTS, sim.player.y, sim.player.x] = 0
+                self.observation[BIG_DOTS, sim.player.y, sim.player.x] = 0
+            repeat -= 1
+        self._update_entities()
+
+        truncated = not sim.done and sim.tick_count >= self.max_ticks
+        info = {
+            'score': sim.score,
+            'moves_count': sim.moves_count,
+            'tick': sim.tick_count,
+            'game_won': sim.game_won,
+            'game_lost': sim.game_lost,
+            'truncated': truncated,
+        }
+        return (self.observation, sim.score - score,
+                sim.done or truncated, info)
+
+    def _update_entities(self):
+        # Игрок и призраки: стираем прошлые клетки и ставим новые, без
+        # очистки всего слоя
+        observation = self.observation
+        sim = self.sim
+        if self.player_cell is not None:
+            observation[PLAYER, self.player_cell[1], self.player_cell[0]] = 0
+        self.player_cell = None
+        if sim.player is not None:
+            self.player_cell = (sim.player.x, sim.player.y)
+            observation[PLAYER, sim.player.y, sim.player.x] = 1
+
+        ghosts = observation[GHOSTS]
+        chase = observation[CHASE]
+        old_cells = self.ghost_cells
+        i = 0
+        while i < len(old_cells):
+            ghosts[old_cells[i]] = 0
+            chase[old_cells[i]] = 0
+            i += 1
+        cells = []
+        enemies = sim.enemies
+        i = 0
+        while i < len(enemies):
+            cell = (enemies[i].y, enemies[i].x)
+            cells.append(cell)
+            ghosts[cell] = 1
+            if enemies[i].chase_mode:
+                chase[cell] = 1
+            i += 1
+        self.ghost_cells = cells
@@ -0,0 +1,152 @@
+import random
+from typing import List, Optional
+
+from simulation import TileType
+
+
+LEVEL_COMMENT = '#'  # Строка-комментарий в файле уровня
+
+
+def generate_maze(width: int, height: int, seed: Optional[int] = None,
+                  ghosts: int = 4, big_dots: int = 4,
+                  loops: float = 0.1) -> List[str]:
+    # Случайный лабиринт в формате карты: стены '1', точки '.', большие
+    # точки 'o', игрок 'P', призраки 'X', выход 'E'. Размеры приводятся
+    # к нечетным, часть стен убирается (loops), чтобы были развилки.
+    rng = random.Random(seed)
+    width = max(5, width | 1)
+    height = max(5, height | 1)
+
+    grid = []
+    y = 0
+    while y < height:
+        grid.append([TileType.WALL.value] * width)
+        y += 1
+
+    # Лабиринт обходом в глубину по нечетным клеткам (явный стек)
+    steps = [(0, -2), (0, 2), (-2, 0), (2, 0)]
+    start = (1, 1)
+    grid[1][1] = TileType.DOT.value
+    stack = [start]
+    while stack:
+        x, y = stack[-1]
+        options = []
+        i = 0
+        while i < len(steps):
+            nx = x + steps[i][0]
+            ny = y + steps[i][1]
+            if (0 < nx < width - 1 and 0 < ny < height - 1 and
+                    grid[ny][nx] == TileType.WALL.value):
+                options.append((nx, ny))
+            i += 1
+        if not options:
+            stack.pop()
+            continue
+        nx, ny = options[rng.randint(0, len(options) - 1)]
+        grid[(y + ny) // 2][(x + nx) // 2] = TileType.DOT.value
+        grid[ny][nx] = TileType.DOT.value
+        stack.append((nx, ny))
+
+    # Убираем часть внутренних стен между коридорами
+    y = 1
+    while y < height - 1:
+        x = 1 + y % 2
+        while x < width - 1:
+            if grid[y][x] == TileType.WALL.value and rng.random() < loops:
+                grid[y][x] = TileType.DOT.value
+            x += 2
+        y += 1
+
+    open_cells = []
+    y = 1
+    while y < height - 1:
+        x = 1
+        while x < width - 1:
+            if grid[y][x] != TileType.WALL.value:
+                open_cells.append((x, y))
+            x += 1
+        y += 1
+
+    # Игрок в ближайшей к центру открытой клетке
+    center_x = width // 2
+    center_y = height // 2
+    player = open_cells[0]
+    best = width + height
+    i = 0
+    while i < len(open_cells):
+        x, y = open_cells[i]
+        distance = abs(x - center_x) + abs(y - center_y)
+        if distance < best:
+            best = distance
+            player = open_cells[i]
+        i += 1
+    grid[player[1]][player[0]] = TileType.PLAYER.value
+
+    # Призраки, большие точки и выход - в случайных клетках подальше
+    # от игрока
+    far_cells = []
+    i = 0
+    while i < len(open_cells):
+        x, y = open_cells[i]
+        if abs(x - player[0]) + abs(y - player[1]) > 8:
+            far_cells.append(open_cells[i])
+        i += 1
+    if not far_cells:
+        far_cells = open_cells[:]
+        far_cells.remove(player)
+    rng.shuffle(far_cells)
+
+    placements = ([TileType.EXIT.value] +
+                  [TileType.BIG_DOT.value] * big_dots +
+                  [TileType.ENEMY.value] * ghosts)
+    i = 0
+    while i < len(placements) and i < len(far_cells):
+        x, y = far_cells[i]
+        grid[y][x] = placements[i]
+        i += 1
+
+    level = []
+    y = 0
+    while y < height:
+        level.append(''.join(grid[y]))
+        y += 1
+    return level
+
+
+def parse_level(text: str) -> List[str]:
+    # Формат файла уровня: строки карты теми же символами, что и в
+    # CLASSIC_MAP; пустые строки и строки с '#' в начале пропускаются,
+    # пробелы в конце строк отбрасываются
+    tiles = set()
+    members = list(TileType)
+    i = 0
+    while i < len(members):
+        tiles.add(members[i].value)
+        i += 1
+
+    level = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        i += 1
+        if not line or line.startswith(LEVEL_COMMENT):
+            continue
+        unknown = set(line) - tiles
+        if unknown:
+            raise ValueError(
+                f"Строка {i}: неизвестные символы {sorted(unknown)}")
+        level.append(line)
+    if not level:
+        raise ValueError("В уровне нет ни одной строки карты")
+    return level
+
+
+def read_level(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as handle:
+        return parse_level(handle.read())
+
+
+def write_level(level: List[str], path: str):
+    with open(path, 'w', encoding='utf-8') as handle:
+        handle.write('\n'.join(level) + '\n')
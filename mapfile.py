@@ -0,0 +1,350 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import List, Optional
+
+from levels import read_level
+from simulation import (BIG_DOT_CELL, CLASSIC_MAP, DOT_CELL, MAP_HEIGHT,
+                        MAP_WIDTH, DotStore, JunctionGraph, Maze, Player,
+                        Simulation)
+
+
+# Скомпилированная карта (.pmc): все, что иначе считается при каждой
+# загрузке уровня, - клетки после разбора, проходимость битами, таблицы
+# соседей, точки битами, места появления, выходы, граф развилок и
+# (по желанию) расстояния между всеми развилками. Секции выровнены по
+# 4 байта, чтобы таблицы int32 читались из mmap как есть, без копий
+MAPFILE_MAGIC = b'PMMC'
+MAPFILE_VERSION = 2
+MAPFILE_SUFFIX = '.pmc'
+ALL_PAIRS_NODES = 2048  # Больше узлов - таблица расстояний не строится
+CACHE_ENV = 'PACMAN_MAP_CACHE'  # Переменная окружения с папкой кэша
+
+FLAG_DISTANCES = 1
+
+_HEADER = struct.Struct('<4sBB2x')
+_COUNTS = struct.Struct('<9i')
+_PAIR = 8  # Байт на пару координат int32
+
+
+class MapFileError(Exception):
+    pass
+
+
+def _level_and_size(level: Optional[List[str]]) -> tuple:
+    # Размеры карты выбираются так же, как в Simulation
+    if level is None:
+        return CLASSIC_MAP, MAP_WIDTH, MAP_HEIGHT
+    return level, len(level[0]), len(level)
+
+
+def source_key(level: Optional[List[str]] = None,
+               distances: bool = False) -> str:
+    # Ключ кэша: хэш строк карты, размеров и версии формата
+    level, width, height = _level_and_size(level)
+    digest = hashlib.sha256(
+        f"{MAPFILE_VERSION}:{width}x{height}:{int(distances)}\n".encode())
+    digest.update('\n'.join(level).encode('ascii'))
+    return digest.hexdigest()
+
+
+def default_cache_dir() -> str:
+    return os.environ.get(CACHE_ENV) or os.path.join(
+        os.path.expanduser('~'), '.cache', 'pacman', 'maps')
+
+
+def _pack_bits(cells: bytes, value: int) -> bytes:
+    # Байт на клетку -> бит на клетку (клетки со значением value).
+    # Через двоичную запись числа, чтобы перебор шел на C
+    table = bytearray(b'0' * 256)
+    table[value] = ord('1')
+    digits = cells.translate(bytes(table))[::-1]
+    number = int(digits, 2) if digits else 0
+    return number.to_bytes((len(cells) + 7) // 8, 'little')
+
+
+def _unpack_bits(bits, count: int, value: int) -> bytes:
+    # Бит на клетку -> байт на клетку (value или 0)
+    digits = bin(int.from_bytes(bits, 'little'))[2:][::-1]
+    digits = digits.ljust(count, '0')[:count].encode('ascii')
+    return digits.translate(bytes.maketrans(b'01', bytes((0, value))))
+
+
+def _aligned(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 4)
+
+
+def compile_level(level: Optional[List[str]] = None,
+                  distances: bool = False) -> bytes:
+    # Разбор идет обычной загрузкой Simulation, так что результат
+    # совпадает с ней клетка в клетку; сохраняется уже готовое
+    sim = Simulation(level)
+    maze = sim.maze
+    graph = maze.junctions
+    flags = 0
+    table = None
+    if distances and len(graph) <= ALL_PAIRS_NODES:
+        table = graph.all_pairs()
+        flags |= FLAG_DISTANCES
+
+    rows = sim.game_map
+    row_lengths = array('i')
+    row_bytes = []
+    i = 0
+    while i < len(rows):
+        row_lengths.append(len(rows[i]))
+        row_bytes.append(''.join(rows[i]).encode('ascii'))
+        i += 1
+
+    exits = array('i')
+    i = 0
+    while i < len(sim.exits):
+        exits.append(sim.exits[i][0])
+        exits.append(sim.exits[i][1])
+        i += 1
+
+    ghosts = sim.ghosts
+    spawns = array('i')
+    i = 0
+    while i < len(ghosts):
+        spawns.append(ghosts.x[i])
+        spawns.append(ghosts.y[i])
+        i += 1
+
+    store = sim.collectibles
+    player = sim.player
+    parts = [
+        _HEADER.pack(MAPFILE_MAGIC, MAPFILE_VERSION, flags),
+        _COUNTS.pack(sim.map_width, sim.map_height, len(rows), store.width,
+                     player.x if player else -1, player.y if player else -1,
+                     len(sim.exits), len(ghosts), len(graph)),
+        row_lengths.tobytes(),
+        _aligned(b''.join(row_bytes)),
+        _aligned(_pack_bits(bytes(maze.walkable), 1)),
+        _aligned(bytes(maze.open_dirs)),
+        maze.neighbors.tobytes(),
+        _aligned(_pack_bits(bytes(store.cells), DOT_CELL)),
+        _aligned(_pack_bits(bytes(store.cells), BIG_DOT_CELL)),
+        exits.tobytes(),
+        spawns.tobytes(),
+        graph.cells.tobytes(),
+        graph.node.tobytes(),
+        graph.edge.tobytes(),
+        graph.offset.tobytes(),
+        graph.targets.tobytes(),
+        graph.lengths.tobytes(),
+    ]
+    if table is not None:
+        parts.append(table.tobytes())
+    return b''.join(parts)
+
+
+class CompiledMap:
+    # Открытая скомпилированная карта. Таблицы лабиринта и графа - виды
+    # на буфер (обычно mmap файла), общие для всех партий этой карты;
+    # в каждую партию копируются только строки карты и байты точек
+
+    def __init__(self, data):
+        self.data = data
+        view = memoryview(data)
+        if len(view) < _HEADER.size + _COUNTS.size:
+            raise MapFileError("Файл карты слишком короткий")
+        magic, version, flags = _HEADER.unpack_from(view, 0)
+        if magic != MAPFILE_MAGIC:
+            raise MapFileError("Это не скомпилированная карта Pacman")
+        if version != MAPFILE_VERSION:
+            raise MapFileError(f"Неизвестная версия карты: {version}")
+        (self.map_width, self.map_height, row_count, columns, player_x,
+         player_y, exit_count, ghost_count,
+         node_count) = _COUNTS.unpack_from(view, _HEADER.size)
+        self.position = _HEADER.size + _COUNTS.size
+        self.view = view
+        size = self.map_width * self.map_height
+
+        self.row_lengths = self._section(row_count * 4).cast('i')
+        self.rows = self._section(sum(self.row_lengths), True)
+
+        maze = Maze.__new__(Maze)
+        maze.width = self.map_width
+        maze.height = self.map_height
+        maze.walkable = _unpack_bits(self._section((size + 7) // 8, True),
+                                     size, 1)
+        maze.open_dirs = self._section(size, True)
+        maze.neighbors = self._section(size * 16).cast('i')
+
+        dot_size = columns * row_count
+        dots = self._section((dot_size + 7) // 8, True)
+        big_dots = self._section((dot_size + 7) // 8, True)
+        self.columns = columns
+        self.dot_cells = bytes(
+            (int.from_bytes(_unpack_bits(dots, dot_size, DOT_CELL),
+                            'little') |
+             int.from_bytes(_unpack_bits(big_dots, dot_size, BIG_DOT_CELL),
+                            'little')).to_bytes(dot_size, 'little'))
+        self.dot_count = self.dot_cells.count(DOT_CELL)
+        self.big_dot_count = self.dot_cells.count(BIG_DOT_CELL)
+
+        self.exits = self._section(exit_count * _PAIR).cast('i')
+        self.spawns = self._section(ghost_count * _PAIR).cast('i')
+        self.player = (player_x, player_y) if player_x >= 0 else None
+
+        graph = JunctionGraph.__new__(JunctionGraph)
+        graph.cells = self._section(node_count * 4).cast('i')
+        graph.node = self._section(size * 4).cast('i')
+        graph.edge = self._section(size * 4).cast('i')
+        graph.offset = self._section(size * 4).cast('i')
+        graph.targets = self._section(node_count * 16).cast('i')
+        graph.lengths = self._section(node_count * 16).cast('i')
+        graph.distances = None
+        if flags & FLAG_DISTANCES:
+            graph.distances = self._section(
+                node_count * node_count * 4).cast('i')
+        maze._junctions = graph
+        self.maze = maze
+
+        if self.position != len(view):
+            raise MapFileError("Размер файла карты не совпадает с "
+                               "содержимым")
+
+    def _section(self, length: int, padded: bool = False) -> memoryview:
+        end = self.position + length
+        if end > len(self.view):
+            raise MapFileError("Файл карты обрезан")
+        section = self.view[self.position:end]
+        self.position = end + (-length % 4 if padded else 0)
+        return section
+
+    def populate(self, sim: Simulation):
+        # Заполняет новую партию тем же, что дали бы _load_map и
+        # _find_game_objects
+        sim.map_version += 1
+        sim.game_map = []
+        start = 0
+        i = 0
+        while i < len(self.row_lengths):
+            end = start + self.row_lengths[i]
+            sim.game_map.append(list(bytes(self.rows[start:end]).decode(
+                'ascii')))
+            start = end
+            i += 1
+
+        store = DotStore(self.columns, len(self.row_lengths))
+        store.cells[:] = self.dot_cells
+        store.dot_count = self.dot_count
+        store.big_dot_count = self.big_dot_count
+        sim.collectibles = store
+
+        sim.exits = []
+        i = 0
+        while i < len(self.exits):
+            sim.exits.append((self.exits[i], self.exits[i + 1]))
+            i += 2
+
+        i = 0
+        while i < len(self.spawns):
+            sim.ghosts.add(self.spawns[i], self.spawns[i + 1],
+                           len(sim.ghosts) % 4)
+            i += 2
+
+        if self.player is not None:
+            sim.player = Player(*self.player)
+        sim.maze = self.maze
+
+    def simulation(self, seed: Optional[int] = None) -> Simulation:
+        return Simulation(seed=seed, compiled=self)
+
+
+def loads(data: bytes) -> CompiledMap:
+    return CompiledMap(data)
+
+
+def load(path: str) -> CompiledMap:
+    # Файл отображается в память: таблицы читаются страницами по мере
+    # обращения, сам файл можно закрыть сразу
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            raise MapFileError("Файл карты пуст")
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    return CompiledMap(data)
+
+
+def save(level: Optional[List[str]], path: str, distances: bool = False):
+    # Запись через временный файл: параллельный читатель не увидит
+    # недописанную карту
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as handle:
+        handle.write(compile_level(level, distances))
+    os.replace(temp, path)
+
+
+def cache_path(level: Optional[List[str]] = None, distances: bool = False,
+               cache_dir: Optional[str] = None) -> str:
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir,
+                        source_key(level, distances) + MAPFILE_SUFFIX)
+
+
+def cached(level: Optional[List[str]] = None, distances: bool = False,
+           cache_dir: Optional[str] = None) -> CompiledMap:
+    # Карта из кэша на диске; при первой встрече компилируется и
+    # сохраняется. Ключ - хэш строк карты, так что правка уровня дает
+    # новый файл, а не устаревшие таблицы
+    path = cache_path(level, distances, cache_dir)
+    if os.path.exists(path):
+        try:
+            return load(path)
+        except MapFileError:
+            pass  # Испорченный файл просто компилируется заново
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    save(level, path, distances)
+    return load(path)
+
+
+def open_level(path: str, distances: bool = False,
+               cache_dir: Optional[str] = None) -> CompiledMap:
+    return cached(read_level(path), distances, cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Компиляция уровней Pacman в кэш готовых таблиц")
+    parser.add_argument('levels', nargs='*',
+                        help="файлы уровней; без них - классическая карта")
+    parser.add_argument('--distances', action='store_true',
+                        help="добавить расстояния между всеми развилками")
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help=f"папка кэша (по умолчанию ${CACHE_ENV} или "
+                             "~/.cache/pacman/maps)")
+    args = parser.parse_args()
+
+    paths = args.levels if args.levels else [None]
+    i = 0
+    while i < len(paths):
+        level = read_level(paths[i]) if paths[i] is not None else None
+        started = time.perf_counter()
+        compiled = cached(level, args.distances, args.cache)
+        seconds = time.perf_counter() - started
+        graph = compiled.maze.junctions
+        edges = 0
+        j = 0
+        while j < len(graph.targets):
+            edges += graph.targets[j] >= 0
+            j += 1
+        print(f"{paths[i] or 'classic'}: "
+              f"{cache_path(level, args.distances, args.cache)}")
+        print(f"  {compiled.map_width}x{compiled.map_height}, "
+              f"развилок {len(graph)}, коридоров {edges // 2}, "
+              f"{len(compiled.view)} байт, {seconds:.3f} с")
+        if args.distances and graph.distances is None:
+            print(f"  расстояния не сохранены: развилок больше "
+                  f"{ALL_PAIRS_NODES}")
+        i += 1
+
+
+if __name__ == "__main__":
+    main()
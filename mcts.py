@@ -0,0 +1,331 @@
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import snapshot
+from runner import DEFAULT_MAX_TICKS, episode_seed, run_episode, summarize
+from simulation import (BIG_DOT_CELL, DIRECTIONS, DOT_CELL, DOT_SCORE,
+                        NO_CELL, OPEN_DIRECTIONS, UNREACHABLE, Direction,
+                        Simulation)
+
+
+DEFAULT_BUDGET = 400  # Прогонов на одно решение
+HORIZON = 10  # Глубина прогона в ходах игрока
+EXPLORATION = 1.0  # Коэффициент исследования в UCB1
+WIN_VALUE = 100.0
+LOSS_VALUE = -50.0
+DISTANCE_WEIGHT = 0.2  # Штраф за каждый шаг до ближайшей точки в конце
+GREEDY_CHANCE = 0.7  # Доля шагов прогона к ближайшей цели
+
+
+def legal_actions(sim: Simulation) -> list:
+    maze = sim.maze
+    return OPEN_DIRECTIONS[maze.open_dirs[maze.index(sim.player.x,
+                                                     sim.player.y)]]
+
+
+def advance(sim: Simulation, action: Optional[int]):
+    # Один ход игрока: направление (None - без ввода) и тики до
+    # следующего хода
+    sim.apply_input(DIRECTIONS[action] if action is not None else None)
+    sim.update_enemies()
+    sim.update_timers()
+    while sim.move_timer > 0 and not sim.done:
+        sim.update_enemies()
+        sim.update_timers()
+
+
+def target_distances(sim: Simulation) -> list:
+    # Поле расстояний до ближайшей точки (или до выхода, когда точек нет):
+    # поиск в ширину сразу от всех целей. Считается один раз на решение;
+    # точки, съеденные внутри прогонов, в нем остаются - их и так
+    # учитывает счет. Поле по клеткам, а не по графу развилок: прогоны
+    # читают его в каждой клетке, а цели есть почти в каждом коридоре
+    maze = sim.maze
+    store = sim.collectibles
+    distances = [UNREACHABLE] * (maze.width * maze.height)
+    queue = []
+    if store.total > 0:
+        targets = store.positions(DOT_CELL) + store.positions(BIG_DOT_CELL)
+    else:
+        targets = sim.exits
+    i = 0
+    while i < len(targets):
+        x, y = targets[i]
+        i += 1
+        if x < maze.width and y < maze.height:
+            cell = maze.index(x, y)
+            if maze.walkable[cell] and distances[cell] == UNREACHABLE:
+                distances[cell] = 0
+                queue.append(cell)
+    neighbors = maze.neighbors
+    head = 0
+    while head < len(queue):
+        cell = queue[head]
+        head += 1
+        base = cell * 4
+        d = 0
+        while d < 4:
+            neighbor = neighbors[base + d]
+            d += 1
+            if neighbor != NO_CELL and distances[neighbor] == UNREACHABLE:
+                distances[neighbor] = distances[cell] + 1
+                queue.append(neighbor)
+    return distances
+
+
+def rollout_action(sim: Simulation, field: list,
+                   rng: random.Random) -> Optional[int]:
+    # Чаще шаг к ближайшей цели по полю, иначе случайный; из замурованной
+    # клетки ходов нет - тогда None (без ввода)
+    maze = sim.maze
+    cell = maze.index(sim.player.x, sim.player.y)
+    actions = OPEN_DIRECTIONS[maze.open_dirs[cell]]
+    if not actions:
+        return None
+    if rng.random() < GREEDY_CHANCE:
+        best = actions[0]
+        i = 1
+        while i < len(actions):
+            if (field[maze.neighbors[cell * 4 + actions[i]]] <
+                    field[maze.neighbors[cell * 4 + best]]):
+                best = actions[i]
+            i += 1
+        return best
+    return actions[rng.randrange(len(actions))]
+
+
+def evaluate(sim: Simulation, start_score: int, field: list) -> float:
+    if sim.game_lost:
+        return LOSS_VALUE
+    value = (sim.score - start_score) / DOT_SCORE
+    if sim.game_won:
+        return value + WIN_VALUE
+    distance = field[sim.maze.index(sim.player.x, sim.player.y)]
+    if distance == UNREACHABLE:
+        return value
+    return value - DISTANCE_WEIGHT * distance
+
+
+class Node:
+    # Узел дерева без сохраненного состояния (open-loop): состояние
+    # каждый раз получается проигрыванием ходов от корня на свежей копии,
+    # поэтому случайные ходы призраков в разных прогонах разные, а дерево
+    # копит среднюю ценность хода по ним
+
+    def __init__(self):
+        self.actions = None
+        self.children = {}
+        self.visits = 0
+        self.value = 0.0
+
+    def select(self) -> int:
+        best = None
+        best_score = None
+        log_visits = math.log(self.visits)
+        i = 0
+        while i < len(self.actions):
+            child = self.children[self.actions[i]]
+            score = (child.value / child.visits +
+                     EXPLORATION * math.sqrt(log_visits / child.visits))
+            if best_score is None or score > best_score:
+                best = self.actions[i]
+                best_score = score
+            i += 1
+        return best
+
+
+def search(root_sim: Simulation, budget: int, rng: random.Random) -> dict:
+    # budget прогонов от root_sim; результат - посещения и сумма ценности
+    # по ходам корня, чтобы деревья нескольких процессов можно было сложить
+    root = Node()
+    root.actions = legal_actions(root_sim)
+    start_score = root_sim.score
+    field = target_distances(root_sim)
+    rollout = 0
+    while rollout < budget:
+        sim = root_sim.clone(rng)
+        node = root
+        path = [root]
+        depth = 0
+
+        # Спуск по дереву и добавление одного нового узла
+        while not sim.done and depth < HORIZON:
+            if node.actions is None:
+                node.actions = legal_actions(sim)
+            if not node.actions:
+                # Ходов нет: дальше только прогон без ввода
+                break
+            action = None
+            i = 0
+            while i < len(node.actions):
+                if node.actions[i] not in node.children:
+                    action = node.actions[i]
+                    break
+                i += 1
+            expanded = action is not None
+            if not expanded:
+                action = node.select()
+            else:
+                node.children[action] = Node()
+            advance(sim, action)
+            node = node.children[action]
+            path.append(node)
+            depth += 1
+            if expanded:
+                break
+
+        # Прогон до горизонта
+        while not sim.done and depth < HORIZON:
+            advance(sim, rollout_action(sim, field, rng))
+            depth += 1
+
+        value = evaluate(sim, start_score, field)
+        i = 0
+        while i < len(path):
+            path[i].visits += 1
+            path[i].value += value
+            i += 1
+        rollout += 1
+
+    stats = {}
+    i = 0
+    while i < len(root.actions):
+        child = root.children.get(root.actions[i])
+        if child is not None:
+            stats[root.actions[i]] = (child.visits, child.value)
+        i += 1
+    return stats
+
+
+def _search_worker(job) -> dict:
+    data, budget, seed = job
+    return search(snapshot.loads(data), budget, random.Random(seed))
+
+
+class MCTSAgent:
+    # Бот на поиске по дереву Монте-Карло (UCT). Политика для runner:
+    # agent(sim, rng) -> Direction или None. Решение принимается, когда
+    # игрок может сделать ход; прогоны делятся между процессами
+    # (распараллеливание по корню: у каждого процесса свое дерево, их
+    # статистика ходов корня складывается)
+
+    def __init__(self, budget: int = DEFAULT_BUDGET, workers: int = 1,
+                 seed: Optional[int] = None):
+        self.budget = budget
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.rollouts = 0
+        self.seconds = 0.0
+        self._pool = None
+
+    @property
+    def rollouts_per_second(self) -> float:
+        return self.rollouts / self.seconds if self.seconds else 0.0
+
+    def __getstate__(self):
+        # Пул процессов не передается в другие процессы
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def __call__(self, sim: Simulation, rng=None) -> Optional[Direction]:
+        if sim.player is None or sim.done or sim.move_timer > 0:
+            return None
+        actions = legal_actions(sim)
+        if not actions:
+            return None
+        if len(actions) == 1:
+            return DIRECTIONS[actions[0]]
+        return DIRECTIONS[self.decide(sim, rng)]
+
+    def decide(self, sim: Simulation,
+               rng: Optional[random.Random] = None) -> int:
+        # Генератор партии из runner делает поиск зависящим только от
+        # зерна партии, а не от того, какие партии агент играл до нее;
+        # без него берется собственный генератор агента
+        if rng is None:
+            rng = self.rng
+        started = time.perf_counter()
+        if self.workers <= 1:
+            results = [search(sim, self.budget, rng)]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            data = snapshot.dumps(sim)
+            jobs = []
+            i = 0
+            while i < self.workers:
+                share = self.budget // self.workers
+                if i < self.budget % self.workers:
+                    share += 1
+                jobs.append((data, share, rng.getrandbits(64)))
+                i += 1
+            results = list(self._pool.map(_search_worker, jobs))
+        self.seconds += time.perf_counter() - started
+        self.rollouts += self.budget
+
+        # Самый посещаемый ход, при равенстве - с большей ценностью
+        visits = {}
+        values = {}
+        i = 0
+        while i < len(results):
+            actions = list(results[i])
+            j = 0
+            while j < len(actions):
+                count, value = results[i][actions[j]]
+                visits[actions[j]] = visits.get(actions[j], 0) + count
+                values[actions[j]] = values.get(actions[j], 0.0) + value
+                j += 1
+            i += 1
+        best = None
+        actions = list(visits)
+        i = 0
+        while i < len(actions):
+            action = actions[i]
+            if (best is None or visits[action] > visits[best] or
+                    (visits[action] == visits[best] and
+                     values[action] > values[best])):
+                best = action
+            i += 1
+        return best
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Партии бота MCTS и скорость прогонов")
+    parser.add_argument('--episodes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                        help="прогонов на одно решение")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="процессов для прогонов одного решения")
+    parser.add_argument('--max-ticks', type=int, default=DEFAULT_MAX_TICKS)
+    args = parser.parse_args()
+
+    agent = MCTSAgent(args.budget, args.workers, args.seed)
+    results = []
+    i = 0
+    while i < args.episodes:
+        results.append(run_episode(episode_seed(args.seed, i),
+                                   args.max_ticks, agent))
+        i += 1
+    agent.close()
+
+    stats = summarize(results)
+    stats['rollouts'] = agent.rollouts
+    stats['rollouts_per_second'] = agent.rollouts_per_second
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,36 @@
 import pygame
+import argparse
 import sys
-from enum import Enum
-from typing import List
-import random
 import math
+import random
+import time
+from array import array
+from collections import OrderedDict
+
+from autopilot import Autopilot
+from levels import generate_maze, read_level
+import mapfile
+import snapshot
+from profiler import FrameProfiler
+from replay import InputRecorder
+from simulation import BIG_DOT_CELL, DOT_CELL, Direction, Simulation, TileType
 
 
 # Константы игры
 WINDOW_WIDTH = 1000
 WINDOW_HEIGHT = 700
 TILE_SIZE = 25
-MAP_WIDTH = 25
-MAP_HEIGHT = 21
-FPS = 60
-MOVE_DELAY = 8  # Задержка между движениями для контроля
+FPS = 60  # Ограничение частоты кадров (0 - без ограничения)
+TICK_RATE = 60  # Шагов симуляции в секунду, от частоты кадров не зависит
+MAX_FRAME_TIME = 0.25  # Дольше этого кадра не догоняем, чтобы не зависнуть
+SPRITE_MARGIN = 4  # Запас вокруг клетки в кадрах спрайтов
+WALL_CHUNK_TILES = 32  # Размер куска кэша стен в клетках
+WALL_CHUNK_CACHE = 48  # Сколько кусков стен держать в памяти
+MAP_VIEW_TOP = 100  # Область карты на экране (между панелями UI)
+MAP_VIEW_HEIGHT = 560
+UI_PANEL_HEIGHT = 82  # Верхняя панель вместе с разделительной линией
+TEXT_CACHE_SIZE = 64  # Сколько отрисованных надписей хранить
+PROFILE_REFRESH = 30  # Раз во сколько кадров обновлять панель замеров
 
 # Цвета в стиле Pacman
 BLACK = (0, 0, 0)
@@ -30,35 +47,51 @@ ORANGE_GHOST = (255, 184, 82)
 GREEN_EXIT = (0, 255, 0)
 UI_COLOR = (255, 255, 0)
 SCORE_COLOR = (255, 255, 255)
+GHOST_COLORS = [RED_GHOST, PINK_GHOST, CYAN_GHOST, ORANGE_GHOST]
+
 
+class TextCache:
+    # Отрисованные надписи по ключу (шрифт, текст, цвет) с вытеснением
+    # давно не использованных, чтобы меняющиеся цифры не копились
 
-class TileType(Enum):
-    EMPTY = '0'
-    WALL = '1'
-    DOT = '.'
-    BIG_DOT = 'o'
-    COLLECTIBLE = 'C'
-    EXIT = 'E'
-    PLAYER = 'P'
-    ENEMY = 'X'
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
 
+    def render(self, font: pygame.font.Font, text: str,
+               color: tuple) -> pygame.Surface:
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
 
-class Direction(Enum):
-    UP = (0, -1)
-    DOWN = (0, 1)
-    LEFT = (-1, 0)
-    RIGHT = (1, 0)
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
 
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, dirty_rendering: bool = False, level=None,
+                 seed=None, offscreen: bool = False, compiled=None):
         pygame.init()
 
-        # Настройка окна
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption(
-            "🟡 PACMAN GAME 🟡 - WASD движение, ESC выход")
+        # Настройка окна. Вне экрана кадр рисуется в обычную поверхность;
+        # скрытый режим дисплея 1x1 нужен только для convert() спрайтов
+        self.offscreen = offscreen
+        if offscreen:
+            if pygame.display.get_surface() is None:
+                pygame.display.set_mode((1, 1), pygame.HIDDEN)
+            self.screen = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+            dirty_rendering = False
+        else:
+            self.screen = pygame.display.set_mode(
+                (WINDOW_WIDTH, WINDOW_HEIGHT))
+            pygame.display.set_caption(
+                "🟡 PACMAN GAME 🟡 - WASD движение, ESC выход")
 
         # Шрифты
         self.big_font = pygame.font.Font(None, 48)
@@ -67,362 +100,580 @@ class Game:
 
         self.clock = pygame.time.Clock()
 
-        # Состояние игры
+        # Состояние окна
         self.running = True
-        self.moves_count = 0
-        self.score = 0
-        self.game_won = False
-        self.game_lost = False
-
-        # Игровые объекты
-        self.player = None
-        self.enemies = []
-        self.dots = []
-        self.big_dots = []
-        self.exits = []
-
-        # Карта и позиционирование
-        self.game_map = []
-        self.map_offset_x = (WINDOW_WIDTH - MAP_WIDTH * TILE_SIZE) // 2
-        self.map_offset_y = 100
-
-        # Анимация и управление
+
+        # Симуляция мира (карта, игрок, призраки, точки, счет)
+        self.sim = Simulation(level, seed, compiled)
+
+        # Камера: карта меньше области показывается целиком по центру,
+        # большая прокручивается вслед за игроком
+        self.map_view = pygame.Rect(0, MAP_VIEW_TOP,
+                                    WINDOW_WIDTH, MAP_VIEW_HEIGHT)
+        self.map_offset_x = 0
+        self.map_offset_y = 0
+        self.visible_cells = (0, 0, -1, -1)
+        self._update_camera()
+
+        # Кэш статического слоя стен
+        self.wall_chunks = {}
+        self.wall_layer_source = None
+        self.wall_layer_version = -1
+        self.wall_layer_columns = 0
+
+        # Режим грязных прямоугольников: обновляем только изменившееся
+        self.dirty_rendering = dirty_rendering
+        self.full_redraw_pending = True
+        self.dirty_rects = []
+        self.ui_values = None
+        self.dirty_camera = None
+        self.ui_zones = (
+            pygame.Rect(0, 0, WINDOW_WIDTH, MAP_VIEW_TOP + 10),
+            pygame.Rect(0, WINDOW_HEIGHT - 60, WINDOW_WIDTH, 60))
+
+        # Кэш надписей и готовый слой верхней панели
+        self.text_cache = TextCache(TEXT_CACHE_SIZE)
+        self.ui_panel = pygame.Surface((WINDOW_WIDTH, UI_PANEL_HEIGHT))
+        self.ui_panel_values = None
+
+        # Анимация
         self.animation_timer = 0
-        self.move_timer = 0
-        self.last_direction = None
-        self.pending_direction = None
-
-        # Визуальные эффекты
-        self.screen_flash = 0
-        self.victory_animation = 0
-
-        self._load_classic_map()
-        self._find_game_objects()
-
-    def _load_classic_map(self):
-        classic_map = [
-            "1111111111111111111111111",
-            "1............1..........1",
-            "1o111.111111.1.11111.11..1",
-            "1.......................1",
-            "1.111.1.111111111.1.111.1",
-            "1.....1.....1.....1.....1",
-            "1111.11111.111.11111.1111",
-            "1......1...X.X.X.1......1",
-            "1.111.1111.....1111.111.1",
-            "1.......................1",
-            "1.1111.1111.1.1111.1111.1",
-            "1.....C...1.P.1...C.....1",
-            "1111111.1.1...1.1.1111111",
-            "1.......1.1.1.1.1.......1",
-            "1.1111.1...111...1.1111.1",
-            "1.1..1.1..........1.1...1",
-            "1.1..1.1.........1......1",
-            "1.1..1............1.....1",
-            "1......1.........1......1",
-            "1o111111..11.11..111111..1",
-            "1.........1.E.1.........1",
-            "1111111111111111111111111"
-        ]
-
-        self.game_map = []
-        i = 0
-        while i < len(classic_map):
-            row = []
-            j = 0
-            while j < len(classic_map[i]):
-                row.append(classic_map[i][j])
-                j += 1
-            self.game_map.append(row)
-            i += 1
+        self._build_sprite_atlas()
 
-    def _find_game_objects(self):
-        self.dots = []
-        self.big_dots = []
-        self.exits = []
-        self.enemies = []
+        # Фиксированный шаг: позиции до последнего тика и доля следующего
+        # тика для плавного движения между ними
+        self.fps = FPS
+        self.previous_positions = None
+        self.render_alpha = 1.0
 
-        y = 0
-        while y < len(self.game_map):
-            x = 0
-            while x < len(self.game_map[y]):
-                tile = self.game_map[y][x]
-                if tile == TileType.PLAYER.value:
-                    self.player = Player(x, y)
-                    self.game_map[y][x] = TileType.EMPTY.value
-                elif tile == TileType.DOT.value:
-                    self.dots.append((x, y))
-                elif tile == 'o':  # Большие точки
-                    self.big_dots.append((x, y))
-                    self.game_map[y][x] = TileType.EMPTY.value
-                elif tile == TileType.COLLECTIBLE.value:
-                    self.dots.append((x, y))  # Превращаем в обычные точки
-                    self.game_map[y][x] = TileType.EMPTY.value
-                elif tile == TileType.EXIT.value:
-                    self.exits.append((x, y))
-                elif tile == TileType.ENEMY.value:
-                    # Создаем разноцветных призраков
-                    ghost_color = len(self.enemies) % 4
-                    self.enemies.append(Enemy(x, y, ghost_color))
-                    self.game_map[y][x] = TileType.EMPTY.value
-                x += 1
-            y += 1
+        # Запись ввода в журнал или воспроизведение записанного
+        self.recorder = None
+        self.playback = None
 
-    def handle_input(self):
-        keys = pygame.key.get_pressed()
-
-        # Определяем желаемое направление
-        new_direction = None
-        if keys[pygame.K_w] or keys[pygame.K_UP]:
-            new_direction = Direction.UP
-        elif keys[pygame.K_s] or keys[pygame.K_DOWN]:
-            new_direction = Direction.DOWN
-        elif keys[pygame.K_a] or keys[pygame.K_LEFT]:
-            new_direction = Direction.LEFT
-        elif keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-            new_direction = Direction.RIGHT
-
-        # Сохраняем направление для следующего движения
-        if new_direction:
-            self.pending_direction = new_direction
-
-        # Двигаемся только через определенные интервалы
-        if self.move_timer <= 0 and self.pending_direction:
-            if self._can_move_in_direction(self.pending_direction):
-                self._move_player(self.pending_direction)
-                self.move_timer = MOVE_DELAY
-                self.last_direction = self.pending_direction
-            # Если не можем идти в желаемом направлении, продолжаем в текущем
-            elif (self.last_direction and
-                  self._can_move_in_direction(self.last_direction)):
-                self._move_player(self.last_direction)
-                self.move_timer = MOVE_DELAY
-
-    def _can_move_in_direction(self, direction: Direction) -> bool:
-        if not self.player:
-            return False
-
-        new_x = self.player.x + direction.value[0]
-        new_y = self.player.y + direction.value[1]
-
-        # Проверка границ
-        if (new_x < 0 or new_x >= MAP_WIDTH or
-                new_y < 0 or new_y >= MAP_HEIGHT):
-            return False
-
-        # Проверка стен
-        return self.game_map[new_y][new_x] != TileType.WALL.value
-
-    def _move_player(self, direction: Direction):
-        if not self.player or self.game_won or self.game_lost:
-            return
+        # Демо-режим: вместо клавиатуры ходит автопилот
+        self.autopilot = None
 
-        new_x = self.player.x + direction.value[0]
-        new_y = self.player.y + direction.value[1]
+        # Быстрое сохранение состояния (F5) и откат к нему (F9)
+        self.quicksave = None
 
-        # Перемещение игрока
-        self.player.x = new_x
-        self.player.y = new_y
-        self.player.direction = direction
-        self.moves_count += 1
+        # Профилировщик фаз кадра (включается enable_profiler, панель - F3)
+        self.profiler = None
+        self.profile_overlay = False
+        self.profile_panel = None
 
-        # Проверка сбора точек
-        self._check_dots()
-        self._check_big_dots()
+    def handle_input(self):
+        if self.playback is not None:
+            self.sim.apply_input(self.playback.next_input())
+            return
 
-        # Проверка выхода
-        self._check_exits()
+        # Определяем желаемое направление
+        new_direction = None
+        if self.autopilot is not None:
+            new_direction = self.autopilot(self.sim)
+        else:
+            keys = pygame.key.get_pressed()
+            if keys[pygame.K_w] or keys[pygame.K_UP]:
+                new_direction = Direction.UP
+            elif keys[pygame.K_s] or keys[pygame.K_DOWN]:
+                new_direction = Direction.DOWN
+            elif keys[pygame.K_a] or keys[pygame.K_LEFT]:
+                new_direction = Direction.LEFT
+            elif keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+                new_direction = Direction.RIGHT
+
+        if self.recorder is not None:
+            self.recorder.record(new_direction)
+        self.sim.apply_input(new_direction)
 
-        # Проверка столкновения с врагами
-        self._check_enemy_collision()
+    def update_enemies(self):
+        self.sim.update_enemies()
 
-    def _check_dots(self):
-        i = 0
-        while i < len(self.dots):
-            dot_x, dot_y = self.dots[i]
-            if self.player.x == dot_x and self.player.y == dot_y:
-                self.dots.pop(i)
-                self.score += 10
-            else:
-                i += 1
+    def update_timers(self):
+        self.sim.update_timers()
+
+    def tick(self):
+        # Один шаг симуляции фиксированной длины
+        self._remember_positions()
+        self.handle_input()
+        self.update_enemies()
+        self.update_timers()
+
+        # Анимация тоже идет по тикам, а не по кадрам
+        self.animation_timer += 1
+
+    def quickload(self):
+        # Откат ломает запись и повтор ввода, поэтому там он отключен
+        if (self.quicksave is None or self.recorder is not None or
+                self.playback is not None):
+            return
+        self.sim = snapshot.loads(self.quicksave)
+        self.previous_positions = None
+        self.full_redraw_pending = True
+
+    def _remember_positions(self):
+        # Клетки до тика: призраки - копиями столбцов хранилища, без
+        # объектов Enemy
+        sim = self.sim
+        player = (sim.player.x, sim.player.y) if sim.player else None
+        self.previous_positions = (player, array('i', sim.ghosts.x),
+                                   array('i', sim.ghosts.y))
+
+    def _previous_cell(self, index: int, x: int, y: int):
+        # Клетка, из которой спрайт сдвинулся за последний тик, или None,
+        # если он стоит на месте или прыгнул дальше соседней клетки
+        if self.previous_positions is None:
+            return None
+        player, xs, ys = self.previous_positions
+        if player is not None:
+            index -= 1
+        if index < 0:
+            previous_x, previous_y = player
+        elif index < len(xs):
+            previous_x = xs[index]
+            previous_y = ys[index]
+        else:
+            return None
+        if abs(previous_x - x) + abs(previous_y - y) != 1:
+            return None
+        return previous_x, previous_y
+
+    def _sprite_position(self, index: int, x: int, y: int) -> tuple:
+        # Левый верхний угол кадра спрайта между прошлой и текущей клеткой
+        screen_x = self.map_offset_x + x * TILE_SIZE - SPRITE_MARGIN
+        screen_y = self.map_offset_y + y * TILE_SIZE - SPRITE_MARGIN
+        previous = self._previous_cell(index, x, y)
+        if previous is not None and self.render_alpha < 1.0:
+            back = (1.0 - self.render_alpha) * TILE_SIZE
+            screen_x -= int(round((x - previous[0]) * back))
+            screen_y -= int(round((y - previous[1]) * back))
+        return screen_x, screen_y
+
+    def _update_camera(self):
+        sim = self.sim
+        view = self.map_view
+        map_width = sim.map_width * TILE_SIZE
+        map_height = len(sim.game_map) * TILE_SIZE
+
+        if map_width <= view.width:
+            self.map_offset_x = view.x + (view.width - map_width) // 2
+        else:
+            center = sim.player.x * TILE_SIZE + TILE_SIZE // 2
+            self.map_offset_x = min(view.left, max(
+                view.right - map_width, view.centerx - center))
 
-    def _check_big_dots(self):
-        i = 0
-        while i < len(self.big_dots):
-            dot_x, dot_y = self.big_dots[i]
-            if self.player.x == dot_x and self.player.y == dot_y:
-                self.big_dots.pop(i)
-                self.score += 50
-                # Эффект съедания большой точки
-                self.screen_flash = 10
-            else:
-                i += 1
+        if map_height <= view.height:
+            self.map_offset_y = view.y
+        else:
+            center = sim.player.y * TILE_SIZE + TILE_SIZE // 2
+            self.map_offset_y = min(view.top, max(
+                view.bottom - map_height, view.centery - center))
 
-    def _check_exits(self):
-        # Выход активен только когда все точки собраны
-        total_dots = len(self.dots) + len(self.big_dots)
-        if total_dots == 0:
-            i = 0
-            while i < len(self.exits):
-                exit_x, exit_y = self.exits[i]
-                if self.player.x == exit_x and self.player.y == exit_y:
-                    self.game_won = True
-                    self.victory_animation = 120  # 2 секунды анимации
-                    break
-                i += 1
+        # Видимые клетки с запасом в одну клетку для выступающих спрайтов
+        self.visible_cells = (
+            (view.left - self.map_offset_x) // TILE_SIZE - 1,
+            (view.top - self.map_offset_y) // TILE_SIZE - 1,
+            (view.right - 1 - self.map_offset_x) // TILE_SIZE + 1,
+            (view.bottom - 1 - self.map_offset_y) // TILE_SIZE + 1)
 
-    def _check_enemy_collision(self):
-        i = 0
-        while i < len(self.enemies):
-            enemy = self.enemies[i]
-            if self.player.x == enemy.x and self.player.y == enemy.y:
-                self.game_lost = True
-                break
-            i += 1
+    def _is_visible(self, x: int, y: int) -> bool:
+        first_x, first_y, last_x, last_y = self.visible_cells
+        return first_x <= x <= last_x and first_y <= y <= last_y
 
-    def update_enemies(self):
-        if self.game_won or self.game_lost:
+    def render(self):
+        self._update_camera()
+        if self.dirty_rendering:
+            self._render_dirty()
             return
 
-        i = 0
-        while i < len(self.enemies):
-            enemy = self.enemies[i]
-            enemy.update(self.game_map, self.player, MAP_WIDTH, MAP_HEIGHT)
-            i += 1
-
-    def update_timers(self):
-        if self.move_timer > 0:
-            self.move_timer -= 1
-
-        if self.screen_flash > 0:
-            self.screen_flash -= 1
+        self._render_frame()
+        if not self.offscreen:
+            pygame.display.flip()
 
-        if self.victory_animation > 0:
-            self.victory_animation -= 1
-
-    def render(self):
-        if self.screen_flash > 0:
+    def _render_frame(self):
+        if self.sim.screen_flash > 0:
             self.screen.fill(WHITE)
         else:
             self.screen.fill(BLACK)
 
-        # Отрисовка игровых элементов
+        # Отрисовка игровых элементов (только внутри области карты)
+        self.screen.set_clip(self.map_view)
         self._render_map()
         self._render_dots()
         self._render_enemies()
         self._render_player()
+        self.screen.set_clip(None)
 
         # UI всегда сверху
         self._render_ui()
+        if self.profile_overlay:
+            self._render_profile_overlay()
+
+    def _render_dirty(self):
+        sim = self.sim
+        effects = sim.screen_flash > 0 or sim.game_won or sim.game_lost
+        camera = (self.map_offset_x, self.map_offset_y)
+        if effects or self.full_redraw_pending or camera != self.dirty_camera:
+            # Вспышка, финальные сообщения и сдвиг камеры меняют весь
+            # экран, следующий кадр после эффектов тоже рисуем целиком
+            self._render_frame()
+            pygame.display.flip()
+            self.full_redraw_pending = effects
+            self.dirty_camera = camera
+            self.dirty_rects = self._collect_sprite_rects()
+            self.ui_values = self._ui_values()
+            return
+
+        # Старые и новые места спрайтов; собранная точка всегда
+        # под игроком, поэтому отдельно ее не отслеживаем
+        rects = self._collect_sprite_rects()
+        regions = rects + self.dirty_rects
+
+        # Полосы интерфейса перерисовываются только целиком: сглаженный
+        # текст нельзя накладывать повторно поверх самого себя.
+        # Верхняя полоса включает мигающую надпись о выходе
+        top_zone, bottom_zone = self.ui_zones
+        values = self._ui_values()
+        zones = []
+        if (values != self.ui_values or values[2] == 0 or
+                top_zone.collidelist(regions) != -1):
+            zones.append(top_zone)
+        if bottom_zone.collidelist(regions) != -1:
+            zones.append(bottom_zone)
+        self.ui_values = values
+        regions.extend(zones)
+
+        self._redraw_regions(regions)
+        self.screen.set_clip(self.map_view)
+        self._render_enemies()
+        self._render_player()
+
+        # UI всегда сверху
+        i = 0
+        while i < len(zones):
+            self.screen.set_clip(zones[i])
+            self._render_ui()
+            i += 1
+        self.screen.set_clip(None)
+        if self.profile_overlay:
+            regions.append(self._render_profile_overlay())
+
+        pygame.display.update(regions)
+        self.dirty_rects = rects
+
+    def _ui_values(self) -> tuple:
+        sim = self.sim
+        return (sim.score, sim.moves_count, sim.collectibles.total)
+
+    def _cell_rect(self, x: int, y: int) -> pygame.Rect:
+        # Клетка с запасом: голова призрака выступает за ее край
+        return pygame.Rect(self.map_offset_x + x * TILE_SIZE - SPRITE_MARGIN,
+                           self.map_offset_y + y * TILE_SIZE - SPRITE_MARGIN,
+                           TILE_SIZE + SPRITE_MARGIN * 2,
+                           TILE_SIZE + SPRITE_MARGIN * 2)
+
+    def _collect_sprite_rects(self) -> list:
+        sim = self.sim
+        rects = []
+        if sim.player:
+            self._add_sprite_rects(rects, 0, sim.player.x, sim.player.y)
+
+        first_index = 1 if sim.player else 0
+        store = sim.ghosts
+        visible = store.within(*self.visible_cells)
+        i = 0
+        while i < len(visible):
+            ghost = visible[i]
+            self._add_sprite_rects(rects, first_index + ghost,
+                                   store.x[ghost], store.y[ghost])
+            i += 1
 
-        pygame.display.flip()
+        # Пульсирующие большие точки
+        big_dots = sim.collectibles.positions(BIG_DOT_CELL,
+                                              *self.visible_cells)
+        i = 0
+        while i < len(big_dots):
+            rects.append(self._cell_rect(*big_dots[i]))
+            i += 1
+
+        # Мигающие активные выходы
+        if sim.collectibles.total == 0:
+            i = 0
+            while i < len(sim.exits):
+                if self._is_visible(*sim.exits[i]):
+                    rects.append(self._cell_rect(*sim.exits[i]))
+                i += 1
+        return rects
+
+    def _add_sprite_rects(self, rects: list, index: int, x: int, y: int):
+        # Спрайт между клетками задевает обе: текущую и прошлую
+        rects.append(self._cell_rect(x, y))
+        previous = self._previous_cell(index, x, y)
+        if previous is not None and self.render_alpha < 1.0:
+            rects.append(self._cell_rect(*previous))
+
+    def _redraw_regions(self, regions: list):
+        # Восстанавливаем фон, стены, точки и выходы внутри каждой области
+        sim = self.sim
+        store = sim.collectibles
+        exits = set(sim.exits)
+
+        i = 0
+        while i < len(regions):
+            rect = regions[i]
+            # Без обрезки pygame сдвигает вылезающий за левый или верхний
+            # край прямоугольник внутрь экрана, поэтому обрезаем сами
+            self.screen.set_clip(None)
+            self.screen.fill(BLACK, rect.clip(self.screen.get_rect()))
+            self.screen.set_clip(rect.clip(self.map_view))
+            self._render_map()
+
+            first_x = (rect.left - self.map_offset_x) // TILE_SIZE
+            last_x = (rect.right - 1 - self.map_offset_x) // TILE_SIZE
+            y = (rect.top - self.map_offset_y) // TILE_SIZE
+            last_y = (rect.bottom - 1 - self.map_offset_y) // TILE_SIZE
+            while y <= last_y:
+                x = first_x
+                while x <= last_x:
+                    kind = store.get(x, y)
+                    if kind == DOT_CELL:
+                        self._draw_dot(x, y)
+                    elif kind == BIG_DOT_CELL:
+                        self._draw_big_dot(x, y)
+                    elif (x, y) in exits:
+                        self._draw_exit(x, y, store.total)
+                    x += 1
+                y += 1
+            i += 1
+        self.screen.set_clip(None)
 
     def _render_map(self):
+        # Стены не меняются, поэтому рисуем их один раз в кэш-слои
+        # кусками по WALL_CHUNK_TILES клеток и дальше только копируем.
+        # Копируются только куски, попадающие в видимую область
+        self._sync_wall_layer()
+        chunk_size = WALL_CHUNK_TILES * TILE_SIZE
+        first_x, first_y, last_x, last_y = self.visible_cells
+        first_chunk_x = max(0, first_x) // WALL_CHUNK_TILES
+        last_chunk_x = min(last_x, self.wall_layer_columns - 1)
+        last_chunk_y = min(last_y, len(self.sim.game_map) - 1)
+
+        visible = []
+        chunk_y = max(0, first_y) // WALL_CHUNK_TILES
+        while chunk_y * WALL_CHUNK_TILES <= last_chunk_y:
+            chunk_x = first_chunk_x
+            while chunk_x * WALL_CHUNK_TILES <= last_chunk_x:
+                surface = self._get_wall_chunk(chunk_x, chunk_y)
+                self.screen.blit(surface,
+                                 (self.map_offset_x + chunk_x * chunk_size,
+                                  self.map_offset_y + chunk_y * chunk_size))
+                visible.append((chunk_x, chunk_y))
+                chunk_x += 1
+            chunk_y += 1
+
+        # На больших картах не храним куски, ушедшие за экран
+        if len(self.wall_chunks) > WALL_CHUNK_CACHE:
+            kept = {}
+            i = 0
+            while i < len(visible):
+                kept[visible[i]] = self.wall_chunks[visible[i]]
+                i += 1
+            self.wall_chunks = kept
+
+    def _sync_wall_layer(self):
+        # Пересобираем кэш только если карта сменилась
+        if (self.wall_layer_source is self.sim.game_map and
+                self.wall_layer_version == self.sim.map_version):
+            return
+
+        self.wall_chunks = {}
+        self.wall_layer_source = self.sim.game_map
+        self.wall_layer_version = self.sim.map_version
+        self.wall_layer_columns = 0
         y = 0
-        while y < len(self.game_map):
-            x = 0
-            while x < len(self.game_map[y]):
-                tile = self.game_map[y][x]
-                screen_x = self.map_offset_x + x * TILE_SIZE
-                screen_y = self.map_offset_y + y * TILE_SIZE
-
-                if tile == TileType.WALL.value:
-                    # Рисуем стену в стиле Pacman с объемом
-                    wall_rect = pygame.Rect(screen_x, screen_y,
-                                            TILE_SIZE, TILE_SIZE)
-                    pygame.draw.rect(self.screen, BLUE_WALL, wall_rect)
-
-                    # Добавляем светлую границу для объема
-                    pygame.draw.rect(self.screen, LIGHT_BLUE, wall_rect, 1)
-
-                    # Внутренняя подсветка
-                    inner_rect = pygame.Rect(screen_x + 2, screen_y + 2,
-                                             TILE_SIZE - 4, TILE_SIZE - 4)
-                    pygame.draw.rect(self.screen, LIGHT_BLUE, inner_rect, 1)
+        while y < len(self.sim.game_map):
+            self.wall_layer_columns = max(self.wall_layer_columns,
+                                          len(self.sim.game_map[y]))
+            y += 1
+
+    def _get_wall_chunk(self, chunk_x: int, chunk_y: int) -> pygame.Surface:
+        key = (chunk_x, chunk_y)
+        surface = self.wall_chunks.get(key)
+        if surface is not None:
+            return surface
+
+        game_map = self.sim.game_map
+        start_x = chunk_x * WALL_CHUNK_TILES
+        start_y = chunk_y * WALL_CHUNK_TILES
+        end_x = min(start_x + WALL_CHUNK_TILES, self.wall_layer_columns)
+        end_y = min(start_y + WALL_CHUNK_TILES, len(game_map))
+
+        # Черный фон прозрачен, чтобы под стенами была видна вспышка
+        surface = pygame.Surface(((end_x - start_x) * TILE_SIZE,
+                                  (end_y - start_y) * TILE_SIZE)).convert()
+        surface.fill(BLACK)
+        surface.set_colorkey(BLACK, pygame.RLEACCEL)
+
+        y = start_y
+        while y < end_y:
+            x = start_x
+            while x < min(end_x, len(game_map[y])):
+                if game_map[y][x] == TileType.WALL.value:
+                    self._draw_wall(surface, (x - start_x) * TILE_SIZE,
+                                    (y - start_y) * TILE_SIZE)
                 x += 1
             y += 1
 
+        self.wall_chunks[key] = surface
+        return surface
+
+    def _draw_wall(self, surface: pygame.Surface, screen_x: int,
+                   screen_y: int):
+        # Рисуем стену в стиле Pacman с объемом
+        wall_rect = pygame.Rect(screen_x, screen_y, TILE_SIZE, TILE_SIZE)
+        pygame.draw.rect(surface, BLUE_WALL, wall_rect)
+
+        # Добавляем светлую границу для объема
+        pygame.draw.rect(surface, LIGHT_BLUE, wall_rect, 1)
+
+        # Внутренняя подсветка
+        inner_rect = pygame.Rect(screen_x + 2, screen_y + 2,
+                                 TILE_SIZE - 4, TILE_SIZE - 4)
+        pygame.draw.rect(surface, LIGHT_BLUE, inner_rect, 1)
+
     def _render_dots(self):
+        store = self.sim.collectibles
+
         # Обычные точки
+        dots = store.positions(DOT_CELL, *self.visible_cells)
         i = 0
-        while i < len(self.dots):
-            x, y = self.dots[i]
-            screen_x = self.map_offset_x + x * TILE_SIZE + TILE_SIZE // 2
-            screen_y = self.map_offset_y + y * TILE_SIZE + TILE_SIZE // 2
-            pygame.draw.circle(self.screen, DOT_YELLOW,
-                               (screen_x, screen_y), 2)
+        while i < len(dots):
+            x, y = dots[i]
+            self._draw_dot(x, y)
             i += 1
 
         # Большие точки с анимацией
+        dots = store.positions(BIG_DOT_CELL, *self.visible_cells)
         i = 0
-        while i < len(self.big_dots):
-            x, y = self.big_dots[i]
-            screen_x = self.map_offset_x + x * TILE_SIZE + TILE_SIZE // 2
-            screen_y = self.map_offset_y + y * TILE_SIZE + TILE_SIZE // 2
-
-            # Пульсирующий эффект
-            pulse = math.sin(self.animation_timer * 0.2) * 0.3 + 0.7
-            radius = int(8 * pulse)
-            pygame.draw.circle(self.screen, BIG_DOT_YELLOW,
-                               (screen_x, screen_y), radius)
+        while i < len(dots):
+            x, y = dots[i]
+            self._draw_big_dot(x, y)
             i += 1
 
         # Выходы
+        total_dots = store.total
         i = 0
-        while i < len(self.exits):
-            x, y = self.exits[i]
-            screen_x = self.map_offset_x + x * TILE_SIZE
-            screen_y = self.map_offset_y + y * TILE_SIZE
-
-            # Выход активен только когда все точки собраны
-            total_dots = len(self.dots) + len(self.big_dots)
-            if total_dots == 0:
-                # Активный выход - мигающий зеленый
-                alpha = math.sin(self.animation_timer * 0.3) * 0.5 + 0.5
-                color = (0, int(255 * alpha), 0)
-            else:
-                # Неактивный выход - серый
-                color = (64, 64, 64)
+        while i < len(self.sim.exits):
+            x, y = self.sim.exits[i]
+            if self._is_visible(x, y):
+                self._draw_exit(x, y, total_dots)
+            i += 1
+
+    def _draw_dot(self, x: int, y: int):
+        screen_x = self.map_offset_x + x * TILE_SIZE + TILE_SIZE // 2
+        screen_y = self.map_offset_y + y * TILE_SIZE + TILE_SIZE // 2
+        pygame.draw.circle(self.screen, DOT_YELLOW, (screen_x, screen_y), 2)
+
+    def _draw_big_dot(self, x: int, y: int):
+        screen_x = self.map_offset_x + x * TILE_SIZE + TILE_SIZE // 2
+        screen_y = self.map_offset_y + y * TILE_SIZE + TILE_SIZE // 2
+
+        # Пульсирующий эффект
+        pulse = math.sin(self.animation_timer * 0.2) * 0.3 + 0.7
+        radius = int(8 * pulse)
+        pygame.draw.circle(self.screen, BIG_DOT_YELLOW,
+                           (screen_x, screen_y), radius)
+
+    def _draw_exit(self, x: int, y: int, total_dots: int):
+        screen_x = self.map_offset_x + x * TILE_SIZE
+        screen_y = self.map_offset_y + y * TILE_SIZE
+
+        # Выход активен только когда все точки собраны
+        if total_dots == 0:
+            # Активный выход - мигающий зеленый
+            alpha = math.sin(self.animation_timer * 0.3) * 0.5 + 0.5
+            color = (0, int(255 * alpha), 0)
+        else:
+            # Неактивный выход - серый
+            color = (64, 64, 64)
 
-            exit_rect = pygame.Rect(screen_x + 3, screen_y + 3,
-                                    TILE_SIZE - 6, TILE_SIZE - 6)
-            pygame.draw.rect(self.screen, color, exit_rect)
-            pygame.draw.rect(self.screen, WHITE, exit_rect, 2)
+        exit_rect = pygame.Rect(screen_x + 3, screen_y + 3,
+                                TILE_SIZE - 6, TILE_SIZE - 6)
+        pygame.draw.rect(self.screen, color, exit_rect)
+        pygame.draw.rect(self.screen, WHITE, exit_rect, 2)
+
+    def _build_sprite_atlas(self):
+        # Все кадры Pacman и призраков рисуются один раз при запуске,
+        # дальше каждый спрайт - одно копирование поверхности
+        directions = [Direction.UP, Direction.DOWN,
+                      Direction.LEFT, Direction.RIGHT]
+        center = SPRITE_MARGIN + TILE_SIZE // 2
+
+        self.player_sprites = {}
+        i = 0
+        while i < len(directions):
+            self.player_sprites[(directions[i], True)] = self._make_sprite(
+                self._draw_pacman, center, center, directions[i], True)
+            self.player_sprites[(directions[i], False)] = self._make_sprite(
+                self._draw_pacman, center, center, directions[i], False)
             i += 1
 
-    def _render_player(self):
-        if not self.player:
-            return
+        # Зрачки: по центру или смещены в сторону игрока
+        pupil_offsets = [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)]
+        self.ghost_sprites = {}
+        color = 0
+        while color < len(GHOST_COLORS):
+            i = 0
+            while i < len(pupil_offsets):
+                offset_x, offset_y = pupil_offsets[i]
+                self.ghost_sprites[(color, offset_x, offset_y)] = (
+                    self._make_sprite(self._draw_ghost, center, center,
+                                      GHOST_COLORS[color],
+                                      offset_x, offset_y))
+                i += 1
+            color += 1
 
-        screen_x = (self.map_offset_x + self.player.x * TILE_SIZE +
-                    TILE_SIZE // 2)
-        screen_y = (self.map_offset_y + self.player.y * TILE_SIZE +
-                    TILE_SIZE // 2)
+    def _make_sprite(self, draw, *args) -> pygame.Surface:
+        # Прозрачный фон: черные рот и глаза остаются видны на вспышке
+        size = TILE_SIZE + SPRITE_MARGIN * 2
+        surface = pygame.Surface((size, size), pygame.SRCALPHA).convert_alpha()
+        surface.fill((0, 0, 0, 0))
+        draw(surface, *args)
+        return surface
 
-        # Размер Pacman
-        radius = TILE_SIZE // 2 - 2
+    def _render_player(self):
+        if not self.sim.player:
+            return
 
         # Анимация рта
         mouth_cycle = (self.animation_timer % 20) / 20.0
         mouth_open = math.sin(mouth_cycle * math.pi * 2) > 0
 
+        player = self.sim.player
+        sprite = self.player_sprites[(player.direction, mouth_open)]
+        self.screen.blit(sprite, self._sprite_position(0, player.x, player.y))
+
+    def _draw_pacman(self, surface: pygame.Surface, screen_x: int,
+                     screen_y: int, direction: Direction, mouth_open: bool):
+        # Размер Pacman
+        radius = TILE_SIZE // 2 - 2
+
         if mouth_open:
             # Открытый рот
             mouth_angle = 60  # градусы
 
             # Направление рта в зависимости от движения
             start_angle = 0
-            if self.player.direction == Direction.RIGHT:
+            if direction == Direction.RIGHT:
                 start_angle = -mouth_angle // 2
-            elif self.player.direction == Direction.LEFT:
+            elif direction == Direction.LEFT:
                 start_angle = 180 - mouth_angle // 2
-            elif self.player.direction == Direction.UP:
+            elif direction == Direction.UP:
                 start_angle = 270 - mouth_angle // 2
-            elif self.player.direction == Direction.DOWN:
+            elif direction == Direction.DOWN:
                 start_angle = 90 - mouth_angle // 2
 
             # Основной круг
-            pygame.draw.circle(self.screen, PACMAN_YELLOW,
+            pygame.draw.circle(surface, PACMAN_YELLOW,
                                (screen_x, screen_y), radius)
 
             # Вырезаем рот
@@ -442,81 +693,40 @@ class Game:
                 j += 1
 
             if len(mouth_points) > 2:
-                pygame.draw.polygon(self.screen, BLACK, mouth_points)
+                pygame.draw.polygon(surface, BLACK, mouth_points)
         else:
             # Закрытый рот - просто круг
-            pygame.draw.circle(self.screen, PACMAN_YELLOW,
+            pygame.draw.circle(surface, PACMAN_YELLOW,
                                (screen_x, screen_y), radius)
 
         # Глаз
         eye_x = screen_x - 3
         eye_y = screen_y - 5
-        if self.player.direction == Direction.LEFT:
+        if direction == Direction.LEFT:
             eye_x = screen_x + 3
 
-        pygame.draw.circle(self.screen, BLACK, (eye_x, eye_y), 2)
+        pygame.draw.circle(surface, BLACK, (eye_x, eye_y), 2)
 
     def _render_enemies(self):
-        ghost_colors = [RED_GHOST, PINK_GHOST, CYAN_GHOST, ORANGE_GHOST]
-
+        # Отсечение по столбцам хранилища: за кадр трогаем только
+        # призраков в окне
+        first_index = 1 if self.sim.player else 0
+        store = self.sim.ghosts
+        visible = store.within(*self.visible_cells)
         i = 0
-        while i < len(self.enemies):
-            enemy = self.enemies[i]
-            color = ghost_colors[enemy.color % len(ghost_colors)]
-
-            screen_x = (self.map_offset_x + enemy.x * TILE_SIZE +
-                        TILE_SIZE // 2)
-            screen_y = (self.map_offset_y + enemy.y * TILE_SIZE +
-                        TILE_SIZE // 2)
-
-            # Размер призрака
-            size = TILE_SIZE // 2 - 1
-
-            # Тело призрака (полукруг сверху + прямоугольник)
-            body_rect = pygame.Rect(screen_x - size, screen_y - size,
-                                    size * 2, size * 2)
-            pygame.draw.rect(self.screen, color, body_rect)
-            pygame.draw.circle(self.screen, color,
-                               (screen_x, screen_y - size // 2), size)
-
-            # Зубчатый низ призрака
-            teeth_y = screen_y + size
-            num_teeth = 4
-            tooth_width = (size * 2) // num_teeth
-
-            j = 0
-            while j < num_teeth:
-                tooth_x = screen_x - size + j * tooth_width
-                if j % 2 == 0:
-                    tooth_points = [
-                        (tooth_x, teeth_y),
-                        (tooth_x + tooth_width // 2,
-                         teeth_y - tooth_width // 2),
-                        (tooth_x + tooth_width, teeth_y)
-                    ]
-                    pygame.draw.polygon(self.screen, color, tooth_points)
-                j += 1
-
-            # Глаза призрака
-            eye_size = 4
-            left_eye_x = screen_x - size // 2
-            right_eye_x = screen_x + size // 2
-            eyes_y = screen_y - size // 2
-
-            # Белки глаз
-            pygame.draw.circle(self.screen, WHITE, (left_eye_x, eyes_y),
-                               eye_size)
-            pygame.draw.circle(self.screen, WHITE, (right_eye_x, eyes_y),
-                               eye_size)
+        while i < len(visible):
+            ghost = visible[i]
+            i += 1
+            x = store.x[ghost]
+            y = store.y[ghost]
 
             # Зрачки (смотрят на игроку если он рядом)
-            pupil_size = 2
             pupil_offset = 1
 
-            if enemy.chase_mode and self.player:
+            if store.chase[ghost] and self.sim.player:
                 # Зрачки следят за игроком
-                dx = self.player.x - enemy.x
-                dy = self.player.y - enemy.y
+                dx = self.sim.player.x - x
+                dy = self.sim.player.y - y
                 if abs(dx) > abs(dy):
                     pupil_x_offset = pupil_offset if dx > 0 else -pupil_offset
                     pupil_y_offset = 0
@@ -526,55 +736,88 @@ class Game:
             else:
                 pupil_x_offset, pupil_y_offset = 0, 0
 
-            pygame.draw.circle(self.screen, BLACK,
-                               (left_eye_x + pupil_x_offset,
-                                eyes_y + pupil_y_offset),
-                               pupil_size)
-            pygame.draw.circle(self.screen, BLACK,
-                               (right_eye_x + pupil_x_offset,
-                                eyes_y + pupil_y_offset),
-                               pupil_size)
-            i += 1
+            sprite = self.ghost_sprites[(store.color[ghost] %
+                                         len(GHOST_COLORS),
+                                         pupil_x_offset, pupil_y_offset)]
+            self.screen.blit(sprite, self._sprite_position(
+                first_index + ghost, x, y))
+
+    def _draw_ghost(self, surface: pygame.Surface, screen_x: int,
+                    screen_y: int, color: tuple, pupil_x_offset: int,
+                    pupil_y_offset: int):
+        # Размер призрака
+        size = TILE_SIZE // 2 - 1
+
+        # Тело призрака (полукруг сверху + прямоугольник)
+        body_rect = pygame.Rect(screen_x - size, screen_y - size,
+                                size * 2, size * 2)
+        pygame.draw.rect(surface, color, body_rect)
+        pygame.draw.circle(surface, color,
+                           (screen_x, screen_y - size // 2), size)
+
+        # Зубчатый низ призрака
+        teeth_y = screen_y + size
+        num_teeth = 4
+        tooth_width = (size * 2) // num_teeth
+
+        j = 0
+        while j < num_teeth:
+            tooth_x = screen_x - size + j * tooth_width
+            if j % 2 == 0:
+                tooth_points = [
+                    (tooth_x, teeth_y),
+                    (tooth_x + tooth_width // 2,
+                     teeth_y - tooth_width // 2),
+                    (tooth_x + tooth_width, teeth_y)
+                ]
+                pygame.draw.polygon(surface, color, tooth_points)
+            j += 1
+
+        # Глаза призрака
+        eye_size = 4
+        left_eye_x = screen_x - size // 2
+        right_eye_x = screen_x + size // 2
+        eyes_y = screen_y - size // 2
+
+        # Белки глаз
+        pygame.draw.circle(surface, WHITE, (left_eye_x, eyes_y), eye_size)
+        pygame.draw.circle(surface, WHITE, (right_eye_x, eyes_y), eye_size)
+
+        # Зрачки
+        pupil_size = 2
+        pygame.draw.circle(surface, BLACK,
+                           (left_eye_x + pupil_x_offset,
+                            eyes_y + pupil_y_offset),
+                           pupil_size)
+        pygame.draw.circle(surface, BLACK,
+                           (right_eye_x + pupil_x_offset,
+                            eyes_y + pupil_y_offset),
+                           pupil_size)
 
     def _render_ui(self):
-        # Верхняя панель
-        ui_rect = pygame.Rect(0, 0, WINDOW_WIDTH, 80)
-        pygame.draw.rect(self.screen, BLACK, ui_rect)
-        pygame.draw.line(self.screen, UI_COLOR, (0, 80),
-                         (WINDOW_WIDTH, 80), 2)
-
-        # Заголовок
-        title_text = self.big_font.render("🟡 P A C M A N 🟡", True, UI_COLOR)
-        title_rect = title_text.get_rect(center=(WINDOW_WIDTH // 2, 25))
-        self.screen.blit(title_text, title_rect)
-
-        # Счетчики
-        score_text = self.font.render(f"SCORE: {self.score:05d}",
-                                      True, SCORE_COLOR)
-        self.screen.blit(score_text, (20, 50))
-
-        moves_text = self.font.render(f"MOVES: {self.moves_count}",
-                                      True, SCORE_COLOR)
-        self.screen.blit(moves_text, (250, 50))
-
-        total_dots = len(self.dots) + len(self.big_dots)
-        dots_text = self.font.render(f"DOTS: {total_dots}", True, SCORE_COLOR)
-        dots_rect = dots_text.get_rect(topright=(WINDOW_WIDTH - 20, 50))
-        self.screen.blit(dots_text, dots_rect)
+        # Верхняя панель хранится готовым слоем и собирается заново
+        # только когда меняются счет, ходы или число точек
+        total_dots = self.sim.collectibles.total
+        values = (self.sim.score, self.sim.moves_count, total_dots)
+        if values != self.ui_panel_values:
+            self._compose_ui_panel()
+            self.ui_panel_values = values
+        self.screen.blit(self.ui_panel, (0, 0))
 
         # Нижняя панель с инструкциями
         bottom_y = WINDOW_HEIGHT - 50
-        instruction_text = self.small_font.render(
+        instruction_text = self.text_cache.render(
+            self.small_font,
             "WASD / СТРЕЛКИ - движение  •  ESC - выход  •  "
             "Собирайте все точки!",
-            True, UI_COLOR)
+            UI_COLOR)
         instruction_rect = instruction_text.get_rect(
             center=(WINDOW_WIDTH // 2, bottom_y))
         self.screen.blit(instruction_text, instruction_rect)
 
         # Сообщения о состоянии игры
-        if self.game_won:
-            if self.victory_animation > 60:
+        if self.sim.game_won:
+            if self.sim.victory_animation > 60:
                 # Анимация победы
                 flash_alpha = int(255 * abs(math.sin(
                     self.animation_timer * 0.5)))
@@ -582,8 +825,9 @@ class Game:
             else:
                 win_color = UI_COLOR
 
-            win_text = self.big_font.render(
-                f"🏆 VICTORY! FINAL SCORE: {self.score} 🏆", True, win_color)
+            win_text = self.text_cache.render(
+                self.big_font,
+                f"🏆 VICTORY! FINAL SCORE: {self.sim.score} 🏆", win_color)
             win_rect = win_text.get_rect(center=(WINDOW_WIDTH // 2,
                                                  WINDOW_HEIGHT // 2))
 
@@ -595,9 +839,10 @@ class Game:
 
             self.screen.blit(win_text, win_rect)
 
-        elif self.game_lost:
-            lose_text = self.big_font.render(
-                f"👻 GAME OVER! SCORE: {self.score} 👻", True, RED_GHOST)
+        elif self.sim.game_lost:
+            lose_text = self.text_cache.render(
+                self.big_font,
+                f"👻 GAME OVER! SCORE: {self.sim.score} 👻", RED_GHOST)
             lose_rect = lose_text.get_rect(center=(WINDOW_WIDTH // 2,
                                                    WINDOW_HEIGHT // 2))
 
@@ -610,10 +855,11 @@ class Game:
             self.screen.blit(lose_text, lose_rect)
 
         elif total_dots == 0:
-            exit_text = self.font.render(
-                "✨ ALL DOTS COLLECTED! GO TO GREEN EXIT! ✨", True, GREEN_EXIT)
+            exit_text = self.text_cache.render(
+                self.font,
+                "✨ ALL DOTS COLLECTED! GO TO GREEN EXIT! ✨", GREEN_EXIT)
             exit_rect = exit_text.get_rect(center=(WINDOW_WIDTH // 2,
-                                                   self.map_offset_y - 15))
+                                                   self.map_view.top - 15))
 
             # Мигающий фон
             if int(self.animation_timer / 15) % 2:
@@ -624,181 +870,202 @@ class Game:
 
             self.screen.blit(exit_text, exit_rect)
 
-    def run(self):
-        print("🟡 Добро пожаловать в PACMAN! 🟡")
-        print("Управление: WASD или стрелки")
-        print("Цель: собрать все точки и дойти до зеленого выхода")
-        print("Избегайте красных призраков!")
-        print("-" * 50)
-
-        while self.running:
-            # Обработка событий
-            events = pygame.event.get()
-            i = 0
-            while i < len(events):
-                event = events[i]
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.running = False
-                i += 1
-
-            # Обновление игры
-            self.handle_input()
-            self.update_enemies()
-            self.update_timers()
-
-            # Увеличиваем счетчик анимации
-            self.animation_timer += 1
-
-            # Отрисовка
-            self.render()
-
-            # Ограничение FPS
-            self.clock.tick(FPS)
-
-        pygame.quit()
-        sys.exit()
-
-
-class Player:
-
-    def __init__(self, x: int, y: int):
-        self.x = x
-        self.y = y
-        self.direction = Direction.RIGHT
+    def _compose_ui_panel(self):
+        panel = self.ui_panel
 
+        # Верхняя панель
+        ui_rect = pygame.Rect(0, 0, WINDOW_WIDTH, 80)
+        pygame.draw.rect(panel, BLACK, ui_rect)
+        pygame.draw.line(panel, UI_COLOR, (0, 80), (WINDOW_WIDTH, 80), 2)
 
-class Enemy:
-
-    def __init__(self, x: int, y: int, color: int = 0):
-        self.x = x
-        self.y = y
-        self.color = color
-        self.direction = Direction.RIGHT
-        self.timer = 0
-        self.chase_mode = False
-        self.stuck_timer = 0
-
-    def update(self, game_map: List[List[str]], player, map_width: int,
-               map_height: int):
-        self.timer += 1
-
-        # Определяем режим преследования
-        distance = abs(self.x - player.x) + abs(self.y - player.y)
-        self.chase_mode = distance <= 7
+        # Заголовок
+        title_text = self.text_cache.render(
+            self.big_font, "🟡 P A C M A N 🟡", UI_COLOR)
+        title_rect = title_text.get_rect(center=(WINDOW_WIDTH // 2, 25))
+        panel.blit(title_text, title_rect)
 
-        # Двигаемся каждые 20 кадров (медленнее игрока)
-        if self.timer % 20 == 0:
-            old_x, old_y = self.x, self.y
+        # Счетчики
+        score_text = self.text_cache.render(
+            self.font, f"SCORE: {self.sim.score:05d}", SCORE_COLOR)
+        panel.blit(score_text, (20, 50))
 
-            if self.chase_mode:
-                self._chase_player(game_map, player, map_width, map_height)
-            else:
-                self._wander(game_map, map_width, map_height)
-
-            # Проверка на застревание
-            if old_x == self.x and old_y == self.y:
-                self.stuck_timer += 1
-                if self.stuck_timer > 2:
-                    self._force_move(game_map, map_width, map_height)
-                    self.stuck_timer = 0
-            else:
-                self.stuck_timer = 0
+        moves_text = self.text_cache.render(
+            self.font, f"MOVES: {self.sim.moves_count}", SCORE_COLOR)
+        panel.blit(moves_text, (250, 50))
 
-    def _chase_player(self, game_map: List[List[str]], player,
-                      map_width: int, map_height: int):
-        directions = [Direction.UP, Direction.DOWN,
-                      Direction.LEFT, Direction.RIGHT]
-        best_direction = None
-        min_distance = float('inf')
+        dots_text = self.text_cache.render(
+            self.font, f"DOTS: {self.sim.collectibles.total}", SCORE_COLOR)
+        dots_rect = dots_text.get_rect(topright=(WINDOW_WIDTH - 20, 50))
+        panel.blit(dots_text, dots_rect)
 
+    def process_events(self):
+        events = pygame.event.get()
         i = 0
-        while i < len(directions):
-            direction = directions[i]
-            new_x = self.x + direction.value[0]
-            new_y = self.y + direction.value[1]
-
-            if self._is_valid_move(new_x, new_y, game_map,
-                                   map_width, map_height):
-                distance = abs(new_x - player.x) + abs(new_y - player.y)
-                if distance < min_distance:
-                    min_distance = distance
-                    best_direction = direction
+        while i < len(events):
+            event = events[i]
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False
+                elif event.key == pygame.K_F5:
+                    self.quicksave = snapshot.dumps(self.sim)
+                elif event.key == pygame.K_F9:
+                    self.quickload()
+                elif event.key == pygame.K_F3 and self.profiler is not None:
+                    self.profile_overlay = not self.profile_overlay
+                    self.profile_panel = None
+                    self.full_redraw_pending = True
             i += 1
 
-        if best_direction:
-            self.x += best_direction.value[0]
-            self.y += best_direction.value[1]
-            self.direction = best_direction
-
-    def _wander(self, game_map: List[List[str]], map_width: int,
-                map_height: int):
-        # Пробуем продолжить в текущем направлении
-        new_x = self.x + self.direction.value[0]
-        new_y = self.y + self.direction.value[1]
-
-        if self._is_valid_move(new_x, new_y, game_map, map_width, map_height):
-            # 70% шанс продолжить прямо
-            if random.random() < 0.7:
-                self.x = new_x
-                self.y = new_y
-                return
-
-        # Иначе выбираем случайное направление
-        directions = [Direction.UP, Direction.DOWN,
-                      Direction.LEFT, Direction.RIGHT]
-        valid_directions = []
+    def wait_frame(self):
+        # Ограничение FPS
+        self.clock.tick(self.fps)
+
+    def enable_profiler(self) -> FrameProfiler:
+        # Обертки ставятся на методы этого экземпляра, без профилировщика
+        # игровой цикл работает с исходными методами
+        self.profiler = FrameProfiler()
+        self.profiler.instrument(self, [
+            'process_events', 'handle_input', 'update_enemies',
+            'update_timers', 'render', 'wait_frame'])
+        self.profiler.instrument(self, [
+            '_render_map', '_render_dots', '_render_enemies',
+            '_render_player', '_render_ui', '_redraw_regions'],
+            prefix='render.')
+        return self.profiler
+
+    def _render_profile_overlay(self) -> pygame.Rect:
+        # Непрозрачная панель с перцентилями фаз; пересобирается раз в
+        # PROFILE_REFRESH кадров, в остальные просто копируется на экран
+        if (self.profile_panel is None or
+                self.profiler.frame % PROFILE_REFRESH == 0):
+            stats = self.profiler.stats()
+            lines = [f"{'phase':22}{'p50':>7}{'p95':>7}{'p99':>7} ms"]
+            i = 0
+            while i < len(stats):
+                row = stats[i]
+                lines.append(f"{row['name']:22}{row['p50']:7.2f}"
+                             f"{row['p95']:7.2f}{row['p99']:7.2f}")
+                i += 1
+            line_height = self.small_font.get_linesize()
+            panel = pygame.Surface((330, line_height * len(lines) + 10))
+            panel.fill((20, 20, 40))
+            i = 0
+            while i < len(lines):
+                panel.blit(self.small_font.render(lines[i], True, WHITE),
+                           (6, 5 + i * line_height))
+                i += 1
+            self.profile_panel = panel
 
-        i = 0
-        while i < len(directions):
-            direction = directions[i]
-            new_x = self.x + direction.value[0]
-            new_y = self.y + direction.value[1]
+        rect = self.profile_panel.get_rect(
+            topleft=(10, MAP_VIEW_TOP + 10))
+        self.screen.blit(self.profile_panel, rect)
+        return rect
 
-            if self._is_valid_move(new_x, new_y, game_map,
-                                   map_width, map_height):
-                valid_directions.append(direction)
-            i += 1
+    def run(self):
+        print("🟡 Добро пожаловать в PACMAN! 🟡")
+        print("Управление: WASD или стрелки")
+        print("Цель: собрать все точки и дойти до зеленого выхода")
+        print("Избегайте красных призраков!")
+        print("-" * 50)
 
-        if valid_directions:
-            chosen_direction = valid_directions[
-                random.randint(0, len(valid_directions) - 1)]
-            self.x += chosen_direction.value[0]
-            self.y += chosen_direction.value[1]
-            self.direction = chosen_direction
+        # Симуляция идет фиксированными тиками, а кадры рисуются так часто,
+        # как успевает экран: при медленной отрисовке пропускаются кадры,
+        # а не замедляется игра
+        tick_time = 1.0 / TICK_RATE
+        accumulator = 0.0
+        previous_time = time.perf_counter()
 
-    def _force_move(self, game_map: List[List[str]], map_width: int,
-                    map_height: int):
-        directions = [Direction.UP, Direction.DOWN,
-                      Direction.LEFT, Direction.RIGHT]
+        while self.running:
+            if self.profiler is not None:
+                self.profiler.next_frame()
+
+            self.process_events()
+
+            # Догоняем реальное время целыми тиками
+            now = time.perf_counter()
+            accumulator += min(now - previous_time, MAX_FRAME_TIME)
+            previous_time = now
+            while accumulator >= tick_time:
+                # После конца журнала тиков без ввода не добавляем, иначе
+                # число тиков повтора разойдется с записью
+                if self.playback is not None and self.playback.finished:
+                    break
+                self.tick()
+                accumulator -= tick_time
 
-        i = 0
-        while i < len(directions):
-            direction = directions[i]
-            new_x = self.x + direction.value[0]
-            new_y = self.y + direction.value[1]
-
-            if self._is_valid_move(new_x, new_y, game_map,
-                                   map_width, map_height):
-                self.x = new_x
-                self.y = new_y
-                self.direction = direction
-                break
-            i += 1
+            # Воспроизведение заканчивается вместе с журналом
+            if self.playback is not None and self.playback.finished:
+                self.running = False
+
+            # Отрисовка с долей еще не наступившего тика
+            self.render_alpha = accumulator / tick_time
+            self.render()
 
-    def _is_valid_move(self, x: int, y: int, game_map: List[List[str]],
-                       map_width: int, map_height: int) -> bool:
-        if x < 0 or x >= map_width or y < 0 or y >= map_height:
-            return False
-        return game_map[y][x] != TileType.WALL.value
+            self.wait_frame()
+
+        pygame.quit()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Pacman")
+    parser.add_argument('--dirty', action='store_true',
+                        help="обновлять только изменившиеся области экрана")
+    parser.add_argument('--maze', metavar='WxH',
+                        help="случайный лабиринт заданного размера")
+    parser.add_argument('--ghosts', type=int, default=4)
+    parser.add_argument('--level', metavar='PATH',
+                        help="уровень из файла (компилируется в кэш)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--record', metavar='PATH',
+                        help="записать ввод партии в журнал")
+    parser.add_argument('--profile', action='store_true',
+                        help="замерять фазы кадра (панель - F3)")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="выгрузить замеры в Chrome trace JSON")
+    parser.add_argument('--profile-csv', metavar='PATH',
+                        help="выгрузить замеры в CSV")
+    parser.add_argument('--autopilot', action='store_true',
+                        help="демо-режим: играет автопилот")
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help="ограничение кадров в секунду, 0 - без "
+                             "ограничения; скорость игры от него не зависит")
+    args = parser.parse_args()
+
+    level = None
+    compiled = None
+    if args.level:
+        level = read_level(args.level)
+        compiled = mapfile.cached(level)
+    elif args.maze:
+        width, _, height = args.maze.lower().partition('x')
+        level = generate_maze(int(width), int(height), args.seed,
+                              args.ghosts)
+
+    # Запись воспроизводима только с известным сидом
+    seed = args.seed
+    if args.record and seed is None:
+        seed = random.randrange(1 << 31)
+
     try:
-        game = Game()
+        game = Game(dirty_rendering=args.dirty, level=level, seed=seed,
+                    compiled=compiled)
+        game.fps = args.fps
+        if args.record:
+            game.recorder = InputRecorder(game.sim, level)
+        if args.autopilot:
+            game.autopilot = Autopilot()
+        if args.profile or args.trace or args.profile_csv:
+            game.enable_profiler()
         game.run()
+        if args.trace:
+            game.profiler.export_chrome_trace(args.trace)
+        if args.profile_csv:
+            game.profiler.export_csv(args.profile_csv)
+        if args.record:
+            game.recorder.save(args.record)
+            print(f"Партия записана в {args.record} (сид {seed})")
     except Exception as e:
         print(f"Ошибка в игре: {e}")
         pygame.quit()
@@ -0,0 +1,157 @@
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+import pygame
+
+from env import DEFAULT_MAX_TICKS, PacmanEnv
+from pacman import Game
+
+
+# Веса яркости (ITU-R 601) в 1/256 - целочисленное приближение. Тип
+# uint16, чтобы умножение байтов канала шло без переполнения
+GRAY_WEIGHTS = (np.uint16(77), np.uint16(150), np.uint16(29))
+
+
+def frame_shape(width: int, height: int, scale: int = 1,
+                grayscale: bool = False) -> tuple:
+    # Размер кадра после прореживания: (высота, ширина[, 3])
+    shape = ((height + scale - 1) // scale, (width + scale - 1) // scale)
+    if grayscale:
+        return shape
+    return shape + (3,)
+
+
+class FrameCapture:
+    # Снимает пиксели поверхности через surfarray.pixels3d - это вид на
+    # память поверхности, а не копия. Прореживание - шаг среза (тоже вид),
+    # так что копируются только байты итогового кадра, прямо в out.
+    # Вид держит поверхность заблокированной, поэтому живет только на
+    # время capture().
+
+    def __init__(self, surface: pygame.Surface, scale: int = 1,
+                 grayscale: bool = False,
+                 region: Optional[pygame.Rect] = None):
+        self.surface = surface
+        self.scale = scale
+        self.grayscale = grayscale
+        self.region = region if region is not None else surface.get_rect()
+        self.shape = frame_shape(self.region.width, self.region.height,
+                                 scale, grayscale)
+        # Промежуточный буфер для взвешенной суммы каналов
+        self._gray = np.empty(self.shape[:2], dtype=np.uint16)
+        self._channel = np.empty(self.shape[:2], dtype=np.uint16)
+
+    def capture(self, out: np.ndarray):
+        region = self.region
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        # (x, y, канал) -> (y, x, канал) без копирования
+        view = pixels[region.left:region.right:self.scale,
+                      region.top:region.bottom:self.scale].transpose(1, 0, 2)
+        if self.grayscale:
+            gray = self._gray
+            channel = self._channel
+            np.multiply(view[:, :, 0], GRAY_WEIGHTS[0], out=gray)
+            np.multiply(view[:, :, 1], GRAY_WEIGHTS[1], out=channel)
+            gray += channel
+            np.multiply(view[:, :, 2], GRAY_WEIGHTS[2], out=channel)
+            gray += channel
+            gray >>= 8
+            out[...] = gray
+        else:
+            out[...] = view
+        del view
+        del pixels
+
+
+class FrameStack:
+    # Последние depth кадров в одном массиве, от старого к новому.
+    # Массив можно передать снаружи (например, срез общей памяти)
+
+    def __init__(self, depth: int, shape: tuple,
+                 out: Optional[np.ndarray] = None):
+        if out is None:
+            out = np.zeros((depth,) + shape, dtype=np.uint8)
+        self.frames = out
+
+    def push(self, capture: FrameCapture):
+        frames = self.frames
+        if len(frames) > 1:
+            frames[:-1] = frames[1:]
+        capture.capture(frames[-1])
+
+    def fill(self, capture: FrameCapture):
+        # После сброса среды все кадры стопки - первый кадр партии
+        capture.capture(self.frames[-1])
+        i = 0
+        while i < len(self.frames) - 1:
+            self.frames[i] = self.frames[-1]
+            i += 1
+
+
+class SharedFrames:
+    # Кадры нескольких сред в одном блоке общей памяти:
+    # (среды, глубина стопки, высота, ширина[, 3]). Среды пишут каждая в
+    # свой срез slot(i), процесс обучения читает весь массив напрямую
+
+    def __init__(self, shape: tuple, name: Optional[str] = None,
+                 create: bool = True):
+        size = 1
+        i = 0
+        while i < len(shape):
+            size *= shape[i]
+            i += 1
+        self.shape = tuple(shape)
+        self.memory = shared_memory.SharedMemory(name=name, create=create,
+                                                 size=size)
+        self.name = self.memory.name
+        self.array = np.ndarray(self.shape, dtype=np.uint8,
+                                buffer=self.memory.buf)
+
+    def slot(self, index: int) -> np.ndarray:
+        return self.array[index]
+
+    def close(self):
+        # Массив ссылается на буфер памяти, его нужно отпустить первым
+        self.array = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class PixelEnv(PacmanEnv):
+    # Та же среда, но наблюдение - пиксели кадра игры, нарисованного вне
+    # экрана. step/reset возвращают стопку кадров; сеточное наблюдение
+    # родителя остается доступно в self.observation
+
+    def __init__(self, level: Optional[List[str]] = None,
+                 max_ticks: int = DEFAULT_MAX_TICKS, frame_skip: int = 1,
+                 scale: int = 1, grayscale: bool = False, stack: int = 1,
+                 map_only: bool = False, out: Optional[np.ndarray] = None):
+        super().__init__(level, max_ticks, frame_skip)
+        self.game = Game(level=level, offscreen=True)
+        region = self.game.map_view if map_only else None
+        self.capture = FrameCapture(self.game.screen, scale, grayscale,
+                                    region)
+        self.frames = FrameStack(stack, self.capture.shape, out)
+
+    def reset(self, seed=None) -> np.ndarray:
+        super().reset(seed)
+        game = self.game
+        game.sim = self.sim
+        game.previous_positions = None
+        self._draw()
+        self.frames.fill(self.capture)
+        return self.frames.frames
+
+    def step(self, action: int):
+        _, reward, done, info = super().step(action)
+        self._draw()
+        self.frames.push(self.capture)
+        return self.frames.frames, reward, done, info
+
+    def _draw(self):
+        # Анимации идут по тикам симуляции, как в игре
+        self.game.animation_timer = self.sim.tick_count
+        self.game.render()
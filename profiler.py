@@ -0,0 +1,141 @@
+import csv
+import json
+import time
+from collections import deque
+from typing import Callable, List
+
+
+PROFILE_WINDOW = 600  # Сколько последних замеров держать на каждую фазу
+TRACE_LIMIT = 200000  # Сколько событий хранить для выгрузки трассы
+FRAME = 'frame'
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    # Линейная интерполяция между соседними значениями
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return (sorted_values[lower] * (1 - fraction) +
+            sorted_values[upper] * fraction)
+
+
+class FrameProfiler:
+    # Замеры фаз кадра. Методы объекта подменяются обертками только при
+    # включенном профилировании (instrument), так что выключенный
+    # профилировщик ничего не стоит: в горячих путях нет проверок
+
+    def __init__(self, window: int = PROFILE_WINDOW,
+                 trace_limit: int = TRACE_LIMIT):
+        self.window = window
+        self.samples = {}
+        self.names = []
+        self.events = deque(maxlen=trace_limit)
+        self.frame = 0
+        self.frame_start = None
+        self.origin = time.perf_counter_ns()
+
+    def _samples_for(self, name: str) -> deque:
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+            self.names.append(name)
+        return self.samples[name]
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        samples = self._samples_for(name)
+        events = self.events
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = clock() - start
+                samples.append(duration)
+                events.append((name, start, duration, self.frame))
+
+        return timed
+
+    def instrument(self, target, methods: List[str], prefix: str = ''):
+        # Подменяет методы экземпляра замеряющими обертками
+        i = 0
+        while i < len(methods):
+            name = methods[i]
+            setattr(target, name,
+                    self.wrap(prefix + name.lstrip('_'),
+                              getattr(target, name)))
+            i += 1
+
+    def next_frame(self):
+        # Граница кадров: длительность всего кадра тоже идет в гистограмму
+        now = time.perf_counter_ns()
+        if self.frame_start is not None:
+            duration = now - self.frame_start
+            self._samples_for(FRAME).append(duration)
+            self.events.append((FRAME, self.frame_start, duration,
+                                self.frame))
+        self.frame_start = now
+        self.frame += 1
+
+    def stats(self) -> List[dict]:
+        # Перцентили в миллисекундах по скользящему окну
+        result = []
+        i = 0
+        while i < len(self.names):
+            name = self.names[i]
+            ordered = sorted(self.samples[name])
+            i += 1
+            if not ordered:
+                continue
+            result.append({
+                'name': name,
+                'count': len(ordered),
+                'p50': percentile(ordered, 50) / 1e6,
+                'p95': percentile(ordered, 95) / 1e6,
+                'p99': percentile(ordered, 99) / 1e6,
+                'max': ordered[-1] / 1e6,
+            })
+        return result
+
+    def _ordered_events(self) -> list:
+        # События пишутся по окончании фазы, вложенные раньше внешних;
+        # для выгрузки упорядочиваем по началу
+        return sorted(self.events, key=lambda event: event[1])
+
+    def export_chrome_trace(self, path: str):
+        # Формат trace-event: открывается в chrome://tracing и Perfetto
+        trace = []
+        events = self._ordered_events()
+        i = 0
+        while i < len(events):
+            name, start, duration, frame = events[i]
+            trace.append({
+                'name': name,
+                'cat': 'frame' if name == FRAME else 'phase',
+                'ph': 'X',
+                'ts': (start - self.origin) / 1000.0,
+                'dur': duration / 1000.0,
+                'pid': 1,
+                'tid': 1,
+                'args': {'frame': frame},
+            })
+            i += 1
+        with open(path, 'w') as handle:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'},
+                      handle)
+
+    def export_csv(self, path: str):
+        events = self._ordered_events()
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['frame', 'phase', 'start_us', 'duration_us'])
+            i = 0
+            while i < len(events):
+                name, start, duration, frame = events[i]
+                writer.writerow([frame, name,
+                                 f"{(start - self.origin) / 1000.0:.3f}",
+                                 f"{duration / 1000.0:.3f}"])
+                i += 1
@@ -0,0 +1,381 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from levels import read_level
+from runner import wander_policy
+from simulation import DIRECTION_INDEX, DIRECTIONS, Direction, Simulation
+
+
+# Формат журнала: заголовок, сид, карта, итог партии и ввод по тикам,
+# сжатый в серии одинаковых значений. Числа - varint (7 бит на байт).
+# С версии 2 у каждой строки карты своя длина (строки бывают разной
+# длины, как в CLASSIC_MAP); журналы версии 1 по-прежнему читаются
+LOG_MAGIC = b'PMRL'
+LOG_VERSION = 2
+FIXED_WIDTH_VERSION = 1  # Версия, где у всех строк длина первой
+LOG_EXTENSION = '.pmr'
+
+SEED_INT = 0
+SEED_STR = 1
+
+NO_INPUT = 0  # Код тика без нового направления, направления - 1..4
+CODE_BITS = 3
+
+OUTCOMES = ('won', 'lost', 'unfinished')
+
+
+class ReplayError(Exception):
+    pass
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> tuple:
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ReplayError("Журнал обрывается посреди числа")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def outcome(sim: Simulation) -> str:
+    if sim.game_won:
+        return 'won'
+    if sim.game_lost:
+        return 'lost'
+    return 'unfinished'
+
+
+class InputRecorder:
+    # Записывает ввод каждого тика до конца партии. Пишется только смена
+    # ожидаемого направления: повтор текущего ничего не меняет в симуляции,
+    # поэтому длинные серии "без ввода" хорошо сжимаются
+
+    def __init__(self, sim: Simulation, level: Optional[List[str]] = None):
+        if sim.seed is None:
+            raise ReplayError("Для записи нужна партия с заданным сидом")
+        self.sim = sim
+        self.seed = sim.seed
+        self.level = level
+        self.runs = []
+        self.ticks = 0
+
+    def record(self, direction: Optional[Direction]):
+        # Вызывается перед sim.apply_input в том же тике
+        if self.sim.done:
+            return
+        code = NO_INPUT
+        if direction and direction != self.sim.pending_direction:
+            code = DIRECTION_INDEX[direction] + 1
+
+        if self.runs and self.runs[-1][0] == code:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([code, 1])
+        self.ticks += 1
+
+    def to_bytes(self) -> bytes:
+        return encode_log(self.seed, self.level, self.runs, {
+            'ticks': self.ticks,
+            'score': self.sim.score,
+            'moves_count': self.sim.moves_count,
+            'outcome': outcome(self.sim),
+        })
+
+    def save(self, path: str):
+        with open(path, 'wb') as handle:
+            handle.write(self.to_bytes())
+
+
+class InputPlayback:
+    # Выдает записанный ввод по одному тику
+
+    def __init__(self, runs: List[list]):
+        self.runs = runs
+        self.run_index = 0
+        self.left = runs[0][1] if runs else 0
+
+    @property
+    def finished(self) -> bool:
+        return self.run_index >= len(self.runs)
+
+    def next_input(self) -> Optional[Direction]:
+        if self.finished:
+            return None
+        code = self.runs[self.run_index][0]
+        self.left -= 1
+        if self.left == 0:
+            self.run_index += 1
+            if self.run_index < len(self.runs):
+                self.left = self.runs[self.run_index][1]
+        if code == NO_INPUT:
+            return None
+        return DIRECTIONS[code - 1]
+
+
+def encode_log(seed, level: Optional[List[str]], runs: List[list],
+               result: Dict) -> bytes:
+    out = bytearray(LOG_MAGIC)
+    out.append(LOG_VERSION)
+
+    seed_bytes = str(seed).encode('utf-8')
+    out.append(SEED_INT if isinstance(seed, int) else SEED_STR)
+    _write_varint(out, len(seed_bytes))
+    out.extend(seed_bytes)
+
+    # Своя карта хранится целиком, классическая - одним нулем
+    if level is None:
+        _write_varint(out, 0)
+    else:
+        _write_varint(out, len(level))
+        i = 0
+        while i < len(level):
+            _write_varint(out, len(level[i]))
+            out.extend(level[i].encode('ascii'))
+            i += 1
+
+    _write_varint(out, result['ticks'])
+    _write_varint(out, result['score'])
+    _write_varint(out, result['moves_count'])
+    out.append(OUTCOMES.index(result['outcome']))
+
+    _write_varint(out, len(runs))
+    i = 0
+    while i < len(runs):
+        _write_varint(out, (runs[i][1] << CODE_BITS) | runs[i][0])
+        i += 1
+    return bytes(out)
+
+
+def decode_log(data: bytes) -> Dict:
+    if data[:len(LOG_MAGIC)] != LOG_MAGIC:
+        raise ReplayError("Это не журнал партии Pacman")
+    position = len(LOG_MAGIC)
+    version = data[position]
+    if version not in (LOG_VERSION, FIXED_WIDTH_VERSION):
+        raise ReplayError(f"Неизвестная версия журнала: {version}")
+    seed_kind = data[position + 1]
+    position += 2
+
+    length, position = _read_varint(data, position)
+    seed = data[position:position + length].decode('utf-8')
+    position += length
+    if seed_kind == SEED_INT:
+        seed = int(seed)
+
+    level = None
+    height, position = _read_varint(data, position)
+    if height:
+        if version == FIXED_WIDTH_VERSION:
+            width, position = _read_varint(data, position)
+        level = []
+        y = 0
+        while y < height:
+            if version != FIXED_WIDTH_VERSION:
+                width, position = _read_varint(data, position)
+            level.append(data[position:position + width].decode('ascii'))
+            position += width
+            y += 1
+
+    result = {}
+    result['ticks'], position = _read_varint(data, position)
+    result['score'], position = _read_varint(data, position)
+    result['moves_count'], position = _read_varint(data, position)
+    if position >= len(data) or data[position] >= len(OUTCOMES):
+        raise ReplayError("Журнал поврежден: нет итога партии")
+    result['outcome'] = OUTCOMES[data[position]]
+    position += 1
+
+    count, position = _read_varint(data, position)
+    runs = []
+    while len(runs) < count:
+        value, position = _read_varint(data, position)
+        runs.append([value & ((1 << CODE_BITS) - 1), value >> CODE_BITS])
+    return {'seed': seed, 'level': level, 'runs': runs, 'result': result}
+
+
+def load_log(path: str) -> Dict:
+    with open(path, 'rb') as handle:
+        return decode_log(handle.read())
+
+
+def replay(log: Dict) -> Dict:
+    # Прогон без отрисовки на полной скорости: серия ввода применяется
+    # подряд без лишних проверок и без сборки состояния на каждом тике
+    sim = Simulation(log['level'], log['seed'])
+    runs = log['runs']
+    i = 0
+    while i < len(runs):
+        code, count = runs[i]
+        direction = DIRECTIONS[code - 1] if code != NO_INPUT else None
+        while count > 0:
+            sim.apply_input(direction)
+            sim.update_enemies()
+            sim.update_timers()
+            count -= 1
+        i += 1
+    return {
+        'ticks': sim.tick_count,
+        'score': sim.score,
+        'moves_count': sim.moves_count,
+        'outcome': outcome(sim),
+    }
+
+
+def verify_file(path: str) -> Dict:
+    log = load_log(path)
+    actual = replay(log)
+    # Журнал должен и записываться обратно без потерь: карта, ввод, итог
+    encoded = decode_log(encode_log(log['seed'], log['level'], log['runs'],
+                                    log['result']))
+    if encoded != log:
+        actual = dict(actual, roundtrip=False)
+    return {
+        'path': path,
+        'ok': actual == log['result'],
+        'expected': log['result'],
+        'actual': actual,
+    }
+
+
+def record_episode(seed, max_ticks: int = 20000, level=None) -> bytes:
+    # Запись партии бота из runner - для набора журналов к проверкам
+    sim = Simulation(level, seed)
+    recorder = InputRecorder(sim, level)
+    policy_rng = random.Random(f"{seed}:policy")
+    while not sim.done and sim.tick_count < max_ticks:
+        direction = wander_policy(sim, policy_rng)
+        recorder.record(direction)
+        sim.apply_input(direction)
+        sim.update_enemies()
+        sim.update_timers()
+    return recorder.to_bytes()
+
+
+def _collect_paths(items: List[str]) -> List[str]:
+    paths = []
+    i = 0
+    while i < len(items):
+        if os.path.isdir(items[i]):
+            names = sorted(os.listdir(items[i]))
+            j = 0
+            while j < len(names):
+                if names[j].endswith(LOG_EXTENSION):
+                    paths.append(os.path.join(items[i], names[j]))
+                j += 1
+        else:
+            paths.append(items[i])
+        i += 1
+    return paths
+
+
+def _generate(count: int, directory: str, base_seed: int, max_ticks: int,
+              level: Optional[List[str]] = None):
+    os.makedirs(directory, exist_ok=True)
+    index = 0
+    while index < count:
+        path = os.path.join(directory, f"{base_seed}_{index}{LOG_EXTENSION}")
+        with open(path, 'wb') as handle:
+            handle.write(record_episode(f"{base_seed}:{index}", max_ticks,
+                                        level))
+        index += 1
+
+
+def _render(path: str) -> Dict:
+    # Просмотр журнала в окне игры с обычной скоростью; pygame нужен
+    # только здесь, проверка без окна обходится без него
+    from pacman import Game
+
+    log = load_log(path)
+    game = Game(level=log['level'], seed=log['seed'])
+    game.playback = InputPlayback(log['runs'])
+    game.run()
+    actual = {
+        'ticks': game.sim.tick_count,
+        'score': game.sim.score,
+        'moves_count': game.sim.moves_count,
+        'outcome': outcome(game.sim),
+    }
+    return {'path': path, 'ok': actual == log['result'],
+            'expected': log['result'], 'actual': actual}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Проверка записанных партий Pacman повтором")
+    parser.add_argument('logs', nargs='+',
+                        help="файлы журналов или папки с ними")
+    parser.add_argument('--render', action='store_true',
+                        help="показать партию в окне с обычной скоростью")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--generate', type=int, metavar='N',
+                        help="записать N партий бота в указанную папку")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=20000)
+    parser.add_argument('--level', metavar='PATH',
+                        help="карта для --generate (файл уровня)")
+    args = parser.parse_args()
+
+    if args.generate:
+        level = None
+        if args.level:
+            level = read_level(args.level)
+        _generate(args.generate, args.logs[0], args.seed, args.max_ticks,
+                  level)
+        return
+
+    paths = _collect_paths(args.logs)
+    started = time.perf_counter()
+    if args.render:
+        results = []
+        i = 0
+        while i < len(paths):
+            results.append(_render(paths[i]))
+            i += 1
+    elif args.workers == 1 or len(paths) < 2:
+        results = []
+        i = 0
+        while i < len(paths):
+            results.append(verify_file(paths[i]))
+            i += 1
+    else:
+        workers = args.workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                verify_file, paths,
+                chunksize=max(1, len(paths) // (workers * 8))))
+    elapsed = time.perf_counter() - started
+
+    failed = 0
+    i = 0
+    while i < len(results):
+        if not results[i]['ok']:
+            failed += 1
+            print(f"РАСХОЖДЕНИЕ {results[i]['path']}: ожидалось "
+                  f"{results[i]['expected']}, получено "
+                  f"{results[i]['actual']}")
+        i += 1
+    print(f"Проверено партий: {len(results)}, расхождений: {failed}, "
+          f"{elapsed:.2f} с")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import simulation
+from profiler import percentile
+from simulation import DIRECTIONS, Simulation
+
+
+DEFAULT_MAX_TICKS = 20000
+
+# Параметры, которые можно менять для подбора сложности призраков
+TUNABLE = ('MOVE_DELAY', 'ENEMY_MOVE_PERIOD', 'CHASE_DISTANCE')
+
+
+def episode_seed(base_seed: int, index: int) -> str:
+    # Зерно зависит только от номера партии, а не от того,
+    # какой процесс ее считает
+    return f"{base_seed}:{index}"
+
+
+def wander_policy(sim: Simulation, rng: random.Random):
+    # Простой бот: идет прямо, на развилках иногда сворачивает
+    current = sim.last_direction
+    if (current is not None and sim._can_move_in_direction(current) and
+            rng.random() < 0.9):
+        return None
+
+    options = []
+    i = 0
+    while i < len(DIRECTIONS):
+        if sim._can_move_in_direction(DIRECTIONS[i]):
+            options.append(DIRECTIONS[i])
+        i += 1
+    if not options:
+        return None
+    return options[rng.randint(0, len(options) - 1)]
+
+
+def run_episode(seed: str, max_ticks: int = DEFAULT_MAX_TICKS,
+                policy: Callable = wander_policy) -> Dict:
+    sim = Simulation(seed=seed)
+    policy_rng = random.Random(seed + ":policy")
+
+    while not sim.done and sim.tick_count < max_ticks:
+        sim.step(policy(sim, policy_rng))
+
+    if sim.game_won:
+        outcome = 'won'
+    elif sim.game_lost:
+        outcome = 'lost'
+    else:
+        outcome = 'timeout'
+
+    return {
+        'seed': seed,
+        'score': sim.score,
+        'moves_count': sim.moves_count,
+        'ticks': sim.tick_count,
+        'outcome': outcome,
+    }
+
+
+def _init_worker(tuning: Dict[str, int]):
+    # Настройки применяются к модулю симуляции внутри процесса-работника
+    names = list(tuning)
+    i = 0
+    while i < len(names):
+        setattr(simulation, names[i], tuning[names[i]])
+        i += 1
+
+
+def _run_chunk(job) -> List[Dict]:
+    seeds, max_ticks, policy = job
+    results = []
+    i = 0
+    while i < len(seeds):
+        results.append(run_episode(seeds[i], max_ticks, policy))
+        i += 1
+    return results
+
+
+def run_episodes(episodes: int, base_seed: int = 0,
+                 workers: Optional[int] = None,
+                 max_ticks: int = DEFAULT_MAX_TICKS,
+                 policy: Callable = wander_policy,
+                 tuning: Optional[Dict[str, int]] = None,
+                 chunk_size: Optional[int] = None) -> List[Dict]:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if tuning is None:
+        tuning = {}
+    if chunk_size is None:
+        # Несколько пачек на процесс, чтобы сгладить разную длину партий
+        chunk_size = max(1, episodes // (workers * 8))
+
+    jobs = []
+    start = 0
+    while start < episodes:
+        stop = min(episodes, start + chunk_size)
+        seeds = []
+        index = start
+        while index < stop:
+            seeds.append(episode_seed(base_seed, index))
+            index += 1
+        jobs.append((seeds, max_ticks, policy))
+        start = stop
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(tuning,)) as pool:
+        # map сохраняет порядок пачек, поэтому результат не зависит
+        # от числа процессов
+        chunks = list(pool.map(_run_chunk, jobs))
+    i = 0
+    while i < len(chunks):
+        results.extend(chunks[i])
+        i += 1
+    return results
+
+
+def _describe(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    total = 0
+    i = 0
+    while i < len(ordered):
+        total += ordered[i]
+        i += 1
+    return {
+        'mean': total / len(ordered) if ordered else 0.0,
+        'min': ordered[0] if ordered else 0,
+        'p50': percentile(ordered, 50),
+        'p90': percentile(ordered, 90),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else 0,
+    }
+
+
+def summarize(results: List[Dict]) -> Dict:
+    scores = []
+    moves = []
+    ticks = []
+    outcomes = {'won': 0, 'lost': 0, 'timeout': 0}
+    i = 0
+    while i < len(results):
+        result = results[i]
+        scores.append(result['score'])
+        moves.append(result['moves_count'])
+        ticks.append(result['ticks'])
+        outcomes[result['outcome']] += 1
+        i += 1
+
+    episodes = len(results)
+    return {
+        'episodes': episodes,
+        'win_rate': outcomes['won'] / episodes if episodes else 0.0,
+        'loss_rate': outcomes['lost'] / episodes if episodes else 0.0,
+        'timeout_rate': outcomes['timeout'] / episodes if episodes else 0.0,
+        'score': _describe(scores),
+        'moves_count': _describe(moves),
+        'ticks': _describe(ticks),
+    }
+
+
+def _parse_tuning(items: List[str]) -> Dict[str, int]:
+    tuning = {}
+    i = 0
+    while i < len(items):
+        name, _, value = items[i].partition('=')
+        if name not in TUNABLE:
+            raise SystemExit(f"Неизвестный параметр: {name}")
+        tuning[name] = int(value)
+        i += 1
+    return tuning
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Массовый прогон партий Pacman на всех ядрах")
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-ticks', type=int, default=DEFAULT_MAX_TICKS)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help="настройка: " + ", ".join(TUNABLE))
+    parser.add_argument('--results', help="сохранить все партии в JSON")
+    parser.add_argument('--policy', choices=('wander', 'autopilot', 'mcts'),
+                        default='wander', help="кто играет за игрока")
+    args = parser.parse_args()
+
+    # Боты импортируют runner сами, поэтому подключаются здесь
+    policy = wander_policy
+    if args.policy == 'autopilot':
+        from autopilot import Autopilot
+        policy = Autopilot()
+    elif args.policy == 'mcts':
+        from mcts import MCTSAgent
+        policy = MCTSAgent(seed=args.seed)
+
+    started = time.perf_counter()
+    results = run_episodes(args.episodes, args.seed, args.workers,
+                           args.max_ticks, policy=policy,
+                           tuning=_parse_tuning(args.set))
+    elapsed = time.perf_counter() - started
+
+    stats = summarize(results)
+    stats['seconds'] = elapsed
+    print(json.dumps(stats, indent=2))
+
+    if args.results:
+        with open(args.results, 'w') as handle:
+            json.dump(results, handle)
+
+
+if __name__ == "__main__":
+    main()
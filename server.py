@@ -0,0 +1,597 @@
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+from typing import Dict, List, Optional
+
+import snapshot
+from runner import wander_policy
+from simulation import DIRECTIONS, DIRECTION_INDEX, Simulation
+
+
+# Протокол: кадры с длиной впереди (uint32), первый байт - тип сообщения.
+# Клиент -> сервер: HELLO (роль, желаемая частота), INPUT (направление).
+# Сервер -> клиент: WELCOME (выданная роль), KEYFRAME (полный снимок из
+# snapshot.py), DELTA (изменения с прошлого отправленного состояния)
+MSG_HELLO = 1
+MSG_INPUT = 2
+MSG_WELCOME = 3
+MSG_KEYFRAME = 4
+MSG_DELTA = 5
+
+ROLE_SPECTATOR = 0
+ROLE_PLAYER = 1
+
+FLAG_WON = 1
+FLAG_LOST = 2
+
+DEFAULT_PORT = 8765
+TICK_RATE = 60
+KEYFRAME_INTERVAL = 300  # Полный снимок раз в 5 секунд игры
+RESTART_DELAY = 120  # Тиков паузы перед новой партией
+MAX_LAG = 0.25  # Дольше этого не догоняем отставание цикла
+SEND_TIMEOUT = 5.0  # Клиент, который столько не принимает данные, отключается
+MAX_PENDING_DOTS = 256  # Больше собранных точек в дельте - шлем снимок
+INPUT_RATE = 120  # Сообщений ввода в секунду от одного клиента
+MAX_MESSAGE = 1 << 16
+
+_FRAME = struct.Struct('<I')
+_HELLO = struct.Struct('<BBH')
+_INPUT = struct.Struct('<BB')
+_WELCOME = struct.Struct('<BB')
+# Номера и координаты - 32 бита: рои и большие карты не упираются
+# в 65535
+_DELTA = struct.Struct('<BIqqBII')
+_MOVED = struct.Struct('<IIIBB')
+_DOT = struct.Struct('<II')
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload)) + payload
+
+
+async def _read_message(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_FRAME.size)
+    length = _FRAME.unpack(header)[0]
+    if length == 0 or length > MAX_MESSAGE:
+        raise ConnectionError(f"Недопустимая длина сообщения: {length}")
+    return await reader.readexactly(length)
+
+
+def _entity_positions(sim: Simulation) -> List[tuple]:
+    # Игрок - номер 0, призраки - 1..N: (x, y, направление, погоня).
+    # Смена режима преследования тоже попадает в дельту
+    positions = [(sim.player.x, sim.player.y,
+                  DIRECTION_INDEX[sim.player.direction], 0)]
+    ghosts = sim.ghosts
+    i = 0
+    while i < len(ghosts):
+        positions.append((ghosts.x[i], ghosts.y[i], ghosts.direction[i],
+                          ghosts.chase[i]))
+        i += 1
+    return positions
+
+
+class ClientDelta:
+    # Изменения, накопленные для одного клиента с его прошлой отправки.
+    # Тики сливаются в одну дельту, пока клиент не готов принять данные:
+    # так медленный клиент получает реже, но не отстает и не копит очередь
+
+    def __init__(self):
+        self.keyframe = True
+        self.clear()
+
+    def clear(self):
+        self.tick = 0
+        self.score = 0
+        self.moves_count = 0
+        self.flags = 0
+        self.moved = {}
+        self.dots = []
+
+    @property
+    def empty(self) -> bool:
+        return not self.keyframe and not self.moved and not self.dots
+
+    def encode(self) -> bytes:
+        parts = [_DELTA.pack(MSG_DELTA, self.tick, self.score,
+                             self.moves_count, self.flags,
+                             len(self.moved), len(self.dots))]
+        indices = sorted(self.moved)
+        i = 0
+        while i < len(indices):
+            x, y, direction, chase = self.moved[indices[i]]
+            parts.append(_MOVED.pack(indices[i], x, y, direction, chase))
+            i += 1
+        i = 0
+        while i < len(self.dots):
+            parts.append(_DOT.pack(*self.dots[i]))
+            i += 1
+        return b''.join(parts)
+
+
+class ClientConnection:
+
+    def __init__(self, server, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.role = ROLE_SPECTATOR
+        self.interval = 0.0  # Минимальный промежуток между отправками
+        self.delta = ClientDelta()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sent_bytes = 0
+        self.sent_messages = 0
+        self.input_tokens = float(INPUT_RATE)
+        self.input_time = time.monotonic()
+        self.tasks = []
+
+    def close(self):
+        self.closed = True
+        i = 0
+        while i < len(self.tasks):
+            self.tasks[i].cancel()
+            i += 1
+        self.writer.close()
+
+    def mark_keyframe(self):
+        self.delta.clear()
+        self.delta.keyframe = True
+        self.ready.set()
+
+    def add_tick(self, sim: Simulation, moved: Dict, dots: List[tuple],
+                 score_delta: int, flags: int):
+        # Вызывается из игрового цикла: только запись в память, без I/O
+        delta = self.delta
+        if not delta.keyframe:
+            delta.moved.update(moved)
+            delta.dots.extend(dots)
+            delta.score += score_delta
+            if len(delta.dots) > MAX_PENDING_DOTS:
+                self.mark_keyframe()
+                return
+        delta.tick = sim.tick_count
+        delta.moves_count = sim.moves_count
+        delta.flags = flags
+        self.ready.set()
+
+    async def send_loop(self):
+        loop = asyncio.get_running_loop()
+        next_send = loop.time()
+        while not self.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            if self.delta.empty:
+                continue
+
+            # Ограничение частоты: пока ждем, изменения копятся в дельте
+            wait = next_send - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            next_send = max(next_send + self.interval, loop.time())
+
+            if self.delta.keyframe:
+                payload = self.server.keyframe()
+            else:
+                payload = self.delta.encode()
+            self.delta.clear()
+            self.delta.keyframe = False
+
+            data = _frame(payload)
+            self.writer.write(data)
+            self.sent_bytes += len(data)
+            self.sent_messages += 1
+            # Ждем только свой сокет: игровой цикл и другие клиенты
+            # продолжают работать. Совсем зависший клиент отключаем
+            try:
+                await asyncio.wait_for(self.writer.drain(), SEND_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError):
+                return
+
+    async def receive_loop(self):
+        while not self.closed:
+            try:
+                message = await _read_message(self.reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            if message[0] == MSG_INPUT and len(message) == _INPUT.size:
+                if self._take_input_token():
+                    self.server.receive_input(self, message[1])
+
+    def _take_input_token(self) -> bool:
+        # Корзина токенов: лишний ввод сверх INPUT_RATE отбрасывается
+        now = time.monotonic()
+        self.input_tokens = min(
+            float(INPUT_RATE),
+            self.input_tokens + (now - self.input_time) * INPUT_RATE)
+        self.input_time = now
+        if self.input_tokens < 1.0:
+            return False
+        self.input_tokens -= 1.0
+        return True
+
+
+class GameServer:
+    # Авторитетная симуляция: только сервер двигает мир и рассылает
+    # изменения. Управляет игроком первый клиент с ролью игрока, без него
+    # играет бот из runner, чтобы зрителям было на что смотреть
+
+    def __init__(self, level: Optional[List[str]] = None, seed: int = 0,
+                 tick_rate: int = TICK_RATE,
+                 keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.level = level
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.keyframe_interval = keyframe_interval
+        self.clients = []  # Получают обновления (после приветствия)
+        self.connections = []  # Все открытые соединения
+        self.controller = None
+        self.pending_input = None
+        self.running = False
+        self.server = None
+        self.ticks = 0
+        self.games = 0
+        self.late_ticks = 0
+        self.bot_rng = random.Random(seed)
+        self._keyframe_tick = None
+        self._keyframe = None
+        self._new_game()
+
+    def _new_game(self):
+        self.sim = Simulation(self.level, f"{self.seed}:{self.games}")
+        self.games += 1
+        self.positions = _entity_positions(self.sim)
+        self.dots_left = self.sim.collectibles.total
+        self.score = self.sim.score
+        self.game_over_ticks = 0
+        i = 0
+        while i < len(self.clients):
+            self.clients[i].mark_keyframe()
+            i += 1
+
+    def keyframe(self) -> bytes:
+        # Один снимок на тик для всех клиентов, которым он нужен
+        if self._keyframe_tick != (self.games, self.sim.tick_count):
+            self._keyframe_tick = (self.games, self.sim.tick_count)
+            self._keyframe = bytes((MSG_KEYFRAME,)) + snapshot.dumps(
+                self.sim)
+        return self._keyframe
+
+    def receive_input(self, client: ClientConnection, code: int):
+        if client is self.controller and code <= len(DIRECTIONS):
+            self.pending_input = DIRECTIONS[code - 1] if code else None
+
+    def tick(self):
+        sim = self.sim
+        self.ticks += 1
+        if sim.done:
+            self.game_over_ticks += 1
+            if self.game_over_ticks >= RESTART_DELAY:
+                self._new_game()
+            return
+
+        if self.controller is not None:
+            direction = self.pending_input
+            self.pending_input = None
+        else:
+            direction = wander_policy(sim, self.bot_rng)
+        sim.apply_input(direction)
+        sim.update_enemies()
+        sim.update_timers()
+
+        # Что изменилось за тик: сдвинутые объекты и собранная точка
+        # (точку можно собрать только в клетке игрока)
+        positions = _entity_positions(sim)
+        moved = {}
+        i = 0
+        while i < len(positions):
+            if positions[i] != self.positions[i]:
+                moved[i] = positions[i]
+            i += 1
+        self.positions = positions
+        dots = []
+        if sim.collectibles.total != self.dots_left:
+            dots.append((sim.player.x, sim.player.y))
+            self.dots_left = sim.collectibles.total
+        score_delta = sim.score - self.score
+        self.score = sim.score
+        flags = (FLAG_WON if sim.game_won else 0) | (
+            FLAG_LOST if sim.game_lost else 0)
+
+        keyframe = sim.tick_count % self.keyframe_interval == 0
+        i = 0
+        while i < len(self.clients):
+            if keyframe:
+                self.clients[i].mark_keyframe()
+            else:
+                self.clients[i].add_tick(sim, moved, dots, score_delta,
+                                         flags)
+            i += 1
+
+    async def _game_loop(self):
+        loop = asyncio.get_running_loop()
+        tick_time = 1.0 / self.tick_rate
+        next_time = loop.time()
+        while self.running:
+            self.tick()
+            next_time += tick_time
+            delay = next_time - loop.time()
+            if delay < -MAX_LAG:
+                self.late_ticks += 1
+                next_time = loop.time()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter):
+        client = ClientConnection(self, reader, writer)
+        self.connections.append(client)
+        try:
+            hello = await asyncio.wait_for(_read_message(reader),
+                                           SEND_TIMEOUT)
+            if hello[0] != MSG_HELLO or len(hello) != _HELLO.size:
+                return
+            _, role, rate = _HELLO.unpack(hello)
+            if rate:
+                client.interval = 1.0 / rate
+            if role == ROLE_PLAYER and self.controller is None:
+                client.role = ROLE_PLAYER
+                self.controller = client
+            writer.write(_frame(_WELCOME.pack(MSG_WELCOME, client.role)))
+
+            self.clients.append(client)
+            client.mark_keyframe()
+            client.tasks = [asyncio.ensure_future(client.send_loop()),
+                            asyncio.ensure_future(client.receive_loop())]
+            await asyncio.wait(client.tasks,
+                               return_when=asyncio.FIRST_COMPLETED)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ConnectionError):
+            pass
+        finally:
+            client.close()
+            self.connections.remove(client)
+            if client in self.clients:
+                self.clients.remove(client)
+            if self.controller is client:
+                self.controller = None
+                self.pending_input = None
+
+    async def start(self, host: str = '127.0.0.1',
+                    port: int = DEFAULT_PORT):
+        self.server = await asyncio.start_server(self._handle_client,
+                                                 host, port)
+        self.running = True
+        self.loop_task = asyncio.ensure_future(self._game_loop())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def pause(self):
+        # Останавливает игровой цикл, соединения остаются
+        self.running = False
+        await self.loop_task
+
+    async def stop(self):
+        await self.pause()
+        self.server.close()
+        # Закрываем соединения и ждем, пока их обработчики завершатся
+        handlers = list(self.connections)
+        i = 0
+        while i < len(handlers):
+            handlers[i].close()
+            i += 1
+        while self.connections:
+            await asyncio.sleep(0.01)
+        await self.server.wait_closed()
+
+
+def apply_delta(sim: Simulation, payload: bytes):
+    # Применяет дельту сервера к локальной копии мира
+    (_, tick, score_delta, moves_count, flags, moved_count,
+     dot_count) = _DELTA.unpack_from(payload, 0)
+    position = _DELTA.size
+    i = 0
+    while i < moved_count:
+        index, x, y, direction, chase = _MOVED.unpack_from(payload,
+                                                           position)
+        position += _MOVED.size
+        entity = sim.player if index == 0 else sim.enemies[index - 1]
+        entity.x = x
+        entity.y = y
+        entity.direction = DIRECTIONS[direction]
+        if index != 0:
+            entity.chase_mode = chase
+        i += 1
+    store = sim.collectibles
+    i = 0
+    while i < dot_count:
+        x, y = _DOT.unpack_from(payload, position)
+        position += _DOT.size
+        store.collect(x, y, store.get(x, y))
+        i += 1
+    sim.tick_count = tick
+    sim.score += score_delta
+    sim.moves_count = moves_count
+    sim.game_won = bool(flags & FLAG_WON)
+    sim.game_lost = bool(flags & FLAG_LOST)
+
+
+class SpectatorClient:
+    # Клиент без окна: держит копию мира из снимков и дельт.
+    # С ролью игрока может отправлять ввод (send_input)
+
+    def __init__(self, role: int = ROLE_SPECTATOR, rate: int = 0):
+        self.role = role
+        self.rate = rate
+        self.sim = None
+        self.keyframes = 0
+        self.deltas = 0
+        self.received_bytes = 0
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host: str = '127.0.0.1',
+                      port: int = DEFAULT_PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(_frame(_HELLO.pack(MSG_HELLO, self.role,
+                                             self.rate)))
+        welcome = await _read_message(self.reader)
+        self.role = welcome[1]
+
+    def send_input(self, direction):
+        code = 0 if direction is None else DIRECTION_INDEX[direction] + 1
+        self.writer.write(_frame(_INPUT.pack(MSG_INPUT, code)))
+
+    async def receive(self, duration: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+        while True:
+            left = deadline - loop.time()
+            if left <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(
+                    _read_message(self.reader), left)
+            except asyncio.TimeoutError:
+                return
+            self.received_bytes += len(message) + _FRAME.size
+            if message[0] == MSG_KEYFRAME:
+                self.sim = snapshot.loads(message[1:])
+                self.keyframes += 1
+            elif message[0] == MSG_DELTA and self.sim is not None:
+                apply_delta(self.sim, message)
+                self.deltas += 1
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def _receive_all(watchers: List[SpectatorClient], duration: float):
+    tasks = []
+    i = 0
+    while i < len(watchers):
+        tasks.append(watchers[i].receive(duration))
+        i += 1
+    await asyncio.gather(*tasks)
+
+
+async def _local_test(clients: int, slow: int, duration: float,
+                      rate: int) -> Dict:
+    # Сервер, быстрые и медленные клиенты в одном процессе на localhost.
+    # Медленный клиент подключается и не читает ничего
+    server = GameServer(seed=1)
+    port = await server.start('127.0.0.1', 0)
+    watchers = []
+    i = 0
+    while i < clients:
+        client = SpectatorClient(rate=rate if i % 2 else 0)
+        await client.connect('127.0.0.1', port)
+        watchers.append(client)
+        i += 1
+    stalled = []
+    i = 0
+    while i < slow:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(_frame(_HELLO.pack(MSG_HELLO, ROLE_SPECTATOR, 0)))
+        stalled.append(writer)
+        i += 1
+
+    started = time.perf_counter()
+    await _receive_all(watchers, duration)
+    elapsed = time.perf_counter() - started
+    ticks = server.ticks
+
+    # Останавливаем мир, дочитываем последние дельты и сверяем копии
+    # клиентов с сервером (тик у клиента - тик последнего изменения)
+    await server.pause()
+    await _receive_all(watchers, 0.5)
+    state = server.sim.get_state()
+    del state['tick']
+    in_sync = 0
+    received = 0
+    keyframes = 0
+    deltas = 0
+    i = 0
+    while i < len(watchers):
+        watcher = watchers[i]
+        received += watcher.received_bytes
+        keyframes += watcher.keyframes
+        deltas += watcher.deltas
+        if watcher.sim is not None:
+            copy = watcher.sim.get_state()
+            del copy['tick']
+            if (copy == state and
+                    _entity_positions(watcher.sim) == server.positions):
+                in_sync += 1
+        i += 1
+    report = {
+        'ticks_per_second': ticks / elapsed,
+        'late_ticks': server.late_ticks,
+        'clients': clients,
+        'slow_clients': slow,
+        'in_sync': in_sync,
+        'bytes_per_client_per_second': received / max(1, clients) / elapsed,
+        'keyframes': keyframes,
+        'deltas': deltas,
+    }
+
+    await server.stop()
+    i = 0
+    while i < len(watchers):
+        await watchers[i].close()
+        i += 1
+    i = 0
+    while i < len(stalled):
+        stalled[i].close()
+        i += 1
+    return report
+
+
+async def _serve(host: str, port: int, seed: int):
+    server = GameServer(seed=seed)
+    port = await server.start(host, port)
+    print(f"Сервер Pacman: {host}:{port}")
+    while True:
+        await asyncio.sleep(3600)
+
+
+async def _watch(host: str, port: int, duration: float, rate: int):
+    client = SpectatorClient(rate=rate)
+    await client.connect(host, port)
+    await client.receive(duration)
+    await client.close()
+    print(json.dumps(client.sim.get_state() if client.sim else None))
+    print(f"снимков {client.keyframes}, дельт {client.deltas}, "
+          f"байт {client.received_bytes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Трансляция партии Pacman зрителям по TCP")
+    parser.add_argument('mode', choices=('serve', 'watch', 'test'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--rate', type=int, default=0,
+                        help="не больше стольких обновлений в секунду")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--slow', type=int, default=5,
+                        help="клиентов, которые ничего не читают")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        asyncio.run(_serve(args.host, args.port, args.seed))
+    elif args.mode == 'watch':
+        asyncio.run(_watch(args.host, args.port, args.duration, args.rate))
+    else:
+        report = asyncio.run(_local_test(args.clients, args.slow,
+                                         args.duration, args.rate or 10))
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1231 @@
+import bisect
+import heapq
+import random
+from array import array
+from enum import Enum
+from typing import List, Optional
+
+
+# Константы симуляции
+MAP_WIDTH = 25
+MAP_HEIGHT = 21
+MOVE_DELAY = 8  # Задержка между движениями для контроля
+ENEMY_MOVE_PERIOD = 20  # Призраки ходят раз в 20 тиков
+CHASE_DISTANCE = 7  # Радиус включения преследования
+DOT_SCORE = 10
+BIG_DOT_SCORE = 50
+FIELD_CACHE_CELLS = 1 << 20  # Сколько клеток полей расстояний помнить
+VECTOR_GHOSTS = 64  # С этого числа призраков обновление идет через NumPy
+
+# Содержимое клетки в хранилище точек
+NO_DOT = 0
+DOT_CELL = 1
+BIG_DOT_CELL = 2
+
+CLASSIC_MAP = [
+    "1111111111111111111111111",
+    "1............1..........1",
+    "1o111.111111.1.11111.11..1",
+    "1.......................1",
+    "1.111.1.111111111.1.111.1",
+    "1.....1.....1.....1.....1",
+    "1111.11111.111.11111.1111",
+    "1......1...X.X.X.1......1",
+    "1.111.1111.....1111.111.1",
+    "1.......................1",
+    "1.1111.1111.1.1111.1111.1",
+    "1.....C...1.P.1...C.....1",
+    "1111111.1.1...1.1.1111111",
+    "1.......1.1.1.1.1.......1",
+    "1.1111.1...111...1.1111.1",
+    "1.1..1.1..........1.1...1",
+    "1.1..1.1.........1......1",
+    "1.1..1............1.....1",
+    "1......1.........1......1",
+    "1o111111..11.11..111111..1",
+    "1.........1.E.1.........1",
+    "1111111111111111111111111"
+]
+
+
+UNREACHABLE = -1  # Клетка недостижима от игрока
+NO_CELL = -1  # Соседа нет: стена или край карты
+NO_NODE = -1  # Клетка не узел графа развилок / ребра нет
+
+
+class TileType(Enum):
+    EMPTY = '0'
+    WALL = '1'
+    DOT = '.'
+    BIG_DOT = 'o'
+    COLLECTIBLE = 'C'
+    EXIT = 'E'
+    PLAYER = 'P'
+    ENEMY = 'X'
+
+
+class Direction(Enum):
+    UP = (0, -1)
+    DOWN = (0, 1)
+    LEFT = (-1, 0)
+    RIGHT = (1, 0)
+
+
+# Направления по номерам, в порядке перебора призраками.
+# Горячие циклы работают с номерами, а не с Direction.value
+DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+DIRECTION_INDEX = {Direction.UP: 0, Direction.DOWN: 1,
+                   Direction.LEFT: 2, Direction.RIGHT: 3}
+DIRECTION_DX = (0, 0, -1, 1)
+DIRECTION_DY = (-1, 1, 0, 0)
+OPPOSITE = (1, 0, 3, 2)  # Обратное направление по номеру
+
+
+def _open_direction_lists() -> tuple:
+    # Для каждой маски (4 бита) - номера открытых направлений по порядку
+    lists = []
+    mask = 0
+    while mask < 16:
+        open_directions = []
+        d = 0
+        while d < 4:
+            if mask >> d & 1:
+                open_directions.append(d)
+            d += 1
+        lists.append(tuple(open_directions))
+        mask += 1
+    return tuple(lists)
+
+
+OPEN_DIRECTIONS = _open_direction_lists()
+
+
+def _corridor_exits() -> tuple:
+    # Для маски клетки коридора и направления, которым в нее вошли
+    # (индекс mask * 4 + d), - направление дальше по коридору, или -1,
+    # если открыто не два направления или пришли не через одно из них
+    exits = []
+    mask = 0
+    while mask < 16:
+        d = 0
+        while d < 4:
+            back = OPPOSITE[d]
+            if len(OPEN_DIRECTIONS[mask]) == 2 and mask >> back & 1:
+                exits.append(OPEN_DIRECTIONS[mask & ~(1 << back)][0])
+            else:
+                exits.append(-1)
+            d += 1
+        mask += 1
+    return tuple(exits)
+
+
+CORRIDOR_EXITS = _corridor_exits()
+
+
+class Maze:
+    # Скомпилированная карта: для каждой клетки битовая маска открытых
+    # направлений и плоский массив соседей (4 на клетку, NO_CELL если
+    # там стена или край). Строится один раз, стены дальше не меняются.
+
+    def __init__(self, game_map: List[List[str]], map_width: int,
+                 map_height: int):
+        self.width = map_width
+        self.height = map_height
+        size = map_width * map_height
+
+        self.walkable = bytearray(size)
+        y = 0
+        while y < map_height:
+            row = game_map[y]
+            x = 0
+            while x < min(map_width, len(row)):
+                if row[x] != TileType.WALL.value:
+                    self.walkable[y * map_width + x] = 1
+                x += 1
+            y += 1
+
+        self.open_dirs = bytearray(size)
+        self.neighbors = array('i', [NO_CELL]) * (size * 4)
+        y = 0
+        while y < map_height:
+            x = 0
+            while x < map_width:
+                cell = y * map_width + x
+                d = 0
+                while d < 4:
+                    nx = x + DIRECTION_DX[d]
+                    ny = y + DIRECTION_DY[d]
+                    if (0 <= nx < map_width and 0 <= ny < map_height and
+                            self.walkable[ny * map_width + nx]):
+                        self.open_dirs[cell] |= 1 << d
+                        self.neighbors[cell * 4 + d] = ny * map_width + nx
+                    d += 1
+                x += 1
+            y += 1
+        self._junctions = None
+
+    @property
+    def junctions(self) -> 'JunctionGraph':
+        # Граф развилок строится при первом обращении
+        if self._junctions is None:
+            self._junctions = JunctionGraph(self)
+        return self._junctions
+
+    def index(self, x: int, y: int) -> int:
+        return y * self.width + x
+
+    def can_move(self, x: int, y: int, direction: int) -> bool:
+        return self.open_dirs[y * self.width + x] >> direction & 1 == 1
+
+
+class JunctionGraph:
+    # Граф развилок: узлы - клетки, где проходов не два (развилки и
+    # тупики), ребра - коридоры между ними с длиной в шагах. Кольцо без
+    # развилок получает один узел. Ребро из узла n в направлении d лежит
+    # в плоских таблицах под номером n * 4 + d. Каждая клетка коридора
+    # знает свое ребро и расстояние от его начального узла, так что
+    # расстояние до нее - это расстояние до одного из концов коридора.
+
+    def __init__(self, maze: Maze):
+        size = maze.width * maze.height
+        self.cells = array('i')  # Клетка каждого узла
+        self.node = array('i', [NO_NODE]) * size  # Узел каждой клетки
+        # Ребро клетки коридора (номер n * 4 + d от начального узла) и
+        # шагов от этого узла до клетки
+        self.edge = array('i', [NO_NODE]) * size
+        self.offset = array('i', [0]) * size
+        self.targets = array('i')  # Узел на другом конце ребра
+        self.lengths = array('i')  # Длина ребра
+        self.distances = None  # Расстояния между всеми узлами, если есть
+
+        walkable = maze.walkable
+        open_dirs = maze.open_dirs
+        cell = 0
+        while cell < size:
+            if (walkable[cell] and
+                    len(OPEN_DIRECTIONS[open_dirs[cell]]) != 2):
+                self._add_node(cell)
+            cell += 1
+        seen = bytearray(size)
+        node = 0
+        while node < len(self.cells):
+            self._walk_edges(maze, node, seen)
+            node += 1
+
+        # Клетки коридоров, до которых не дошли, лежат на кольцах
+        cell = 0
+        while cell < size:
+            if (walkable[cell] and not seen[cell] and
+                    self.node[cell] == NO_NODE):
+                self._walk_edges(maze, self._add_node(cell), seen)
+            cell += 1
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def _add_node(self, cell: int) -> int:
+        self.node[cell] = len(self.cells)
+        self.cells.append(cell)
+        self.targets.extend((NO_NODE, NO_NODE, NO_NODE, NO_NODE))
+        self.lengths.extend((0, 0, 0, 0))
+        return len(self.cells) - 1
+
+    def _walk_edges(self, maze: Maze, node: int, seen: bytearray):
+        # Проход по каждому коридору из узла до следующего узла
+        start = self.cells[node]
+        options = OPEN_DIRECTIONS[maze.open_dirs[start]]
+        i = 0
+        while i < len(options):
+            direction = options[i]
+            cell = maze.neighbors[start * 4 + direction]
+            length = 1
+            while self.node[cell] == NO_NODE:
+                if not seen[cell]:
+                    # Коридор проходится с обоих концов, запоминается
+                    # первый проход
+                    seen[cell] = 1
+                    self.edge[cell] = node * 4 + options[i]
+                    self.offset[cell] = length
+                # В коридоре открыты ровно два направления, одно - назад
+                mask = maze.open_dirs[cell] & ~(1 << OPPOSITE[direction])
+                direction = OPEN_DIRECTIONS[mask][0]
+                cell = maze.neighbors[cell * 4 + direction]
+                length += 1
+            self.targets[node * 4 + options[i]] = self.node[cell]
+            self.lengths[node * 4 + options[i]] = length
+            i += 1
+
+    def distances_from(self, source: int) -> list:
+        # Дейкстра по узлам: ребер в разы меньше, чем клеток
+        best = [UNREACHABLE] * len(self.cells)
+        best[source] = 0
+        heap = [(0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > best[node]:
+                continue
+            base = node * 4
+            d = 0
+            while d < 4:
+                target = self.targets[base + d]
+                if target != NO_NODE:
+                    total = distance + self.lengths[base + d]
+                    if best[target] == UNREACHABLE or total < best[target]:
+                        best[target] = total
+                        heapq.heappush(heap, (total, target))
+                d += 1
+        return best
+
+    def all_pairs(self) -> array:
+        # Плоская таблица len x len: строка a - расстояния от узла a
+        table = array('i')
+        node = 0
+        while node < len(self.cells):
+            table.extend(self.distances_from(node))
+            node += 1
+        return table
+
+    def distance(self, a: int, b: int) -> int:
+        if self.distances is not None:
+            return self.distances[a * len(self.cells) + b]
+        return self.distances_from(a)[b]
+
+
+class DotStore:
+    # Точки по клеткам: один байт на клетку и живые счетчики.
+    # Сбор и проверка клетки - O(1), поиск следующей точки идет через
+    # bytearray.find, то есть обход для отрисовки выполняется на C.
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width * height)
+        self.dot_count = 0
+        self.big_dot_count = 0
+
+    @property
+    def total(self) -> int:
+        return self.dot_count + self.big_dot_count
+
+    def add(self, x: int, y: int, kind: int):
+        index = y * self.width + x
+        self._forget(self.cells[index])
+        self.cells[index] = kind
+        if kind == DOT_CELL:
+            self.dot_count += 1
+        elif kind == BIG_DOT_CELL:
+            self.big_dot_count += 1
+
+    def get(self, x: int, y: int) -> int:
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return NO_DOT
+        return self.cells[y * self.width + x]
+
+    def collect(self, x: int, y: int, kind: int) -> bool:
+        # Забирает точку нужного типа из клетки, если она там есть
+        index = y * self.width + x
+        if self.cells[index] != kind:
+            return False
+        self.cells[index] = NO_DOT
+        self._forget(kind)
+        return True
+
+    def copy(self) -> 'DotStore':
+        # Байты клеток копируются одним memcpy
+        store = DotStore.__new__(DotStore)
+        store.width = self.width
+        store.height = self.height
+        store.cells = bytearray(self.cells)
+        store.dot_count = self.dot_count
+        store.big_dot_count = self.big_dot_count
+        return store
+
+    def _forget(self, kind: int):
+        if kind == DOT_CELL:
+            self.dot_count -= 1
+        elif kind == BIG_DOT_CELL:
+            self.big_dot_count -= 1
+
+    def positions(self, kind: int, first_x: int = 0, first_y: int = 0,
+                  last_x: int = None, last_y: int = None) -> list:
+        # Клетки с точками нужного типа внутри прямоугольника (включительно)
+        if last_x is None:
+            last_x = self.width - 1
+        if last_y is None:
+            last_y = self.height - 1
+        first_x = max(first_x, 0)
+        first_y = max(first_y, 0)
+        last_x = min(last_x, self.width - 1)
+        last_y = min(last_y, self.height - 1)
+
+        result = []
+        key = bytes((kind,))
+        y = first_y
+        while y <= last_y:
+            row_start = y * self.width
+            end = row_start + last_x + 1
+            index = self.cells.find(key, row_start + first_x, end)
+            while index != -1:
+                result.append((index - row_start, y))
+                index = self.cells.find(key, index + 1, end)
+            y += 1
+        return result
+
+
+class DistanceField:
+    # Расстояния по лабиринту (BFS) от клетки игрока до всех клеток.
+    # Одно поле на всех призраков; пересчитывается лениво - только когда
+    # его запросили, а игрок успел сменить клетку.
+
+    def __init__(self, maze: Maze):
+        self.maze = maze
+        self.width = maze.width
+        self.distances = [UNREACHABLE] * (maze.width * maze.height)
+        self.source = None
+        self.rebuilds = 0
+        # Готовые поля по клетке игрока; общий для всех копий поля, так
+        # что прогоны поиска по дереву не пересчитывают одно и то же
+        self.cache = {}
+
+    def update(self, x: int, y: int):
+        if self.source == (x, y):
+            return
+        self.source = (x, y)
+        cached = self.cache.get(self.source)
+        if cached is not None:
+            self.distances = cached
+            return
+        self.rebuilds += 1
+
+        neighbors = self.maze.neighbors
+        distances = [UNREACHABLE] * len(self.distances)
+        start = y * self.width + x
+        distances[start] = 0
+        queue = [start]
+        head = 0
+        while head < len(queue):
+            cell = queue[head]
+            head += 1
+            next_distance = distances[cell] + 1
+            base = cell * 4
+            d = 0
+            while d < 4:
+                neighbor = neighbors[base + d]
+                d += 1
+                if neighbor != NO_CELL and distances[neighbor] == UNREACHABLE:
+                    distances[neighbor] = next_distance
+                    queue.append(neighbor)
+        self.distances = distances
+        if len(self.cache) * len(distances) >= FIELD_CACHE_CELLS:
+            # Выбрасываем самое старое поле (словарь хранит порядок вставки)
+            del self.cache[next(iter(self.cache))]
+        self.cache[self.source] = distances
+
+    def get(self, x: int, y: int) -> int:
+        return self.distances[y * self.width + x]
+
+    def cell_distance(self, cell: int) -> int:
+        return self.distances[cell]
+
+    def copy(self) -> 'DistanceField':
+        # update() не меняет список расстояний, а заменяет его новым,
+        # поэтому копии делят списки и кэш полей
+        field = DistanceField.__new__(DistanceField)
+        field.__dict__.update(self.__dict__)
+        return field
+
+
+class JunctionField:
+    # Расстояния по лабиринту до игрока через граф развилок - замена
+    # DistanceField для призраков. Дейкстра по узлам идет от клетки игрока
+    # лениво: только до тех пор, пока не станет известно запрошенное
+    # расстояние, и продолжается со следующего запроса. Преследуют только
+    # призраки рядом с игроком, так что обычно раскрывается горстка узлов
+    # вместо обхода всех клеток карты. Ответы те же, что у DistanceField.
+
+    def __init__(self, maze: Maze):
+        self.maze = maze
+        self.graph = maze.junctions
+        self.width = maze.width
+        self.source = None
+        self.search = None
+        self.rebuilds = 0
+        # Поиски по клетке игрока; общий для всех копий поля. Поиск
+        # зависит только от клетки игрока, поэтому копии могут продолжать
+        # один и тот же
+        self.cache = {}
+
+    def update(self, x: int, y: int):
+        if self.source == (x, y):
+            return
+        self.source = (x, y)
+        search = self.cache.get(self.source)
+        if search is not None:
+            self.search = search
+            return
+        self.rebuilds += 1
+
+        # Поиск: (ребро игрока, шаг на нем, итоговые расстояния узлов,
+        # предварительные расстояния, куча, готовые ответы по клеткам)
+        graph = self.graph
+        cell = y * self.width + x
+        node = graph.node[cell]
+        if node != NO_NODE:
+            search = (NO_NODE, 0, {}, {node: 0}, [(0, node)], {})
+        else:
+            edge = graph.edge[cell]
+            offset = graph.offset[cell]
+            rest = graph.lengths[edge] - offset
+            start = edge >> 2
+            end = graph.targets[edge]
+            tentative = {start: offset}
+            if end not in tentative or rest < offset:
+                tentative[end] = rest
+            search = (edge, offset, {}, tentative,
+                      [(offset, start), (rest, end)], {})
+            heapq.heapify(search[4])
+        self.search = search
+        if len(self.cache) * len(graph) >= FIELD_CACHE_CELLS:
+            del self.cache[next(iter(self.cache))]
+        self.cache[self.source] = search
+
+    def _settle(self, node: int, limit: Optional[int] = None) -> int:
+        # Расстояние до узла, если оно не больше limit, иначе UNREACHABLE
+        _, _, done, tentative, heap, _ = self.search
+        graph = self.graph
+        targets = graph.targets
+        lengths = graph.lengths
+        while node not in done:
+            if not heap or (limit is not None and heap[0][0] > limit):
+                return UNREACHABLE
+            distance, current = heapq.heappop(heap)
+            if current in done:
+                continue
+            done[current] = distance
+            base = current * 4
+            d = 0
+            while d < 4:
+                target = targets[base + d]
+                if target != NO_NODE and target not in done:
+                    total = distance + lengths[base + d]
+                    known = tentative.get(target)
+                    if known is None or total < known:
+                        tentative[target] = total
+                        heapq.heappush(heap, (total, target))
+                d += 1
+        distance = done[node]
+        if limit is not None and distance > limit:
+            return UNREACHABLE
+        return distance
+
+    def cell_distance(self, cell: int) -> int:
+        known = self.search[5]
+        distance = known.get(cell)
+        if distance is not None:
+            return distance
+        graph = self.graph
+        node = graph.node[cell]
+        if node != NO_NODE:
+            distance = self._settle(node)
+        else:
+            edge = graph.edge[cell]
+            offset = graph.offset[cell]
+            distance = UNREACHABLE
+            if edge == self.search[0]:
+                # Тот же коридор: можно дойти, не выходя из него
+                distance = abs(offset - self.search[1])
+            distance = self._through(edge >> 2, offset, distance)
+            distance = self._through(graph.targets[edge],
+                                     graph.lengths[edge] - offset, distance)
+        known[cell] = distance
+        return distance
+
+    def _through(self, node: int, extra: int, best: int) -> int:
+        # Путь через конец коридора node, до клетки еще extra шагов
+        if best == UNREACHABLE:
+            distance = self._settle(node)
+        else:
+            distance = self._settle(node, best - extra - 1)
+        if distance == UNREACHABLE:
+            return best
+        return distance + extra
+
+    def get(self, x: int, y: int) -> int:
+        return self.cell_distance(y * self.width + x)
+
+    def copy(self) -> 'JunctionField':
+        field = JunctionField.__new__(JunctionField)
+        field.__dict__.update(self.__dict__)
+        return field
+
+
+class Simulation:
+    # Игровой мир без pygame: карта, игрок, призраки, точки, счет.
+    # Один вызов step() - один кадр оригинального игрового цикла.
+
+    def __init__(self, level: Optional[List[str]] = None,
+                 seed: Optional[int] = None, compiled=None):
+        if compiled is not None:
+            self.map_width = compiled.map_width
+            self.map_height = compiled.map_height
+        elif level is None:
+            level = CLASSIC_MAP
+            self.map_width = MAP_WIDTH
+            self.map_height = MAP_HEIGHT
+        else:
+            self.map_width = len(level[0])
+            self.map_height = len(level)
+
+        # Собственный генератор, чтобы партии были воспроизводимы
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # Состояние игры
+        self.moves_count = 0
+        self.score = 0
+        self.game_won = False
+        self.game_lost = False
+        self.tick_count = 0
+
+        # Игровые объекты
+        self.player = None
+        self.ghosts = GhostStore(self.rng)
+        self.collectibles = None
+        self.exits = []
+        self.game_map = []
+        self.map_version = 0  # Растет при каждой смене карты
+
+        # Управление
+        self.move_timer = 0
+        self.last_direction = None
+        self.pending_direction = None
+
+        # Таймеры эффектов (ведутся в тиках симуляции)
+        self.screen_flash = 0
+        self.victory_animation = 0
+
+        if compiled is not None:
+            # Карта из mapfile: разбор и таблицы лабиринта уже готовы
+            compiled.populate(self)
+        else:
+            self._load_map(level)
+            self._find_game_objects()
+            # Проходимость клеток
+            self.maze = Maze(self.game_map, self.map_width, self.map_height)
+
+        # Общее поле расстояний до игрока (по графу развилок)
+        self.chase_field = JunctionField(self.maze)
+
+    @property
+    def done(self) -> bool:
+        return self.game_won or self.game_lost
+
+    @property
+    def dots_left(self) -> int:
+        return self.collectibles.total
+
+    @property
+    def enemies(self) -> 'GhostList':
+        # Призраки как последовательность объектов Enemy
+        return self.ghosts.views
+
+    @enemies.setter
+    def enemies(self, enemies):
+        # Замена набора призраков: поля каждого переносятся в новое
+        # хранилище
+        store = GhostStore(self.rng)
+        i = 0
+        while i < len(enemies):
+            enemy = enemies[i]
+            index = store.add(enemy.x, enemy.y, enemy.color, enemy.timer)
+            store.direction[index] = DIRECTION_INDEX[enemy.direction]
+            store.stuck_timer[index] = enemy.stuck_timer
+            store.chase[index] = enemy.chase_mode
+            i += 1
+        self.ghosts = store
+
+    def _load_map(self, level: List[str]):
+        self.map_version += 1
+        self.game_map = []
+        i = 0
+        while i < len(level):
+            row = []
+            j = 0
+            while j < len(level[i]):
+                row.append(level[i][j])
+                j += 1
+            self.game_map.append(row)
+            i += 1
+
+    def _find_game_objects(self):
+        columns = 0
+        y = 0
+        while y < len(self.game_map):
+            columns = max(columns, len(self.game_map[y]))
+            y += 1
+        self.collectibles = DotStore(columns, len(self.game_map))
+        self.exits = []
+        self.ghosts = GhostStore(self.rng)
+
+        y = 0
+        while y < len(self.game_map):
+            x = 0
+            while x < len(self.game_map[y]):
+                tile = self.game_map[y][x]
+                if tile == TileType.PLAYER.value:
+                    self.player = Player(x, y)
+                    self.game_map[y][x] = TileType.EMPTY.value
+                elif tile == TileType.DOT.value:
+                    self.collectibles.add(x, y, DOT_CELL)
+                elif tile == TileType.BIG_DOT.value:
+                    self.collectibles.add(x, y, BIG_DOT_CELL)
+                    self.game_map[y][x] = TileType.EMPTY.value
+                elif tile == TileType.COLLECTIBLE.value:
+                    # Превращаем в обычные точки
+                    self.collectibles.add(x, y, DOT_CELL)
+                    self.game_map[y][x] = TileType.EMPTY.value
+                elif tile == TileType.EXIT.value:
+                    self.exits.append((x, y))
+                elif tile == TileType.ENEMY.value:
+                    # Создаем разноцветных призраков
+                    ghost_color = len(self.ghosts) % 4
+                    self.ghosts.add(x, y, ghost_color)
+                    self.game_map[y][x] = TileType.EMPTY.value
+                x += 1
+            y += 1
+
+    def step(self, action: Optional[Direction] = None) -> dict:
+        self.apply_input(action)
+        self.update_enemies()
+        self.update_timers()
+        return self.get_state()
+
+    def clone(self, rng: Optional[random.Random] = None) -> 'Simulation':
+        # Быстрая копия для перебора вариантов (поиск по дереву). Карта,
+        # лабиринт и выходы после загрузки не меняются и остаются общими;
+        # копируются байты точек, игрок и призраки. Если передан rng,
+        # копия и ее призраки используют его вместо копии генератора
+        # оригинала - так копии расходятся в случайных ходах призраков
+        sim = Simulation.__new__(Simulation)
+        sim.__dict__.update(self.__dict__)
+        if rng is None:
+            rng = random.Random()
+            rng.setstate(self.rng.getstate())
+        sim.rng = rng
+        sim.collectibles = self.collectibles.copy()
+        sim.chase_field = self.chase_field.copy()
+        if self.player is not None:
+            sim.player = self.player.copy()
+        sim.ghosts = self.ghosts.copy(rng)
+        return sim
+
+    def get_state(self) -> dict:
+        return {
+            'tick': self.tick_count,
+            'score': self.score,
+            'moves_count': self.moves_count,
+            'dots_left': self.collectibles.total,
+            'player': (self.player.x, self.player.y),
+            'game_won': self.game_won,
+            'game_lost': self.game_lost,
+            'done': self.done,
+        }
+
+    def apply_input(self, new_direction: Optional[Direction]):
+        # Сохраняем направление для следующего движения
+        if new_direction:
+            self.pending_direction = new_direction
+
+        # Двигаемся только через определенные интервалы
+        if self.move_timer <= 0 and self.pending_direction:
+            if self._can_move_in_direction(self.pending_direction):
+                self._move_player(self.pending_direction)
+                self.move_timer = MOVE_DELAY
+                self.last_direction = self.pending_direction
+            # Если не можем идти в желаемом направлении, продолжаем в текущем
+            elif (self.last_direction and
+                  self._can_move_in_direction(self.last_direction)):
+                self._move_player(self.last_direction)
+                self.move_timer = MOVE_DELAY
+
+    def _can_move_in_direction(self, direction: Direction) -> bool:
+        if not self.player:
+            return False
+        return self.maze.can_move(self.player.x, self.player.y,
+                                  DIRECTION_INDEX[direction])
+
+    def _move_player(self, direction: Direction):
+        if not self.player or self.game_won or self.game_lost:
+            return
+
+        new_x = self.player.x + direction.value[0]
+        new_y = self.player.y + direction.value[1]
+
+        # Перемещение игрока
+        self.player.x = new_x
+        self.player.y = new_y
+        self.player.direction = direction
+        self.moves_count += 1
+
+        # Проверка сбора точек
+        self._check_dots()
+        self._check_big_dots()
+
+        # Проверка выхода
+        self._check_exits()
+
+        # Проверка столкновения с врагами
+        self._check_enemy_collision()
+
+    def _check_dots(self):
+        if self.collectibles.collect(self.player.x, self.player.y, DOT_CELL):
+            self.score += DOT_SCORE
+
+    def _check_big_dots(self):
+        if self.collectibles.collect(self.player.x, self.player.y,
+                                     BIG_DOT_CELL):
+            self.score += BIG_DOT_SCORE
+            # Эффект съедания большой точки
+            self.screen_flash = 10
+
+    def _check_exits(self):
+        # Выход активен только когда все точки собраны
+        if self.collectibles.total == 0:
+            i = 0
+            while i < len(self.exits):
+                exit_x, exit_y = self.exits[i]
+                if self.player.x == exit_x and self.player.y == exit_y:
+                    self.game_won = True
+                    self.victory_animation = 120  # 2 секунды анимации
+                    break
+                i += 1
+
+    def _check_enemy_collision(self):
+        if self.ghosts.find(self.player.x, self.player.y) >= 0:
+            self.game_lost = True
+
+    def update_enemies(self):
+        if self.game_won or self.game_lost:
+            return
+        self.ghosts.update(self.maze, self.player, self.chase_field)
+
+    def update_timers(self):
+        if self.move_timer > 0:
+            self.move_timer -= 1
+
+        if self.screen_flash > 0:
+            self.screen_flash -= 1
+
+        if self.victory_animation > 0:
+            self.victory_animation -= 1
+
+        self.tick_count += 1
+
+
+class Player:
+
+    __slots__ = ('x', 'y', 'direction')
+
+    def __init__(self, x: int, y: int):
+        self.x = x
+        self.y = y
+        self.direction = Direction.RIGHT
+
+    def copy(self) -> 'Player':
+        player = Player(self.x, self.y)
+        player.direction = self.direction
+        return player
+
+
+class GhostStore:
+    # Призраки столбцами: координаты, направление, таймеры и флаги лежат
+    # в типизированных массивах, по 16 байт на призрака.
+    # Ходы планируются колесом таймеров: у всех призраков один общий
+    # счетчик тактов clock, таймер призрака - clock плюс его смещение, а
+    # призрак ходит, когда таймер делится на period. Поэтому каждый
+    # призрак навсегда приписан к одному слоту колеса (clock по модулю
+    # period), и за такт просыпаются только призраки текущего слота - в
+    # порядке номеров, как раньше; генератор расходуется так же.
+    # Режим преследования зависит только от клеток призрака и игрока и
+    # пересчитывается, только когда одна из них сменилась.
+
+    def __init__(self, rng=None):
+        self.x = array('i')
+        self.y = array('i')
+        self.color = array('B')
+        self.direction = array('B')
+        self.timer_base = array('i')  # Таймер призрака минус clock
+        self.stuck_timer = array('B')
+        self.chase = array('B')
+        # Источник случайности для блуждания (по умолчанию - модуль random)
+        self.rng = rng if rng is not None else random
+        self.views = GhostList(self)
+        self.clock = 0
+        self.period = ENEMY_MOVE_PERIOD
+        # Колесо: слот -> номера призраков этого слота по возрастанию
+        self.wheel = {}
+        # Призраки, сменившие клетку после пересчета режима преследования
+        self.stale = []
+        self.player_cell = None  # Клетка игрока при последнем пересчете
+        self._vectors = None
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def add(self, x: int, y: int, color: int = 0, timer: int = 0) -> int:
+        # Виды NumPy держат буферы массивов, их нужно отпустить до роста
+        self._vectors = None
+        self.x.append(x)
+        self.y.append(y)
+        self.color.append(color)
+        self.direction.append(DIRECTION_INDEX[Direction.RIGHT])
+        self.timer_base.append(timer - self.clock)
+        self.stuck_timer.append(0)
+        self.chase.append(0)
+        index = len(self.x) - 1
+        self._schedule(index)
+        self.stale.append(index)
+        return index
+
+    def copy(self, rng=None) -> 'GhostStore':
+        store = GhostStore.__new__(GhostStore)
+        store.x = self.x[:]
+        store.y = self.y[:]
+        store.color = self.color[:]
+        store.direction = self.direction[:]
+        store.timer_base = self.timer_base[:]
+        store.stuck_timer = self.stuck_timer[:]
+        store.chase = self.chase[:]
+        store.rng = rng if rng is not None else self.rng
+        store.views = GhostList(store)
+        store.clock = self.clock
+        store.period = self.period
+        store.wheel = {}
+        slots = list(self.wheel)
+        i = 0
+        while i < len(slots):
+            store.wheel[slots[i]] = self.wheel[slots[i]][:]
+            i += 1
+        store.stale = self.stale[:]
+        store.player_cell = self.player_cell
+        store._vectors = None
+        return store
+
+    def get_timer(self, i: int) -> int:
+        return self.timer_base[i] + self.clock
+
+    def set_timer(self, i: int, value: int):
+        # Перенос призрака в слот колеса для нового таймера
+        bucket = self.wheel[self._slot(i)]
+        bucket.remove(i)
+        if not bucket:
+            del self.wheel[self._slot(i)]
+        self.timer_base[i] = value - self.clock
+        self._schedule(i)
+
+    def moved(self, i: int):
+        # Клетку призрака поменяли снаружи (сеть, тесты). Если обновлений
+        # долго нет, список не растет, а сводится к полному пересчету
+        if len(self.stale) >= len(self.x):
+            self.stale = []
+            self.player_cell = None
+        else:
+            self.stale.append(i)
+
+    def _slot(self, i: int) -> int:
+        # Призрак ходит в такты, где timer_base + clock делится на period
+        return -self.timer_base[i] % self.period
+
+    def _schedule(self, i: int):
+        slot = self._slot(i)
+        bucket = self.wheel.get(slot)
+        if bucket is None:
+            self.wheel[slot] = [i]
+        else:
+            bisect.insort(bucket, i)
+
+    def _vectorized(self):
+        if self._vectors is None:
+            import numpy as np
+
+            self._vectors = (
+                np,
+                np.frombuffer(self.x, dtype=np.intc),
+                np.frombuffer(self.y, dtype=np.intc),
+                np.frombuffer(self.chase, dtype=np.bool_),
+            )
+        return self._vectors
+
+    def find(self, x: int, y: int) -> int:
+        # Номер призрака в клетке или -1
+        count = len(self.x)
+        if count >= VECTOR_GHOSTS:
+            np, xs, ys, _ = self._vectorized()
+            hits = np.flatnonzero((xs == x) & (ys == y))
+            return int(hits[0]) if len(hits) else -1
+        xs = self.x
+        ys = self.y
+        i = 0
+        while i < count:
+            if xs[i] == x and ys[i] == y:
+                return i
+            i += 1
+        return -1
+
+    def within(self, first_x: int, first_y: int, last_x: int,
+               last_y: int) -> list:
+        # Номера призраков внутри прямоугольника клеток (включительно)
+        count = len(self.x)
+        if count >= VECTOR_GHOSTS:
+            np, xs, ys, _ = self._vectorized()
+            inside = (xs >= first_x) & (xs <= last_x)
+            inside &= (ys >= first_y) & (ys <= last_y)
+            return np.flatnonzero(inside).tolist()
+        xs = self.x
+        ys = self.y
+        result = []
+        i = 0
+        while i < count:
+            if (first_x <= xs[i] <= last_x and
+                    first_y <= ys[i] <= last_y):
+                result.append(i)
+            i += 1
+        return result
+
+    def update(self, maze: Maze, player, distance_field=None):
+        # Режим преследования: всем, если игрок сменил клетку, иначе
+        # только призракам, сменившим клетку с прошлого пересчета
+        cell = (player.x, player.y)
+        if cell != self.player_cell:
+            self.player_cell = cell
+            self._update_chase_all(player.x, player.y)
+            self.stale = []
+        elif self.stale:
+            self._update_chase(self.stale, player.x, player.y)
+            self.stale = []
+
+        # Двигаются только призраки текущего слота колеса
+        self.clock += 1
+        movers = self.wheel.get(self.clock % self.period)
+        if movers is None:
+            return
+        i = 0
+        while i < len(movers):
+            self._move(movers[i], maze, player, distance_field)
+            i += 1
+        self.stale = movers[:]
+
+    def _update_chase_all(self, px: int, py: int):
+        count = len(self.x)
+        if count >= VECTOR_GHOSTS:
+            np, xs, ys, chase = self._vectorized()
+            distance = np.abs(xs - px)
+            distance += np.abs(ys - py)
+            np.less_equal(distance, CHASE_DISTANCE, out=chase)
+            return
+        xs = self.x
+        ys = self.y
+        chase = self.chase
+        limit = CHASE_DISTANCE
+        i = 0
+        while i < count:
+            chase[i] = abs(xs[i] - px) + abs(ys[i] - py) <= limit
+            i += 1
+
+    def _update_chase(self, ghosts: List[int], px: int, py: int):
+        xs = self.x
+        ys = self.y
+        chase = self.chase
+        limit = CHASE_DISTANCE
+        i = 0
+        while i < len(ghosts):
+            g = ghosts[i]
+            chase[g] = abs(xs[g] - px) + abs(ys[g] - py) <= limit
+            i += 1
+
+    def _move(self, i: int, maze: Maze, player, distance_field=None):
+        old_x = self.x[i]
+        old_y = self.y[i]
+
+        # Решения - только в узлах графа развилок: в клетке коридора
+        # призрак идет дальше, не глядя ни на игрока, ни на генератор
+        cell = maze.index(old_x, old_y)
+        forward = -1
+        if maze.junctions.edge[cell] != NO_NODE:
+            forward = CORRIDOR_EXITS[maze.open_dirs[cell] * 4 +
+                                     self.direction[i]]
+        if forward >= 0:
+            self._step(i, forward)
+        elif self.chase[i]:
+            self._chase_player(i, maze, player, distance_field)
+        else:
+            self._wander(i, maze)
+
+        # Проверка на застревание
+        if old_x == self.x[i] and old_y == self.y[i]:
+            self.stuck_timer[i] += 1
+            if self.stuck_timer[i] > 2:
+                self._force_move(i, maze)
+                self.stuck_timer[i] = 0
+        else:
+            self.stuck_timer[i] = 0
+
+    def _step(self, i: int, direction: int):
+        self.x[i] += DIRECTION_DX[direction]
+        self.y[i] += DIRECTION_DY[direction]
+        self.direction[i] = direction
+
+    def _chase_player(self, i: int, maze: Maze, player,
+                      distance_field=None):
+        # С полем расстояний идем по кратчайшему пути через лабиринт,
+        # иначе (или если игрок недостижим) - жадно по прямой.
+        # Вызывается в узле графа (или если направление призрака не
+        # ведет по коридору), расстояния тоже берутся из графа
+        x = self.x[i]
+        y = self.y[i]
+        if distance_field is not None:
+            distance_field.update(player.x, player.y)
+            if distance_field.get(x, y) == UNREACHABLE:
+                distance_field = None
+
+        cell = maze.index(x, y)
+        options = OPEN_DIRECTIONS[maze.open_dirs[cell]]
+        best_direction = -1
+        min_distance = float('inf')
+
+        j = 0
+        while j < len(options):
+            direction = options[j]
+            if distance_field is not None:
+                distance = distance_field.cell_distance(
+                    maze.neighbors[cell * 4 + direction])
+            else:
+                new_x = x + DIRECTION_DX[direction]
+                new_y = y + DIRECTION_DY[direction]
+                distance = abs(new_x - player.x) + abs(new_y - player.y)
+            if distance < min_distance:
+                min_distance = distance
+                best_direction = direction
+            j += 1
+
+        if best_direction >= 0:
+            self._step(i, best_direction)
+
+    def _wander(self, i: int, maze: Maze):
+        open_dirs = maze.open_dirs[maze.index(self.x[i], self.y[i])]
+        current = self.direction[i]
+
+        # Пробуем продолжить в текущем направлении
+        if open_dirs >> current & 1:
+            # 70% шанс продолжить прямо
+            if self.rng.random() < 0.7:
+                self.x[i] += DIRECTION_DX[current]
+                self.y[i] += DIRECTION_DY[current]
+                return
+
+        # Иначе выбираем случайное направление
+        options = OPEN_DIRECTIONS[open_dirs]
+        if options:
+            self._step(i, options[self.rng.randint(0, len(options) - 1)])
+
+    def _force_move(self, i: int, maze: Maze):
+        # Первое открытое направление по порядку
+        options = OPEN_DIRECTIONS[maze.open_dirs[maze.index(self.x[i],
+                                                            self.y[i])]]
+        if options:
+            self._step(i, options[0])
+
+
+class GhostList:
+    # Список призраков в прежнем виде: len(), [i] и перебор дают объекты
+    # Enemy - легкие виды на строку хранилища, создаваемые по запросу
+
+    def __init__(self, store: GhostStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store.x)
+
+    def __getitem__(self, index):
+        count = len(self.store.x)
+        if isinstance(index, slice):
+            result = []
+            positions = range(*index.indices(count))
+            i = 0
+            while i < len(positions):
+                result.append(Enemy(self.store, positions[i]))
+                i += 1
+            return result
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError("Нет призрака с таким номером")
+        return Enemy(self.store, index)
+
+
+class Enemy:
+    # Вид на одного призрака в GhostStore; своих данных не хранит
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: GhostStore, index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def x(self) -> int:
+        return self.store.x[self.index]
+
+    @x.setter
+    def x(self, value: int):
+        self.store.x[self.index] = value
+        self.store.moved(self.index)
+
+    @property
+    def y(self) -> int:
+        return self.store.y[self.index]
+
+    @y.setter
+    def y(self, value: int):
+        self.store.y[self.index] = value
+        self.store.moved(self.index)
+
+    @property
+    def color(self) -> int:
+        return self.store.color[self.index]
+
+    @property
+    def direction(self) -> Direction:
+        return DIRECTIONS[self.store.direction[self.index]]
+
+    @direction.setter
+    def direction(self, value: Direction):
+        self.store.direction[self.index] = DIRECTION_INDEX[value]
+
+    @property
+    def timer(self) -> int:
+        return self.store.get_timer(self.index)
+
+    @timer.setter
+    def timer(self, value: int):
+        self.store.set_timer(self.index, value)
+
+    @property
+    def stuck_timer(self) -> int:
+        return self.store.stuck_timer[self.index]
+
+    @stuck_timer.setter
+    def stuck_timer(self, value: int):
+        self.store.stuck_timer[self.index] = value
+
+    @property
+    def chase_mode(self) -> bool:
+        return bool(self.store.chase[self.index])
+
+    @chase_mode.setter
+    def chase_mode(self, value: bool):
+        self.store.chase[self.index] = bool(value)
+
+    @property
+    def rng(self):
+        return self.store.rng
@@ -0,0 +1,263 @@
+import random
+import struct
+from array import array
+from typing import BinaryIO
+
+from simulation import (BIG_DOT_CELL, DIRECTION_INDEX, DIRECTIONS, DOT_CELL,
+                        DotStore, GhostStore, JunctionField, Maze, Player,
+                        Simulation)
+
+
+# Снимок состояния: заголовок и поля фиксированного размера через struct,
+# переменные части (карта, точки, призраки, состояние генератора) -
+# готовыми байтовыми массивами без поэлементного кодирования
+SNAPSHOT_MAGIC = b'PMSS'
+SNAPSHOT_VERSION = 1
+
+NO_DIRECTION = -1
+
+SEED_NONE = 0
+SEED_INT = 1
+SEED_STR = 2
+
+FLAG_WON = 1
+FLAG_LOST = 2
+FLAG_PLAYER = 4
+FLAG_GAUSS = 8
+
+_HEADER = struct.Struct('<4sB')
+_STATE = struct.Struct('<HHIQqqqqqBbbiibIIIHHIB')
+_ENEMY = struct.Struct('<iiBbqqB')
+_GAUSS = struct.Struct('<d')
+_RNG_WORDS = 625  # Размер состояния Mersenne Twister вместе с позицией
+
+# Последний скомпилированный лабиринт по размерам и байтам карты: откаты
+# и ветвления восстанавливают снимки одной карты, и лабиринт не строится
+# заново
+_maze_cache = {'key': None, 'maze': None}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _direction_code(direction) -> int:
+    if direction is None:
+        return NO_DIRECTION
+    return DIRECTION_INDEX[direction]
+
+
+def _direction(code: int):
+    if code == NO_DIRECTION:
+        return None
+    return DIRECTIONS[code]
+
+
+def dumps(sim: Simulation) -> bytes:
+    flags = 0
+    if sim.game_won:
+        flags |= FLAG_WON
+    if sim.game_lost:
+        flags |= FLAG_LOST
+    player = sim.player
+    if player is not None:
+        flags |= FLAG_PLAYER
+    rng_version, rng_words, gauss_next = sim.rng.getstate()
+    if gauss_next is not None:
+        flags |= FLAG_GAUSS
+
+    if sim.seed is None:
+        seed_kind = SEED_NONE
+        seed_bytes = b''
+    else:
+        seed_kind = SEED_INT if isinstance(sim.seed, int) else SEED_STR
+        seed_bytes = str(sim.seed).encode('utf-8')
+
+    # Строки карты бывают разной длины, поэтому храним длины отдельно
+    rows = sim.game_map
+    row_lengths = array('H')
+    row_bytes = []
+    i = 0
+    while i < len(rows):
+        row_lengths.append(len(rows[i]))
+        row_bytes.append(''.join(rows[i]).encode('ascii'))
+        i += 1
+
+    exits = array('i')
+    i = 0
+    while i < len(sim.exits):
+        exits.append(sim.exits[i][0])
+        exits.append(sim.exits[i][1])
+        i += 1
+
+    ghosts = sim.ghosts
+    enemies = []
+    i = 0
+    while i < len(ghosts):
+        enemies.append(_ENEMY.pack(
+            ghosts.x[i], ghosts.y[i], ghosts.color[i], ghosts.direction[i],
+            ghosts.get_timer(i), ghosts.stuck_timer[i], ghosts.chase[i]))
+        i += 1
+
+    store = sim.collectibles
+    parts = [
+        _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION),
+        _STATE.pack(
+            sim.map_width, sim.map_height, sim.map_version, sim.tick_count,
+            sim.score, sim.moves_count, sim.move_timer, sim.screen_flash,
+            sim.victory_animation, flags,
+            _direction_code(sim.last_direction),
+            _direction_code(sim.pending_direction),
+            player.x if player else 0, player.y if player else 0,
+            _direction_code(player.direction if player else None),
+            len(rows), len(sim.exits), len(sim.enemies),
+            store.width, store.height, len(seed_bytes), seed_kind),
+        seed_bytes,
+        row_lengths.tobytes(),
+        b''.join(row_bytes),
+        bytes(store.cells),
+        exits.tobytes(),
+        b''.join(enemies),
+        struct.pack('<B', rng_version),
+        array('I', rng_words).tobytes(),
+        _GAUSS.pack(gauss_next if gauss_next is not None else 0.0),
+    ]
+    return b''.join(parts)
+
+
+def loads(data: bytes) -> Simulation:
+    view = memoryview(data)
+    if len(data) < _HEADER.size + _STATE.size:
+        raise SnapshotError("Снимок слишком короткий")
+    magic, version = _HEADER.unpack_from(view, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Это не снимок партии Pacman")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Неизвестная версия снимка: {version}")
+    position = _HEADER.size
+
+    (map_width, map_height, map_version, tick_count, score, moves_count,
+     move_timer, screen_flash, victory_animation, flags, last_direction,
+     pending_direction, player_x, player_y, player_direction, row_count,
+     exit_count, enemy_count, store_width, store_height, seed_length,
+     seed_kind) = _STATE.unpack_from(view, position)
+    position += _STATE.size
+
+    sim = Simulation.__new__(Simulation)
+    sim.map_width = map_width
+    sim.map_height = map_height
+
+    seed = bytes(view[position:position + seed_length]).decode('utf-8')
+    position += seed_length
+    if seed_kind == SEED_NONE:
+        sim.seed = None
+    elif seed_kind == SEED_INT:
+        sim.seed = int(seed)
+    else:
+        sim.seed = seed
+
+    map_start = position
+    row_lengths = array('H')
+    row_lengths.frombytes(view[position:position + row_count * 2])
+    position += row_count * 2
+    sim.game_map = []
+    i = 0
+    while i < row_count:
+        length = row_lengths[i]
+        sim.game_map.append(
+            list(bytes(view[position:position + length]).decode('ascii')))
+        position += length
+        i += 1
+    sim.map_version = map_version
+    # Лабиринт строится по строкам и заявленным размерам карты
+    map_key = (map_width, map_height, bytes(view[map_start:position]))
+
+    store = DotStore(store_width, store_height)
+    size = store_width * store_height
+    store.cells[:] = view[position:position + size]
+    position += size
+    store.dot_count = store.cells.count(DOT_CELL)
+    store.big_dot_count = store.cells.count(BIG_DOT_CELL)
+    sim.collectibles = store
+
+    exits = array('i')
+    exits.frombytes(view[position:position + exit_count * 8])
+    position += exit_count * 8
+    sim.exits = []
+    i = 0
+    while i < exit_count:
+        sim.exits.append((exits[i * 2], exits[i * 2 + 1]))
+        i += 1
+
+    ghosts = GhostStore()
+    i = 0
+    while i < enemy_count:
+        (x, y, color, direction, timer, stuck_timer,
+         chase_mode) = _ENEMY.unpack_from(view, position)
+        position += _ENEMY.size
+        index = ghosts.add(x, y, color, timer)
+        ghosts.direction[index] = direction
+        ghosts.stuck_timer[index] = stuck_timer
+        ghosts.chase[index] = chase_mode
+        i += 1
+
+    rng_version = view[position]
+    position += 1
+    rng_words = array('I')
+    rng_words.frombytes(view[position:position + _RNG_WORDS * 4])
+    position += _RNG_WORDS * 4
+    gauss_next = None
+    if flags & FLAG_GAUSS:
+        gauss_next = _GAUSS.unpack_from(view, position)[0]
+    position += _GAUSS.size
+    if position != len(data):
+        raise SnapshotError("Размер снимка не совпадает с содержимым")
+
+    # Призраки делят генератор партии, как и при обычном создании
+    sim.rng = random.Random()
+    sim.rng.setstate((rng_version, tuple(rng_words), gauss_next))
+    ghosts.rng = sim.rng
+    sim.ghosts = ghosts
+
+    sim.moves_count = moves_count
+    sim.score = score
+    sim.game_won = bool(flags & FLAG_WON)
+    sim.game_lost = bool(flags & FLAG_LOST)
+    sim.tick_count = tick_count
+
+    sim.player = None
+    if flags & FLAG_PLAYER:
+        sim.player = Player(player_x, player_y)
+        sim.player.direction = _direction(player_direction)
+
+    sim.move_timer = move_timer
+    sim.last_direction = _direction(last_direction)
+    sim.pending_direction = _direction(pending_direction)
+    sim.screen_flash = screen_flash
+    sim.victory_animation = victory_animation
+
+    if _maze_cache['key'] != map_key:
+        _maze_cache['maze'] = Maze(sim.game_map, map_width, map_height)
+        _maze_cache['key'] = map_key
+    sim.maze = _maze_cache['maze']
+    sim.chase_field = JunctionField(sim.maze)
+    return sim
+
+
+def dump(sim: Simulation, handle: BinaryIO):
+    # Файл или буфер в памяти (io.BytesIO) - любой объект с write()
+    handle.write(dumps(sim))
+
+
+def load(handle: BinaryIO) -> Simulation:
+    return loads(handle.read())
+
+
+def save(sim: Simulation, path: str):
+    with open(path, 'wb') as handle:
+        dump(sim, handle)
+
+
+def restore(path: str) -> Simulation:
+    with open(path, 'rb') as handle:
+        return load(handle)